@@ -142,6 +142,9 @@ class PostProcessor(object):
             logger.fdebug("nzb folder: " + str(self.nzb_folder))
             if mylar.USE_SABNZBD==0:
                 logger.fdebug("Not using SABNzbd")
+            elif self.nzb_name == 'Manual Run':
+                #the folder's been given - there's no SAB job behind it.
+                logger.fdebug("Manual Run - not checking with SABnzbd")
             else:
                 # if the SAB Directory option is enabled, let's use that folder name and append the jobname.
                 if mylar.SAB_DIRECTORY is not None and mylar.SAB_DIRECTORY is not 'None' and len(mylar.SAB_DIRECTORY) > 4:
@@ -180,19 +183,18 @@ class PostProcessor(object):
                 #once a series name and issue are matched,
                 #write the series/issue/filename to a tuple
                 #when all done, iterate over the tuple until completion...
-                comicseries = myDB.action("SELECT * FROM comics")
+                comicseries = myDB.select("SELECT * FROM comics")
                 manual_list = []
-                if comicseries is None: 
+                if not comicseries: 
                     logger.error(u"No Series in Watchlist - aborting Manual Post Processing. Maybe you should be running Import?")
                     return
                 else:
                     ccnt=0
                     nm=0
-                    watchvals = {}
+                    #one pass over the folder for the entire watchlist.
+                    watchmatches = filechecker.listWatchlist(self.nzb_folder, comicseries)
                     for cs in comicseries:
-                        watchvals = {"SeriesYear":   cs['ComicYear'],
-                                     "Total":        cs['Total']}
-                        watchmatch = filechecker.listFiles(self.nzb_folder,cs['ComicName'],cs['AlternateSearch'], manual=watchvals)
+                        watchmatch = watchmatches.get(cs['ComicID'])
                         if watchmatch is None:
                             nm+=1
                             pass
@@ -83,6 +83,9 @@ LATEST_VERSION = None
 COMMITS_BEHIND = None
 USER_AGENT = None
 SEARCH_DELAY = 1
+SEARCH_THREADS = 3
+SEARCH_BATCH = 1
+RATE_LIMITS = None
 
 CHECK_GITHUB = False
 CHECK_GITHUB_ON_STARTUP = False
@@ -103,7 +106,11 @@ IMP_METADATA = False
 SEARCH_INTERVAL = 360
 NZB_STARTUP_SEARCH = False
 LIBRARYSCAN_INTERVAL = 300
+LIBRARYSCAN_THREADS = 4
 DOWNLOAD_SCAN_INTERVAL = 5
+FOLDER_WATCH = False
+FOLDER_WATCH_DIR = None
+FOLDER_WATCH_DELAY = 60
 INTERFACE = None
 
 PREFERRED_QUALITY = None
@@ -219,6 +226,11 @@ READ2FILENAME = 0
 STORYARCDIR = 0
 CVAPIFIX = 0
 CVURL = None
+CV_THREADS = 2
+CV_CACHE = 1
+CV_CACHE_TTL = None
+CV_INCREMENTAL = 1
+REFRESH_INTERVALS = None
 WEEKFOLDER = 0
 LOCMOVE = 0
 NEWCOM_DIR = None
@@ -234,6 +246,9 @@ CMTAGGER_PATH = None
 ENABLE_RSS = 0
 RSS_CHECKINTERVAL = 20
 RSS_LASTRUN = None
+RSS_MAXAGE = 30
+RSS_MAXROWS = 2000
+RSS_PRUNEINTERVAL = 24
 
 ENABLE_TORRENTS = 0
 TORRENT_LOCAL = 0
@@ -252,6 +267,40 @@ CBT_PASSKEY = None
 
 
 
+#indexes added by the version 1 database update (see dbcheck).
+DB_INDEXES = ['CREATE UNIQUE INDEX IF NOT EXISTS issues_issueid ON issues (IssueID)',
+              'CREATE INDEX IF NOT EXISTS issues_comicid ON issues (ComicID, Issue_Number)',
+              'CREATE INDEX IF NOT EXISTS issues_status ON issues (Status, ComicID)',
+              'CREATE UNIQUE INDEX IF NOT EXISTS annuals_issueid ON annuals (IssueID)',
+              'CREATE INDEX IF NOT EXISTS annuals_comicid ON annuals (ComicID, Issue_Number)',
+              'CREATE INDEX IF NOT EXISTS annuals_status ON annuals (Status, ComicID)',
+              'CREATE INDEX IF NOT EXISTS snatched_issueid ON snatched (IssueID)',
+              'CREATE INDEX IF NOT EXISTS nzblog_issueid ON nzblog (IssueID)',
+              'CREATE INDEX IF NOT EXISTS nzblog_nzbname ON nzblog (NZBName)',
+              'CREATE INDEX IF NOT EXISTS upcoming_comicid ON upcoming (ComicID)',
+              'CREATE INDEX IF NOT EXISTS weekly_comic ON weekly (COMIC, ISSUE)',
+              'CREATE INDEX IF NOT EXISTS readinglist_storyarcid ON readinglist (StoryArcID)',
+              'CREATE INDEX IF NOT EXISTS readinglist_issuearcid ON readinglist (IssueArcID)',
+              'CREATE INDEX IF NOT EXISTS rssdb_site ON rssdb (Site)']
+
+#the queries that get run the most - dbindexcheck makes sure each one of these can use an index.
+DB_HOTQUERIES = ['SELECT * FROM comics WHERE ComicID=?',
+                 'SELECT * FROM issues WHERE ComicID=?',
+                 'SELECT * FROM issues WHERE IssueID=?',
+                 'SELECT * FROM issues WHERE ComicID=? AND Issue_Number=?',
+                 'SELECT * FROM issues WHERE Status="Wanted"',
+                 'SELECT * FROM annuals WHERE ComicID=?',
+                 'SELECT * FROM annuals WHERE IssueID=?',
+                 'SELECT * FROM annuals WHERE Status="Wanted"',
+                 'SELECT * FROM snatched WHERE IssueID=?',
+                 'SELECT * FROM nzblog WHERE IssueID=?',
+                 'SELECT * FROM weekly WHERE COMIC=? AND ISSUE=?',
+                 'SELECT * FROM readinglist WHERE StoryArcID=?',
+                 'SELECT * FROM rssdb WHERE Site=?']
+
+#set by dbcheck when the sqlite build has FTS5 and the rssdb_fts title index is in place.
+RSSDB_FTS = False
+
 def CheckSection(sec):
     """ Check if INI section exists, if not create it """
     try:
@@ -306,15 +355,15 @@ def initialize():
                 HTTP_PORT, HTTP_HOST, HTTP_USERNAME, HTTP_PASSWORD, HTTP_ROOT, LAUNCH_BROWSER, GIT_PATH, \
                 CURRENT_VERSION, LATEST_VERSION, CHECK_GITHUB, CHECK_GITHUB_ON_STARTUP, CHECK_GITHUB_INTERVAL, USER_AGENT, DESTINATION_DIR, \
                 DOWNLOAD_DIR, USENET_RETENTION, SEARCH_INTERVAL, NZB_STARTUP_SEARCH, INTERFACE, AUTOWANT_ALL, AUTOWANT_UPCOMING, ZERO_LEVEL, ZERO_LEVEL_N, COMIC_COVER_LOCAL, HIGHCOUNT, \
-                LIBRARYSCAN, LIBRARYSCAN_INTERVAL, DOWNLOAD_SCAN_INTERVAL, USE_SABNZBD, SAB_HOST, SAB_USERNAME, SAB_PASSWORD, SAB_APIKEY, SAB_CATEGORY, SAB_PRIORITY, SAB_DIRECTORY, BLACKHOLE, BLACKHOLE_DIR, ADD_COMICS, COMIC_DIR, IMP_MOVE, IMP_RENAME, IMP_METADATA, \
+                LIBRARYSCAN, LIBRARYSCAN_INTERVAL, LIBRARYSCAN_THREADS, DOWNLOAD_SCAN_INTERVAL, FOLDER_WATCH, FOLDER_WATCH_DIR, FOLDER_WATCH_DELAY, USE_SABNZBD, SAB_HOST, SAB_USERNAME, SAB_PASSWORD, SAB_APIKEY, SAB_CATEGORY, SAB_PRIORITY, SAB_DIRECTORY, BLACKHOLE, BLACKHOLE_DIR, ADD_COMICS, COMIC_DIR, IMP_MOVE, IMP_RENAME, IMP_METADATA, \
                 USE_NZBGET, NZBGET_HOST, NZBGET_PORT, NZBGET_USERNAME, NZBGET_PASSWORD, NZBGET_CATEGORY, NZBGET_PRIORITY, NZBSU, NZBSU_UID, NZBSU_APIKEY, DOGNZB, DOGNZB_UID, DOGNZB_APIKEY, NZBX,\
                 NEWZNAB, NEWZNAB_NAME, NEWZNAB_HOST, NEWZNAB_APIKEY, NEWZNAB_UID, NEWZNAB_ENABLED, EXTRA_NEWZNABS, NEWZNAB_EXTRA, \
                 RAW, RAW_PROVIDER, RAW_USERNAME, RAW_PASSWORD, RAW_GROUPS, EXPERIMENTAL, \
                 ENABLE_META, CMTAGGER_PATH, INDIE_PUB, BIGGIE_PUB, IGNORE_HAVETOTAL, \
                 ENABLE_TORRENTS, TORRENT_LOCAL, LOCAL_WATCHDIR, TORRENT_SEEDBOX, SEEDBOX_HOST, SEEDBOX_PORT, SEEDBOX_USER, SEEDBOX_PASS, SEEDBOX_WATCHDIR, \
-                ENABLE_RSS, RSS_CHECKINTERVAL, RSS_LASTRUN, ENABLE_TORRENT_SEARCH, ENABLE_KAT, ENABLE_CBT, CBT_PASSKEY, \
+                ENABLE_RSS, RSS_CHECKINTERVAL, RSS_LASTRUN, RSS_MAXAGE, RSS_MAXROWS, RSS_PRUNEINTERVAL, ENABLE_TORRENT_SEARCH, ENABLE_KAT, ENABLE_CBT, CBT_PASSKEY, \
                 PROWL_ENABLED, PROWL_PRIORITY, PROWL_KEYS, PROWL_ONSNATCH, NMA_ENABLED, NMA_APIKEY, NMA_PRIORITY, NMA_ONSNATCH, PUSHOVER_ENABLED, PUSHOVER_PRIORITY, PUSHOVER_APIKEY, PUSHOVER_USERKEY, PUSHOVER_ONSNATCH, LOCMOVE, NEWCOM_DIR, FFTONEWCOM_DIR, \
-                PREFERRED_QUALITY, MOVE_FILES, RENAME_FILES, LOWERCASE_FILENAMES, USE_MINSIZE, MINSIZE, USE_MAXSIZE, MAXSIZE, CORRECT_METADATA, FOLDER_FORMAT, FILE_FORMAT, REPLACE_CHAR, REPLACE_SPACES, ADD_TO_CSV, CVINFO, LOG_LEVEL, POST_PROCESSING, SEARCH_DELAY, GRABBAG_DIR, READ2FILENAME, STORYARCDIR, CVURL, CVAPIFIX, \
+                PREFERRED_QUALITY, MOVE_FILES, RENAME_FILES, LOWERCASE_FILENAMES, USE_MINSIZE, MINSIZE, USE_MAXSIZE, MAXSIZE, CORRECT_METADATA, FOLDER_FORMAT, FILE_FORMAT, REPLACE_CHAR, REPLACE_SPACES, ADD_TO_CSV, CVINFO, LOG_LEVEL, POST_PROCESSING, SEARCH_DELAY, SEARCH_THREADS, SEARCH_BATCH, RATE_LIMITS, GRABBAG_DIR, READ2FILENAME, STORYARCDIR, CVURL, CVAPIFIX, CV_THREADS, CV_CACHE, CV_CACHE_TTL, CV_INCREMENTAL, REFRESH_INTERVALS, \
                 COMIC_LOCATION, QUAL_ALTVERS, QUAL_SCANNER, QUAL_TYPE, QUAL_QUALITY, ENABLE_EXTRA_SCRIPTS, EXTRA_SCRIPTS, ENABLE_PRE_SCRIPTS, PRE_SCRIPTS, PULLNEW, COUNT_ISSUES, COUNT_HAVES, COUNT_COMICS, SYNO_FIX, CHMOD_FILE, CHMOD_DIR, ANNUALS_ON, CV_ONLY, CV_ONETIMER, WEEKFOLDER
                 
         if __INITIALIZED__:
@@ -364,12 +413,21 @@ def initialize():
         NZB_STARTUP_SEARCH = bool(check_setting_int(CFG, 'General', 'nzb_startup_search', 0))
         LIBRARYSCAN = bool(check_setting_int(CFG, 'General', 'libraryscan', 1))
         LIBRARYSCAN_INTERVAL = check_setting_int(CFG, 'General', 'libraryscan_interval', 300)
+        #folders listed at once when walking the comic directory (a NAS answers a few in parallel a lot quicker).
+        LIBRARYSCAN_THREADS = check_setting_int(CFG, 'General', 'libraryscan_threads', 4)
         ADD_COMICS = bool(check_setting_int(CFG, 'General', 'add_comics', 0))
         COMIC_DIR = check_setting_str(CFG, 'General', 'comic_dir', '')
         IMP_MOVE = bool(check_setting_int(CFG, 'General', 'imp_move', 0))
         IMP_RENAME = bool(check_setting_int(CFG, 'General', 'imp_rename', 0))
         IMP_METADATA = bool(check_setting_int(CFG, 'General', 'imp_metadata', 0))
         DOWNLOAD_SCAN_INTERVAL = check_setting_int(CFG, 'General', 'download_scan_interval', 5)
+        #watch the comic directory & download folder (inotify, or polled every download_scan_interval minutes)
+        FOLDER_WATCH = bool(check_setting_int(CFG, 'General', 'folder_watch', 0))
+        #download folder to watch - left blank, only the comic directory is watched (not the SABnzbd directory,
+        #its downloads are already post-processed by the SABnzbd callback).
+        FOLDER_WATCH_DIR = check_setting_str(CFG, 'General', 'folder_watch_dir', '')
+        #seconds a folder has to go without changes before it gets processed.
+        FOLDER_WATCH_DELAY = check_setting_int(CFG, 'General', 'folder_watch_delay', 60)
         INTERFACE = check_setting_str(CFG, 'General', 'interface', 'default')
         AUTOWANT_ALL = bool(check_setting_int(CFG, 'General', 'autowant_all', 0))
         AUTOWANT_UPCOMING = bool(check_setting_int(CFG, 'General', 'autowant_upcoming', 1))
@@ -390,6 +448,12 @@ def initialize():
         IGNORE_HAVETOTAL = bool(check_setting_int(CFG, 'General', 'ignore_havetotal', 0))
         SYNO_FIX = bool(check_setting_int(CFG, 'General', 'syno_fix', 0))
         SEARCH_DELAY = check_setting_int(CFG, 'General', 'search_delay', 1)
+        #how many providers get searched at the same time.
+        SEARCH_THREADS = check_setting_int(CFG, 'General', 'search_threads', 3)
+        #search the wanted list a series at a time, reusing each provider response for all of the series' issues.
+        SEARCH_BATCH = bool(check_setting_int(CFG, 'General', 'search_batch', 1))
+        #per-provider request budgets (see ratelimit.py) - provider:requests per minute/burst/daily cap;...
+        RATE_LIMITS = check_setting_str(CFG, 'General', 'rate_limits', '')
         GRABBAG_DIR = check_setting_str(CFG, 'General', 'grabbag_dir', '')
         if not GRABBAG_DIR:
             #default to ComicLocation
@@ -398,6 +462,15 @@ def initialize():
         CVAPIFIX = bool(check_setting_int(CFG, 'General', 'cvapifix', 0))
         if CVAPIFIX is None:
             CVAPIFIX = 0
+        #most ComicVine requests allowed in flight at once (paged results get pulled in parallel).
+        CV_THREADS = check_setting_int(CFG, 'General', 'cv_threads', 2)
+        #keep ComicVine responses on disk (CACHE_DIR/cv) - ttl in hours per resource, ie. volume:12;issues:12;search:24
+        CV_CACHE = bool(check_setting_int(CFG, 'General', 'cv_cache', 1))
+        CV_CACHE_TTL = check_setting_str(CFG, 'General', 'cv_cache_ttl', '')
+        #scheduled refreshes only pull down what's changed on CV since the series was last refreshed.
+        CV_INCREMENTAL = bool(check_setting_int(CFG, 'General', 'cv_incremental', 1))
+        #hours between refreshes of ongoing / recently ended / long ended series, ie. ongoing:24;recent:168;ended:720
+        REFRESH_INTERVALS = check_setting_str(CFG, 'General', 'refresh_intervals', '')
         LOCMOVE = bool(check_setting_int(CFG, 'General', 'locmove', 0))
         if LOCMOVE is None:
             LOCMOVE = 0
@@ -459,6 +532,10 @@ def initialize():
         ENABLE_RSS = bool(check_setting_int(CFG, 'General', 'enable_rss', 1))
         RSS_CHECKINTERVAL = check_setting_str(CFG, 'General', 'rss_checkinterval', '20')
         RSS_LASTRUN = check_setting_str(CFG, 'General', 'rss_lastrun', '')
+        #rssdb retention - entries older than rss_maxage days / beyond rss_maxrows per site get pruned (0 = keep).
+        RSS_MAXAGE = check_setting_int(CFG, 'General', 'rss_maxage', 30)
+        RSS_MAXROWS = check_setting_int(CFG, 'General', 'rss_maxrows', 2000)
+        RSS_PRUNEINTERVAL = check_setting_int(CFG, 'General', 'rss_pruneinterval', 24)
 
         ENABLE_TORRENTS = bool(check_setting_int(CFG, 'Torrents', 'enable_torrents', 0))
         TORRENT_LOCAL = bool(check_setting_int(CFG, 'Torrents', 'torrent_local', 0))
@@ -791,6 +868,11 @@ def config_write():
     new_config['General']['cv_only'] = int(CV_ONLY)
     new_config['General']['cv_onetimer'] = int(CV_ONETIMER)
     new_config['General']['cvapifix'] = int(CVAPIFIX)    
+    new_config['General']['cv_threads'] = CV_THREADS
+    new_config['General']['cv_cache'] = int(CV_CACHE)
+    new_config['General']['cv_cache_ttl'] = CV_CACHE_TTL
+    new_config['General']['cv_incremental'] = int(CV_INCREMENTAL)
+    new_config['General']['refresh_intervals'] = REFRESH_INTERVALS
     new_config['General']['check_github'] = int(CHECK_GITHUB)
     new_config['General']['check_github_on_startup'] = int(CHECK_GITHUB_ON_STARTUP)
     new_config['General']['check_github_interval'] = CHECK_GITHUB_INTERVAL
@@ -804,12 +886,16 @@ def config_write():
     new_config['General']['nzb_startup_search'] = int(NZB_STARTUP_SEARCH)
     new_config['General']['libraryscan'] = int(LIBRARYSCAN)
     new_config['General']['libraryscan_interval'] = LIBRARYSCAN_INTERVAL
+    new_config['General']['libraryscan_threads'] = LIBRARYSCAN_THREADS
     new_config['General']['add_comics'] = int(ADD_COMICS)
     new_config['General']['comic_dir'] = COMIC_DIR
     new_config['General']['imp_move'] = int(IMP_MOVE)
     new_config['General']['imp_rename'] = int(IMP_RENAME)
     new_config['General']['imp_metadata'] = int(IMP_METADATA)
     new_config['General']['download_scan_interval'] = DOWNLOAD_SCAN_INTERVAL
+    new_config['General']['folder_watch'] = int(FOLDER_WATCH)
+    new_config['General']['folder_watch_dir'] = FOLDER_WATCH_DIR
+    new_config['General']['folder_watch_delay'] = FOLDER_WATCH_DELAY
     new_config['General']['interface'] = INTERFACE
     new_config['General']['autowant_all'] = int(AUTOWANT_ALL)
     new_config['General']['autowant_upcoming'] = int(AUTOWANT_UPCOMING)
@@ -830,6 +916,9 @@ def config_write():
     new_config['General']['ignore_havetotal'] = int(IGNORE_HAVETOTAL)
     new_config['General']['syno_fix'] = int(SYNO_FIX)
     new_config['General']['search_delay'] = SEARCH_DELAY
+    new_config['General']['search_threads'] = SEARCH_THREADS
+    new_config['General']['search_batch'] = int(SEARCH_BATCH)
+    new_config['General']['rate_limits'] = RATE_LIMITS
     new_config['General']['grabbag_dir'] = GRABBAG_DIR
     new_config['General']['highcount'] = HIGHCOUNT
     new_config['General']['read2filename'] = int(READ2FILENAME)
@@ -858,6 +947,9 @@ def config_write():
     new_config['General']['enable_rss'] = int(ENABLE_RSS)
     new_config['General']['rss_checkinterval'] = RSS_CHECKINTERVAL
     new_config['General']['rss_lastrun'] = RSS_LASTRUN
+    new_config['General']['rss_maxage'] = RSS_MAXAGE
+    new_config['General']['rss_maxrows'] = RSS_MAXROWS
+    new_config['General']['rss_pruneinterval'] = RSS_PRUNEINTERVAL
 
     new_config['Torrents'] = {}
     new_config['Torrents']['enable_torrents'] = int(ENABLE_TORRENTS)
@@ -960,14 +1052,21 @@ def start():
         # Start our scheduled background tasks
         #from mylar import updater, searcher, librarysync, postprocessor
 
-        from mylar import updater, search, weeklypull
+        from mylar import updater, search, weeklypull, cvcache, nameindex, folderwatch
+
+        #series names the rss / import / pull-list matching looks up against.
+        nameindex.build()
 
-        SCHED.add_interval_job(updater.dbUpdate, hours=48)
+        #every hour, refresh whichever series are due (ongoing ones daily, ended ones rarely).
+        SCHED.add_interval_job(updater.dbUpdate, hours=1, kwargs={'due': True})
+        SCHED.add_interval_job(cvcache.prune, hours=24)
         SCHED.add_interval_job(search.searchforissue, minutes=SEARCH_INTERVAL)
 
         #initiate startup rss feeds for torrents/nzbs here...
         if ENABLE_RSS:
             SCHED.add_interval_job(rsscheck.tehMain, minutes=int(RSS_CHECKINTERVAL))
+            #keep the rss cache from growing forever.
+            SCHED.add_interval_job(rsscheck.rssdbprune, hours=max(1, int(RSS_PRUNEINTERVAL)))
 
             logger.info('Initiating startup-RSS feed checks.')
             rsscheck.tehMain()
@@ -990,6 +1089,10 @@ def start():
         
         #SCHED.add_interval_job(postprocessor.checkFolder, minutes=DOWNLOAD_SCAN_INTERVAL)
 
+        #new / moved comics get picked up as they land, instead of re-crawling for them.
+        if FOLDER_WATCH:
+            folderwatch.start()
+
         SCHED.start()
         
         started = True
@@ -1010,7 +1113,9 @@ def dbcheck():
     c.execute('CREATE TABLE IF NOT EXISTS readlist (IssueID TEXT, ComicName TEXT, Issue_Number TEXT, Status TEXT, DateAdded TEXT, Location TEXT, inCacheDir TEXT, SeriesYear TEXT, ComicID TEXT)')
     c.execute('CREATE TABLE IF NOT EXISTS readinglist(StoryArcID TEXT, ComicName TEXT, IssueNumber TEXT, SeriesYear TEXT, IssueYEAR TEXT, StoryArc TEXT, TotalIssues TEXT, Status TEXT, inCacheDir TEXT, Location TEXT, IssueArcID TEXT, ReadingOrder INT, IssueID TEXT)')
     c.execute('CREATE TABLE IF NOT EXISTS annuals (IssueID TEXT, Issue_Number TEXT, IssueName TEXT, IssueDate TEXT, Status TEXT, ComicID TEXT, GCDComicID TEXT, Location TEXT, ComicSize TEXT, Int_IssueNumber INT, ComicName TEXT)')
-    c.execute('CREATE TABLE IF NOT EXISTS rssdb (Title TEXT UNIQUE, Link TEXT, Pubdate TEXT, Site TEXT, Size TEXT)')
+    c.execute('CREATE TABLE IF NOT EXISTS rssdb (RSSID INTEGER PRIMARY KEY, Title TEXT UNIQUE, Link TEXT, Pubdate TEXT, Site TEXT, Size TEXT)')
+    c.execute('CREATE TABLE IF NOT EXISTS rssfeeds (Feed TEXT UNIQUE, URLHash TEXT, ETag TEXT, LastModified TEXT, LastChecked TEXT, LastGUID TEXT, LastPubdate TEXT, Ingested INTEGER, Skipped INTEGER)')
+    c.execute('CREATE TABLE IF NOT EXISTS librarymanifest (ComicLocation TEXT UNIQUE, ComicSize INTEGER, ModTime REAL)')
 
     conn.commit
     c.close
@@ -1193,6 +1298,21 @@ def dbcheck():
     except sqlite3.OperationalError:
         c.execute('ALTER TABLE comics ADD COLUMN not_updated_db TEXT')
 
+    #date_last_updated of the volume on CV as of the last refresh - an incremental refresh only looks
+    #for what's changed since then.
+    try:
+        c.execute('SELECT CV_LastUpdated from comics')
+    except sqlite3.OperationalError:
+        c.execute('ALTER TABLE comics ADD COLUMN CV_LastUpdated TEXT')
+
+    try:
+        c.execute('SELECT LastGUID from rssfeeds')
+    except sqlite3.OperationalError:
+        c.execute('ALTER TABLE rssfeeds ADD COLUMN LastGUID TEXT')
+        c.execute('ALTER TABLE rssfeeds ADD COLUMN LastPubdate TEXT')
+        c.execute('ALTER TABLE rssfeeds ADD COLUMN Ingested INTEGER')
+        c.execute('ALTER TABLE rssfeeds ADD COLUMN Skipped INTEGER')
+
 # -- not implemented just yet ;)
 
     # for metadata...
@@ -1208,6 +1328,48 @@ def dbcheck():
 #    except sqlite3.OperationalError:
 #        c.execute('ALTER TABLE importresults ADD COLUMN MetaData TEXT')
 
+    #versioned schema changes - PRAGMA user_version holds the last one that was applied.
+    dbversion = c.execute('PRAGMA user_version').fetchone()[0]
+
+    if dbversion < 1:
+        logger.info('Updating the database to version 1 (indexes) - one-time update.')
+        #IssueID has to be unique before the constraint can go on - keep the latest row of any duplicates.
+        for table in ['issues', 'annuals']:
+            c.execute('DELETE FROM ' + table + ' WHERE IssueID IS NOT NULL AND rowid NOT IN (SELECT MAX(rowid) FROM ' + table + ' GROUP BY IssueID)')
+        for index in DB_INDEXES:
+            c.execute(index)
+        c.execute('PRAGMA user_version = 1')
+
+    if dbversion < 2:
+        #rssdb_fts and the rss retention key off of the rssdb row number - make it a real column so a VACUUM can't renumber it.
+        try:
+            c.execute('SELECT RSSID FROM rssdb LIMIT 1')
+        except sqlite3.OperationalError:
+            logger.info('Updating the database to version 2 (rssdb key) - one-time update.')
+            c.execute('CREATE TABLE rssdb_new (RSSID INTEGER PRIMARY KEY, Title TEXT UNIQUE, Link TEXT, Pubdate TEXT, Site TEXT, Size TEXT)')
+            c.execute('INSERT INTO rssdb_new (RSSID, Title, Link, Pubdate, Site, Size) SELECT rowid, Title, Link, Pubdate, Site, Size FROM rssdb')
+            c.execute('DROP TABLE rssdb')
+            c.execute('ALTER TABLE rssdb_new RENAME TO rssdb')
+            c.execute('CREATE INDEX IF NOT EXISTS rssdb_site ON rssdb (Site)')
+        c.execute('PRAGMA user_version = 2')
+
+    dbindexcheck(c)
+
+    #full-text index over the rssdb titles - needs an sqlite built with FTS5, otherwise the rss searches stay on LIKE.
+    global RSSDB_FTS
+    try:
+        if c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='rssdb_fts'").fetchone():
+            c.execute('SELECT rowid FROM rssdb_fts LIMIT 1')
+        else:
+            c.execute('CREATE VIRTUAL TABLE rssdb_fts USING fts5(Tokens)')
+            rsstitles = c.execute('SELECT RSSID, Title FROM rssdb').fetchall()
+            c.executemany('INSERT INTO rssdb_fts (rowid, Tokens) VALUES (?, ?)', [(r[0], rsscheck.rsstokens(r[1])) for r in rsstitles])
+            logger.info('Created the RSS full-text index - ' + str(len(rsstitles)) + ' cached titles indexed.')
+        RSSDB_FTS = True
+    except sqlite3.OperationalError, e:
+        logger.info('Full-text search is not available (' + str(e) + ') - RSS searches will use LIKE matching.')
+        RSSDB_FTS = False
+
     #let's delete errant comics that are stranded (ie. Comicname = Comic ID: )
     c.execute("DELETE from COMICS WHERE ComicName='None' OR ComicName LIKE 'Comic ID%' OR ComicName is NULL")
     logger.info('Ensuring DB integrity - Removing all Erroneous Comics (ie. named None)')
@@ -1219,6 +1381,20 @@ def dbcheck():
     conn.commit()
     c.close()
 
+def dbindexcheck(c):
+    #make sure the hot queries are searching an index rather than scanning the whole table.
+    noindex = []
+    for query in DB_HOTQUERIES:
+        plan = c.execute('EXPLAIN QUERY PLAN ' + query, [''] * query.count('?')).fetchall()
+        for step in plan:
+            if str(step[-1]).upper().startswith('SCAN'):
+                logger.warn('Query is not using an index [' + query + '] : ' + str(step[-1]))
+                noindex.append(query)
+                break
+    if not noindex:
+        logger.fdebug('All ' + str(len(DB_HOTQUERIES)) + ' of the frequently run queries are using indexes.')
+    return noindex
+
 def csv_load():
     # for redudant module calls..include this.
     conn=sqlite3.connect(DB_FILE)
@@ -1276,8 +1452,13 @@ def csv_load():
 
 def shutdown(restart=False, update=False):
 
+    from mylar import db, folderwatch
+
     cherrypy.engine.exit()
     SCHED.shutdown(wait=False)
+    if FOLDER_WATCH:
+        folderwatch.stop()
+    db.closeConnections()
     
     config_write()
 
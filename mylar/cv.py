@@ -16,26 +16,33 @@
 import sys
 import os
 import re
+import threading
+import Queue
 import logger
 import string
 import urllib
 import lib.feedparser
 import mylar
+from mylar import cvcache
+try:
+    from xml.etree import cElementTree as ElementTree
+except ImportError:
+    from xml.etree import ElementTree
 from bs4 import BeautifulSoup as Soup
 
-def pulldetails(comicid,type,issueid=None,offset=1):
-    import urllib2
-
-    #import easy to use xml parser called minidom:
-    from xml.dom.minidom import parseString
+def pullurl(comicid,type,issueid=None,offset=1,since=None):
 
     comicapi='583939a3df0a25fc4e8b7a29934a13078002dc27'
     if type == 'comic':
-        PULLURL= mylar.CVURL + 'volume/' + str(comicid) + '/?api_key=' + str(comicapi) + '&format=xml&field_list=name,count_of_issues,issues,start_year,site_detail_url,image,publisher,description,first_issue'
+        PULLURL= mylar.CVURL + 'volume/' + str(comicid) + '/?api_key=' + str(comicapi) + '&format=xml&field_list=name,count_of_issues,issues,start_year,site_detail_url,image,publisher,description,first_issue,date_last_updated'
     elif type == 'issue':
         if mylar.CV_ONLY:
             cv_type = 'issues'
-            searchset = 'filter=volume:' + str(comicid) + '&field_list=cover_date,description,id,image,issue_number,name,date_last_updated,store_date'
+            searchset = 'filter=volume:' + str(comicid)
+            if since is not None:
+                #only the issues that have been changed on CV since then (an incremental refresh).
+                searchset += ',date_last_updated:' + urllib.quote(str(since) + '|2099-12-31 23:59:59')
+            searchset += '&field_list=cover_date,description,id,image,issue_number,name,date_last_updated,store_date'
         else:
             cv_type = 'volume/' + str(comicid)
             searchset = 'name,count_of_issues,issues,start_year,site_detail_url,image,publisher,description'
@@ -46,8 +53,62 @@ def pulldetails(comicid,type,issueid=None,offset=1):
     elif type == 'storyarc':
        PULLURL =  mylar.CVURL + 'story_arc/?api_key=' + str(comicapi) + '&format=xml&filter=id:' + str(issueid) + '&field_list=cover_date'
 
-    #download the file:
-    file = urllib2.urlopen(PULLURL)
+    return PULLURL
+
+#caps the ComicVine requests in flight at once across every caller (taken in cvcache) - sized from CV_THREADS on first use.
+cv_slots = None
+cv_slots_lock = threading.Lock()
+
+def cvslots():
+    global cv_slots
+    cv_slots_lock.acquire()
+    try:
+        if cv_slots is None:
+            cv_slots = threading.BoundedSemaphore(max(1, int(mylar.CV_THREADS)))
+    finally:
+        cv_slots_lock.release()
+    return cv_slots
+
+def pullpages(pull, offsets):
+    #fetch the remaining pages of a result set concurrently (CV_THREADS at a time), once the first
+    #page has said how many there are. Returns {offset: page} - a page that failed is None.
+    pages = {}
+    pending = Queue.Queue()
+    for offset in offsets:
+        pending.put(offset)
+
+    def puller():
+        while True:
+            try:
+                offset = pending.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                pages[offset] = pull(offset)
+            except Exception, e:
+                logger.warn('Error retrieving page ' + str(offset) + ' from ComicVine : ' + str(e))
+                pages[offset] = None
+
+    pullers = []
+    for x in range(min(max(1, int(mylar.CV_THREADS)), len(offsets))):
+        t = threading.Thread(target=puller, name='CV-PAGE-' + str(x))
+        t.start()
+        pullers.append(t)
+    for t in pullers:
+        t.join()
+    return pages
+
+def pulldetails(comicid,type,issueid=None,offset=1,fresh=False):
+    #import easy to use xml parser called minidom:
+    from xml.dom.minidom import parseString
+
+    PULLURL = pullurl(comicid,type,issueid,offset)
+
+    #download the file (or pick it up from the cache):
+    file = cvcache.urlopen(PULLURL,fresh)
+    if file is None:
+        logger.error('ComicVine request limit reached - unable to retrieve ' + str(type) + ' information for ' + str(comicid))
+        return
     #convert to string:
     data = file.read()
     #close file because we dont need it anymore:
@@ -57,8 +118,56 @@ def pulldetails(comicid,type,issueid=None,offset=1):
 
     return dom
 
+def pullissues(comicid,offset=0,since=None,fresh=False):
+    #same as pulldetails(comicid,'issue') but the page is parsed as it streams in - returns
+    #the number_of_total_results and a record for each issue (see GetRecords).
+    file = cvcache.urlopen(pullurl(comicid,'issue',None,offset,since),fresh)
+    if file is None:
+        logger.error('ComicVine request limit reached - unable to retrieve issue information for ' + str(comicid))
+        return
+    try:
+        return GetRecords(file,'issue')
+    finally:
+        file.close()
+
+def GetRecords(source,tag):
+    #single pass over a ComicVine xml response (a file-like, read straight off the connection).
+    #returns number_of_total_results and a flat dict for every <tag> element - child tag -> text, with
+    #nested children as 'parent.child' (ie. 'image.super_url', 'publisher.name'). Each record's
+    #elements get cleared once it's been read, so the page is never held as a whole tree.
+    totalResults = None
+    records = []
+    inrecord = 0
+    for event, elem in ElementTree.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            if elem.tag == tag:
+                inrecord += 1
+            continue
+        if elem.tag == tag:
+            inrecord -= 1
+            record = {}
+            for child in elem:
+                if len(child):
+                    for sub in child:
+                        record.setdefault(child.tag + '.' + sub.tag, elemtext(sub))
+                else:
+                    record[child.tag] = elemtext(child)
+            records.append(record)
+            elem.clear()
+        elif inrecord == 0:
+            if elem.tag == 'number_of_total_results':
+                totalResults = elemtext(elem)
+            elem.clear()
+    return totalResults, records
 
-def getComic(comicid,type,issueid=None):
+def elemtext(elem):
+    #minidom always handed back unicode - keep it that way.
+    if elem.text is None:
+        return None
+    return unicode(elem.text)
+
+def getComic(comicid,type,issueid=None,since=None,fresh=False):
+    #fresh - don't use a cached ComicVine response (see cvcache.urlopen).
     if type == 'issue': 
         offset = 1
         issue = {}
@@ -67,20 +176,24 @@ def getComic(comicid,type,issueid=None):
         comicResults = []
         firstdate = '2099-00-00'
         #let's find out how many results we get from the query...
-        searched = pulldetails(comicid,'issue',None,0)
+        searched = pullissues(comicid,0,since,fresh)
         if searched is None: return False
-        totalResults = searched.getElementsByTagName('number_of_total_results')[0].firstChild.wholeText
+        totalResults, records = searched
         logger.fdebug("there are " + str(totalResults) + " search results...")
         if not totalResults:
             return False
+        #the rest of the pages all get pulled at once now that we know how many there are.
+        pages = pullpages(lambda offsetcount: pullissues(comicid,offsetcount,since,fresh), range(100, int(totalResults), 100))
         countResults = 0
         while (countResults < int(totalResults)):
             logger.fdebug("querying " + str(countResults))
             if countResults > 0:
                 #new api - have to change to page # instead of offset count
                 offsetcount = countResults
-                searched = pulldetails(comicid,'issue',None,offsetcount)
-            issuechoice,tmpdate = GetIssuesInfo(comicid,searched)
+                searched = pages.get(offsetcount)
+                if searched is None: return False
+                records = searched[1]
+            issuechoice,tmpdate = GetIssuesInfo(comicid,records)
             if tmpdate < firstdate:
                 firstdate = tmpdate
             ndic = ndic + issuechoice
@@ -93,10 +206,12 @@ def getComic(comicid,type,issueid=None):
         return issue
 
     elif type == 'comic':
-        dom = pulldetails(comicid,'comic',None,1)
+        dom = pulldetails(comicid,'comic',None,1,fresh)
+        if dom is None: return False
         return GetComicInfo(comicid,dom)
     elif type == 'firstissue': 
-        dom = pulldetails(comicid,'firstissue',issueid,1)
+        dom = pulldetails(comicid,'firstissue',issueid,1,fresh)
+        if dom is None: return False
         return GetFirstIssue(issueid,dom)
 
 def GetComicInfo(comicid,dom):
@@ -173,6 +288,13 @@ def GetComicInfo(comicid,dom):
 
     comic['FirstIssueID'] = dom.getElementsByTagName('id')[0].firstChild.wholeText
 
+    #when the volume record itself was last changed on CV (used to tell if a refresh has anything to do).
+    comic['LastUpdated'] = None
+    for lastupdated in dom.getElementsByTagName('date_last_updated'):
+        if lastupdated.parentNode.nodeName == 'results' and lastupdated.firstChild is not None:
+            comic['LastUpdated'] = lastupdated.firstChild.wholeText
+            break
+
 #    print ("fistIss:" + str(comic['FirstIssueID']))
 #    comicchoice.append({
 #        'ComicName':              comic['ComicName'],
@@ -188,61 +310,36 @@ def GetComicInfo(comicid,dom):
 #    comic['comicchoice'] = comicchoice
     return comic
 
-def GetIssuesInfo(comicid,dom):
-    subtracks = dom.getElementsByTagName('issue')
-    if not mylar.CV_ONLY:
-        cntiss = dom.getElementsByTagName('count_of_issues')[0].firstChild.wholeText
-        logger.fdebug("issues I've counted: " + str(len(subtracks)))
-        logger.fdebug("issues CV says it has: " + str(int(cntiss)))
-
-        if int(len(subtracks)) != int(cntiss):
-            logger.fdebug("CV's count is wrong, I counted different...going with my count for physicals" + str(len(subtracks)))
-            cntiss = len(subtracks) # assume count of issues is wrong, go with ACTUAL physical api count
-        cntiss = int(cntiss)
-        n = cntiss-1
-    else:
-        n = int(len(subtracks))
-    tempissue = {}
+def GetIssuesInfo(comicid,records):
+    #records are the per-issue dicts from GetRecords - one linear pass, no document-wide lookups.
     issuech = []
     firstdate = '2099-00-00'
-    for subtrack in subtracks:
+    for record in records:
+        if record.get('name'):
+            issue_name = record['name']
+        else:
+            issue_name = 'None'
         if not mylar.CV_ONLY:
-            if (dom.getElementsByTagName('name')[n].firstChild) is not None:
-                issue['Issue_Name'] = dom.getElementsByTagName('name')[n].firstChild.wholeText
-            else:
-                issue['Issue_Name'] = 'None'
-
-            issue['Issue_ID'] = dom.getElementsByTagName('id')[n].firstChild.wholeText
-            issue['Issue_Number'] = dom.getElementsByTagName('issue_number')[n].firstChild.wholeText
-            
             issuech.append({
-                'Issue_ID':                issue['Issue_ID'],
-                'Issue_Number':            issue['Issue_Number'],
-                'Issue_Name':              issue['Issue_Name']
+                'Issue_ID':                record.get('id'),
+                'Issue_Number':            record.get('issue_number'),
+                'Issue_Name':              issue_name
                 })
         else:
-            try:
-                tempissue['Issue_Name'] = subtrack.getElementsByTagName('name')[0].firstChild.wholeText
-            except:
-                tempissue['Issue_Name'] = 'None'
-            tempissue['Issue_ID'] = subtrack.getElementsByTagName('id')[0].firstChild.wholeText
-            try:
-                tempissue['CoverDate'] = subtrack.getElementsByTagName('cover_date')[0].firstChild.wholeText
-            except:
-                tempissue['CoverDate'] = '0000-00-00'
-            tempissue['Issue_Number'] = subtrack.getElementsByTagName('issue_number')[0].firstChild.wholeText
+            if record.get('cover_date'):
+                coverdate = record['cover_date']
+            else:
+                coverdate = '0000-00-00'
             issuech.append({
-                'Issue_ID':                tempissue['Issue_ID'],
-                'Issue_Number':            tempissue['Issue_Number'],
-                'Issue_Date':              tempissue['CoverDate'],
-                'Issue_Name':              tempissue['Issue_Name']
+                'Issue_ID':                record.get('id'),
+                'Issue_Number':            record.get('issue_number'),
+                'Issue_Date':              coverdate,
+                'Issue_Name':              issue_name
                 })
 
-            if tempissue['CoverDate'] < firstdate and tempissue['CoverDate'] != '0000-00-00':
-                firstdate = tempissue['CoverDate']
-        n-=1
+            if coverdate < firstdate and coverdate != '0000-00-00':
+                firstdate = coverdate
 
-    #issue['firstdate'] = firstdate
     return issuech, firstdate
 
 def GetFirstIssue(issueid,dom):
@@ -0,0 +1,244 @@
+#  This file is part of Mylar.
+#
+#  Mylar is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Mylar is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Mylar.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import re
+import time
+import glob
+import hashlib
+import tempfile
+import urllib2
+import urlparse
+
+import lib.simplejson as simplejson
+try:
+    from xml.etree import cElementTree as ElementTree
+except ImportError:
+    from xml.etree import ElementTree
+
+import mylar
+from mylar import logger, ratelimit
+
+# On-disk cache of ComicVine responses, shared by cv.py and mb.py.
+#
+# Entries are keyed on the request url with the api_key taken out, and stored under
+# CACHE_DIR/cv as <sha1 of the key>.xml (the response) + <sha1 of the key>.json (when it was
+# fetched, plus the ETag / Last-Modified it came with). A fresh entry is served straight
+# from disk; once it's past the TTL for its resource type it gets revalidated with a
+# conditional request, and a 304 just renews it.
+
+# hours each kind of request stays fresh - CV_CACHE_TTL overrides, ie. volume:12;issues:12;search:24
+DEFAULT_TTLS = {'volume':    12,
+                'issues':    12,
+                'search':    24,
+                'story_arc': 168}
+
+# cached responses older than this many days get removed by prune().
+MAX_AGE = 30
+
+def cacheDir():
+
+    return os.path.join(str(mylar.CACHE_DIR), 'cv')
+
+def cacheKey(url):
+    #the api key isn't part of what's being asked for - leave it out so it can change without emptying the cache.
+    return re.sub('api_key=[^&]*&?', '', url)
+
+def resourceType(url):
+
+    for part in urlparse.urlsplit(url)[2].split('/'):
+        if part in DEFAULT_TTLS:
+            return part
+    return None
+
+def getTTL(resource):
+
+    ttls = dict(DEFAULT_TTLS)
+    if mylar.CV_CACHE_TTL:
+        for ttl in str(mylar.CV_CACHE_TTL).split(';'):
+            if ':' not in ttl:
+                continue
+            name, hours = ttl.split(':', 1)
+            try:
+                ttls[name.strip()] = int(hours)
+            except ValueError:
+                logger.warn('Invalid ComicVine cache ttl given for ' + name.strip() + ' : ' + hours + ' - ignoring.')
+    return ttls.get(resource, 12) * 3600
+
+def loadEntry(path):
+
+    try:
+        f = open(path + '.json', 'r')
+        try:
+            meta = simplejson.load(f)
+        finally:
+            f.close()
+    except (IOError, ValueError):
+        return None
+    if not os.path.isfile(path + '.xml'):
+        return None
+    return meta
+
+def writeFile(path, source):
+    #write to a temp file in the cache folder and rename it into place, so a reader never sees half a file.
+    fd, tmppath = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    f = os.fdopen(fd, 'wb')
+    try:
+        if isinstance(source, basestring):
+            f.write(source)
+        else:
+            while True:
+                chunk = source.read(65536)
+                if not chunk:
+                    break
+                f.write(chunk)
+    finally:
+        f.close()
+    if os.name == 'nt' and os.path.exists(path):
+        os.remove(path)
+    os.rename(tmppath, path)
+
+def statusCode(f):
+    #the status_code of a ComicVine response (1 is OK, anything else is an error - bad api key, rate
+    #limited..). Only reads as far as the status_code, then rewinds the file.
+    try:
+        try:
+            for event, elem in ElementTree.iterparse(f):
+                if elem.tag == 'status_code':
+                    return elem.text
+        except SyntaxError:
+            pass
+        return None
+    finally:
+        f.seek(0)
+
+def urlopen(url, fresh=False):
+    #returns an open file of the response for url - from the cache when it's current, otherwise off
+    #ComicVine (within its rate limit / concurrency budget). None if ComicVine can't be asked right now
+    #and there's nothing cached. With fresh, a cached copy is never used without asking ComicVine first
+    #(ie. a refresh the user asked for). Only OK responses get cached - an error comes back as it is.
+    from mylar import cv
+
+    if not mylar.CV_CACHE:
+        if not ratelimit.wait('comicvine'):
+            return None
+        slots = cv.cvslots()
+        slots.acquire()
+        try:
+            response = urllib2.urlopen(url)
+            try:
+                return tempcopy(response)
+            finally:
+                response.close()
+        finally:
+            slots.release()
+
+    key = cacheKey(url)
+    path = os.path.join(cacheDir(), hashlib.sha1(key).hexdigest())
+    meta = loadEntry(path)
+    if meta is not None and not fresh and time.time() - meta['fetched'] < getTTL(meta.get('resource')):
+        logger.fdebug('Using cached ComicVine response for ' + key)
+        return open(path + '.xml', 'rb')
+
+    if not ratelimit.wait('comicvine'):
+        if meta is not None and not fresh:
+            logger.fdebug('ComicVine request limit reached - using the stale cached response for ' + key)
+            return open(path + '.xml', 'rb')
+        return None
+
+    request = urllib2.Request(url)
+    if meta is not None:
+        if meta.get('etag'):
+            request.add_header('If-None-Match', meta['etag'])
+        if meta.get('last_modified'):
+            request.add_header('If-Modified-Since', meta['last_modified'])
+
+    if not os.path.isdir(cacheDir()):
+        try:
+            os.makedirs(cacheDir())
+        except OSError:
+            pass
+
+    slots = cv.cvslots()
+    slots.acquire()
+    try:
+        try:
+            response = urllib2.urlopen(request)
+        except urllib2.HTTPError, e:
+            if e.code == 304 and meta is not None:
+                logger.fdebug('ComicVine response unchanged - renewing the cached copy of ' + key)
+                meta['fetched'] = time.time()
+                writeFile(path + '.json', simplejson.dumps(meta))
+                return open(path + '.xml', 'rb')
+            raise
+        try:
+            body = tempcopy(response)
+            headers = response.info()
+        finally:
+            response.close()
+    finally:
+        slots.release()
+
+    status = statusCode(body)
+    if status != '1':
+        logger.warn('ComicVine returned an error (status_code ' + str(status) + ') for ' + key + ' - not caching it.')
+        return body
+    try:
+        writeFile(path + '.xml', body)
+    finally:
+        body.close()
+    meta = {'url':           key,
+            'resource':      resourceType(url),
+            'fetched':       time.time(),
+            'etag':          headers.getheader('ETag'),
+            'last_modified': headers.getheader('Last-Modified')}
+    writeFile(path + '.json', simplejson.dumps(meta))
+
+    return open(path + '.xml', 'rb')
+
+def tempcopy(response):
+    #spool a response to an anonymous temp file - keeps the parse off the socket without holding it all in memory.
+    f = tempfile.TemporaryFile()
+    while True:
+        chunk = response.read(65536)
+        if not chunk:
+            break
+        f.write(chunk)
+    f.seek(0)
+    return f
+
+def prune():
+    #drop the cached responses that haven't been fetched / revalidated in MAX_AGE days.
+    removed = 0
+    cutoff = time.time() - (MAX_AGE * 86400)
+    for metafile in glob.glob(os.path.join(cacheDir(), '*.json')):
+        path = metafile[:-5]
+        meta = loadEntry(path)
+        if meta is not None and meta['fetched'] >= cutoff:
+            continue
+        for stale in (path + '.json', path + '.xml'):
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+        removed += 1
+    for tmpfile in glob.glob(os.path.join(cacheDir(), '*.tmp')):
+        if os.path.getmtime(tmpfile) < cutoff:
+            try:
+                os.remove(tmpfile)
+            except OSError:
+                pass
+    logger.fdebug('Removed ' + str(removed) + ' expired ComicVine responses from the cache.')
+    return removed
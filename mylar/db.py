@@ -23,59 +23,148 @@ import os
 import sqlite3
 import threading
 import time
+from contextlib import contextmanager
 
 import mylar
 
 from mylar import logger
 
-db_lock = threading.Lock()
+#re-entrant so a transaction() can hold it across the actions it wraps.
+db_lock = threading.RLock()
+
+# each thread keeps its own open connection per database file, so the
+# search / rss / pull-list threads and the cherrypy workers stop opening a
+# brand new connection for every DBConnection() they create.
+_local = threading.local()
+
+# statements that only read - these run without taking db_lock.
+READ_ONLY = ('SELECT', 'PRAGMA', 'EXPLAIN')
+
+# INSERT ... ON CONFLICT DO UPDATE needs sqlite 3.24.0 or newer.
+UPSERT_SUPPORTED = sqlite3.sqlite_version_info >= (3, 24, 0)
+
+# tablename -> list of column-sets that have a UNIQUE index on them.
+_unique_keys = {}
 
 def dbFilename(filename="mylar.db"):
 
     return os.path.join(mylar.DATA_DIR, filename)
 
+def getConnection(filename="mylar.db"):
+
+    pool = getattr(_local, 'connections', None)
+    if pool is None:
+        pool = _local.connections = {}
+
+    dbfile = dbFilename(filename)
+    connection = pool.get(dbfile)
+    if connection is None:
+        connection = sqlite3.connect(dbfile, timeout=20)
+        connection.row_factory = sqlite3.Row
+        #WAL lets the readers carry on while a writer is busy - it's persistent
+        #on the db file, so after the first connection this is a no-op.
+        try:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+        except sqlite3.DatabaseError, e:
+            logger.warn('Unable to enable WAL journaling on %s: %s' % (dbfile, e))
+        pool[dbfile] = connection
+    return connection
+
+def closeConnections():
+    # close the connections held by the calling thread (ie. on shutdown).
+    pool = getattr(_local, 'connections', None)
+    if pool is None:
+        return
+    for connection in pool.values():
+        try:
+            connection.close()
+        except sqlite3.Error:
+            pass
+    _local.connections = {}
+    _local.transactions = {}
+
+def _txdepth():
+    depth = getattr(_local, 'transactions', None)
+    if depth is None:
+        depth = _local.transactions = {}
+    return depth
+
 class DBConnection:
 
     def __init__(self, filename="mylar.db"):
     
         self.filename = filename
-        self.connection = sqlite3.connect(dbFilename(filename), timeout=20)
-        self.connection.row_factory = sqlite3.Row
-        
-    def action(self, query, args=None):
-    
-        with db_lock:
+        self.connection = getConnection(filename)
 
-            if query == None:
-                return
-                
-            sqlResult = None
-            attempt = 0
-            
-            while attempt < 5:
-                try:
-                    if args == None:
-                        #logger.debug(self.filename+": "+query)
-                        sqlResult = self.connection.execute(query)
-                    else:
-                        #logger.debug(self.filename+": "+query+" with args "+str(args))
-                        sqlResult = self.connection.execute(query, args)
+    def _execute(self, query, args, write):
+
+        sqlResult = None
+        attempt = 0
+
+        while attempt < 5:
+            try:
+                if args == None:
+                    #logger.debug(self.filename+": "+query)
+                    sqlResult = self.connection.execute(query)
+                else:
+                    #logger.debug(self.filename+": "+query+" with args "+str(args))
+                    sqlResult = self.connection.execute(query, args)
+                if write and not self.inTransaction():
                     self.connection.commit()
-                    break
-                except sqlite3.OperationalError, e:
-                    if "unable to open database file" in e.message or "database is locked" in e.message:
-                        logger.warn('Database Error: %s' % e)
-                        logger.warn('sqlresult: %s' %  query)
-                        attempt += 1
-                        time.sleep(1)
-                    else:
-                        logger.error('Database error executing %s :: %s' % (query, e))
-                        raise
-                except sqlite3.DatabaseError, e:
-                    logger.error('Fatal Error executing %s :: %s' % (query, e))
+                break
+            except sqlite3.OperationalError, e:
+                if "unable to open database file" in e.message or "database is locked" in e.message:
+                    logger.warn('Database Error: %s' % e)
+                    logger.warn('sqlresult: %s' %  query)
+                    attempt += 1
+                    time.sleep(1)
+                else:
+                    logger.error('Database error executing %s :: %s' % (query, e))
                     raise
-            
-            return sqlResult
+            except sqlite3.DatabaseError, e:
+                logger.error('Fatal Error executing %s :: %s' % (query, e))
+                if write and not self.inTransaction():
+                    self.connection.rollback()
+                raise
+
+        return sqlResult
+
+    def inTransaction(self):
+
+        return _txdepth().get(dbFilename(self.filename), 0) > 0
+
+    @contextmanager
+    def transaction(self):
+        # group a run of writes into a single commit (one fsync instead of one per statement).
+        # nests - only the outermost transaction commits, or rolls back if an exception escapes.
+        dbfile = dbFilename(self.filename)
+        depth = _txdepth()
+        with db_lock:
+            depth[dbfile] = depth.get(dbfile, 0) + 1
+            try:
+                yield self
+            except:
+                depth[dbfile] -= 1
+                if depth[dbfile] == 0:
+                    self.connection.rollback()
+                raise
+            else:
+                depth[dbfile] -= 1
+                if depth[dbfile] == 0:
+                    self.connection.commit()
+
+    def action(self, query, args=None):
+    
+        if query == None:
+            return
+
+        #only writes need to be serialized - readers go straight through (WAL).
+        if query.lstrip()[:7].upper().startswith(READ_ONLY):
+            return self._execute(query, args, False)
+
+        with db_lock:
+            return self._execute(query, args, True)
     
     def select(self, query, args=None):
     
@@ -100,3 +189,56 @@ class DBConnection:
             query = "INSERT INTO "+tableName+" (" + ", ".join(valueDict.keys() + keyDict.keys()) + ")" + \
                         " VALUES (" + ", ".join(["?"] * len(valueDict.keys() + keyDict.keys())) + ")"
             self.action(query, valueDict.values() + keyDict.values())
+
+    def uniqueKeys(self, tableName):
+        # which column-sets of the table are covered by a UNIQUE index/constraint.
+        tablekey = tableName.lower()
+        if tablekey not in _unique_keys:
+            keysets = []
+            for idx in self.select("PRAGMA index_list(" + tableName + ")"):
+                if idx['unique']:
+                    cols = [c['name'].lower() for c in self.select("PRAGMA index_info(" + idx['name'] + ")")]
+                    keysets.append(frozenset(cols))
+            _unique_keys[tablekey] = keysets
+        return _unique_keys[tablekey]
+
+    def bulk_upsert(self, tableName, rows, keys):
+        # rows is a list of dicts holding both the key and value columns,
+        # keys is the list of column names that identify a row (the keyDict of upsert).
+        # everything is written inside one transaction.
+        if not rows:
+            return 0
+
+        #rows don't all have to carry the same columns (ie. torrent feeds have no Size)
+        groups = {}
+        for row in rows:
+            groups.setdefault(tuple(sorted(row.keys())), []).append(row)
+
+        onconflict = UPSERT_SUPPORTED and frozenset([k.lower() for k in keys]) in self.uniqueKeys(tableName)
+
+        count = 0
+        with self.transaction():
+            for columns, grouprows in groups.items():
+                valuecols = [c for c in columns if c not in keys]
+                insertcols = valuecols + list(keys)
+                insert = "INSERT INTO " + tableName + " (" + ", ".join(insertcols) + ") VALUES (" + ", ".join(["?"] * len(insertcols)) + ")"
+                if onconflict:
+                    if valuecols:
+                        query = insert + " ON CONFLICT (" + ", ".join(keys) + ") DO UPDATE SET " + ", ".join([c + " = excluded." + c for c in valuecols])
+                    else:
+                        query = insert + " ON CONFLICT (" + ", ".join(keys) + ") DO NOTHING"
+                    self.connection.executemany(query, [[row[c] for c in insertcols] for row in grouprows])
+                else:
+                    #no unique key to hang ON CONFLICT off of - UPDATE, and INSERT the rows that didn't exist.
+                    where = " WHERE " + " AND ".join([k + " = ?" for k in keys])
+                    update = "UPDATE " + tableName + " SET " + ", ".join([c + " = ?" for c in valuecols]) + where
+                    for row in grouprows:
+                        args = [row[c] for c in insertcols]
+                        if valuecols:
+                            if self.action(update, args).rowcount > 0:
+                                continue
+                        elif self.select("SELECT 1 FROM " + tableName + where, args):
+                            continue
+                        self.action(insert, args)
+                count += len(grouprows)
+        return count
@@ -0,0 +1,172 @@
+#  This file is part of Mylar.
+#
+#  Mylar is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Mylar is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Mylar.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import with_statement
+
+import os
+import re
+import threading
+
+# Filename parsing shared by filechecker.listFiles, librarysync and the post-processor.
+#
+# None of what gets pulled out of a filename depends on the series it's being compared to, so
+# each filename is only ever parsed once - parseFilename() hands back the same ParsedFilename
+# for a name it's seen before, however many series / folders it gets checked against.
+
+# special characters that get taken out of a filename (in this order) before it's compared
+# to a series name. The escaped ones only ever match a literal backslash + character.
+NOT_THESE = ['#',
+             ',',
+             '\/',
+             ':',
+             '\;',
+             '.',
+             '-',
+             '\!',
+             '\$',
+             '\%',
+             '\+',
+             '\'',
+             '\?',
+             '\@']
+
+# alpha issue suffixes that can show up as a word of their own (ie. 005 AU)
+ISSUE_EXCEPTIONS = ['AU',
+                    'AI',
+                    'A',
+                    'B',
+                    'C']
+
+EXTENSIONS = ('.cbr', '.cbz')
+
+# filenames parsed are kept up to this many, then the cache starts over.
+CACHE_SIZE = 20000
+
+BRACKETS = re.compile('[^()]+')
+BARE_YEAR = re.compile('(.*)\s+(19\d{2}|20\d{2})(.*)')
+NEGATIVE = re.compile('-\d')
+THE = re.compile(r'\bthe\b')
+SPACES = re.compile('\s+')
+NONOS = [(nono, re.compile(nono)) for nono in NOT_THESE]
+SEPARATORS = re.compile('[\_\#\,\/\:\;\!\$\%\+\?\@]')
+ISSUE = re.compile('^-?\d+(\.\d+)?$')
+
+parsed_lock = threading.Lock()
+parsed = {}
+
+
+class ParsedFilename:
+
+    def __init__(self, filename):
+
+        self.filename = filename
+        self.extension = os.path.splitext(filename)[1].lower()
+        #the volume token (ie. v2, v2013, vol.2) if there is one.
+        self.volume = None
+        #the bracketed words of the name - ie. 'Batman 001 ', '2013', ' ', 'digital', '.cbz'
+        self.brackets = []
+        #the first year found in brackets.
+        self.year = None
+        #series + issue, cleaned up for comparing to a watchlist series name (see filechecker.listFiles).
+        self.subname = None
+        #the series name and issue # as best as can be told from the name alone.
+        self.series = None
+        self.issue = None
+
+        self.parse()
+
+    def parse(self):
+
+        subname = self.filename
+        #versioning - remove it
+        for subit in subname.replace('_', ' ').split():
+            if subit[0].lower() == 'v' and (subit[1:].isdigit() or subit.lower()[:3] == 'vol'):
+                subname = subname.replace(subit, '')
+                self.volume = subit
+
+        #remove the brackets..
+        subnm = BRACKETS.findall(subname)
+        if len(subnm):
+            #a year without brackets around it gets some, so the bracket split still finds it.
+            subname = BARE_YEAR.sub('\\1 (\\2) \\3', subname)
+            subnm = BRACKETS.findall(subname)
+        if not subnm:
+            subnm = ['']
+        self.brackets = subnm
+
+        for word in subnm:
+            if word[:-2] in ('19', '20') and word[2:].isdigit():
+                self.year = word
+                break
+
+        self.subname = self.matchname(subnm[0])
+        self.series, self.issue = self.splitissue(subnm[0])
+
+    def matchname(self, subname):
+
+        subname = subname.replace('_', ' ')
+        for nono, nonore in NONOS:
+            if nono not in subname:
+                continue
+            if nono == '-':
+                #a - in front of a number is a negative issue - leave them be.
+                if not NEGATIVE.search(subname):
+                    subname = subname.replace('-', ' ')
+            elif nono == '.':
+                #a single . between two numbers is a decimal issue, anything else goes.
+                fndit = subname.find('.')
+                if subname.count('.') != 1 or not (subname[fndit-1:fndit].isdigit() and subname[fndit+1:fndit+2].isdigit()):
+                    subname = subname.replace('.', ' ')
+            else:
+                subname = nonore.sub(' ', subname)
+        if '&' in subname:
+            subname = subname.replace('&', ' and ')
+        if ' the ' in subname.lower():
+            subname = THE.sub('', subname.lower())
+        return SPACES.sub(' ', str(subname)).strip()
+
+    def splitissue(self, comic_andiss):
+        #the last issue number in the name - everything in front of it is the series.
+        if comic_andiss.lower().endswith(EXTENSIONS):
+            comic_andiss = comic_andiss[:-4]
+        words = SEPARATORS.sub(' ', comic_andiss).split()
+        #the first word is always part of the series (ie. 2000 AD)
+        x = len(words) - 1
+        while x > 0:
+            word = words[x]
+            if ISSUE.match(word):
+                return ' '.join(words[:x]), word
+            if word.upper() in ISSUE_EXCEPTIONS and x > 1 and ISSUE.match(words[x-1]):
+                #005 AU
+                return ' '.join(words[:x-1]), words[x-1] + word.upper()
+            for alpha in ISSUE_EXCEPTIONS:
+                #005AU
+                if word.upper().endswith(alpha) and ISSUE.match(word[:-len(alpha)]):
+                    return ' '.join(words[:x]), word[:-len(alpha)] + alpha
+            x -= 1
+        return ' '.join(words), None
+
+
+def parseFilename(filename):
+
+    with parsed_lock:
+        result = parsed.get(filename)
+    if result is None:
+        result = ParsedFilename(filename)
+        with parsed_lock:
+            if len(parsed) >= CACHE_SIZE:
+                parsed.clear()
+            parsed[filename] = result
+    return result
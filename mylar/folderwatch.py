@@ -0,0 +1,309 @@
+#  This file is part of Mylar.
+#
+#  Mylar is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Mylar is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Mylar.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import with_statement
+
+import os
+import errno
+import select
+import struct
+import threading
+import time
+import ctypes
+import ctypes.util
+
+import mylar
+from mylar import logger, fileparser
+
+# Live watching of the comic directory and the download folder (FOLDER_WATCH).
+#
+# On linux the folders are watched with inotify, anywhere else (or if inotify can't be set up)
+# they get polled every DOWNLOAD_SCAN_INTERVAL minutes. Either way a folder that's had comics
+# written / moved into / removed from it is only handed off once it's been quiet for
+# FOLDER_WATCH_DELAY seconds, so a download that lands a file at a time gets processed once:
+#   - download folder : a Manual Run post-process of that folder.
+#   - comic directory : an incremental library scan of that folder (updates the file manifest,
+#                       anything new ends up on the Import Results page).
+
+# inotify events (see inotify.h)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+EVENT_HEADER = struct.Struct('iIII')
+
+pending_lock = threading.Lock()
+# folder -> [kind, time of the last event]
+pending = {}
+# root folder -> kind ('download' / 'library')
+roots = {}
+stopping = threading.Event()
+threads = []
+
+
+def watchFolders():
+    #the folders to watch, and what's done with what shows up in them.
+    folders = {}
+    if mylar.COMIC_DIR:
+        folders[os.path.normpath(mylar.COMIC_DIR)] = 'library'
+    #only a download folder that's been set for it - the SABnzbd / NZBGet folders are already
+    #post-processed by their callbacks, watching them too would post-process every download twice.
+    if mylar.FOLDER_WATCH_DIR and mylar.FOLDER_WATCH_DIR != 'None':
+        folders[os.path.normpath(mylar.FOLDER_WATCH_DIR)] = 'download'
+    watched = {}
+    for folder, kind in folders.items():
+        folder = folder.encode(mylar.SYS_ENCODING) if isinstance(folder, unicode) else folder
+        if not os.path.isdir(folder):
+            logger.warn('[FOLDER-WATCH] ' + folder + ' does not exist - not watching it.')
+            continue
+        watched[folder] = kind
+    return watched
+
+def rootOf(path):
+    #the watched folder path is under (the deepest one, if they're nested).
+    found = None
+    for root in roots:
+        if path == root or path.startswith(root.rstrip(os.sep) + os.sep):
+            if found is None or len(root) > len(found):
+                found = root
+    return found
+
+def changed(folder):
+    #something happened in folder - (re)start its quiet period.
+    root = rootOf(folder)
+    if root is None:
+        return
+    with pending_lock:
+        pending[folder] = [roots[root], time.time()]
+
+def isComic(name):
+
+    return name.lower().endswith(fileparser.EXTENSIONS)
+
+def start():
+
+    global roots
+    roots = watchFolders()
+    if not roots:
+        logger.info('[FOLDER-WATCH] Nothing to watch.')
+        return
+    stopping.clear()
+
+    watcher = None
+    inotify = Inotify()
+    if inotify.available():
+        watcher = threading.Thread(target=inotify.run, name='FOLDER-WATCH')
+    else:
+        logger.info('[FOLDER-WATCH] inotify not available - checking the folders every ' + str(mylar.DOWNLOAD_SCAN_INTERVAL) + ' minutes instead.')
+        watcher = threading.Thread(target=poll, name='FOLDER-WATCH')
+
+    for t in (watcher, threading.Thread(target=dispatch, name='FOLDER-WATCH-DISPATCH')):
+        t.setDaemon(True)
+        t.start()
+        threads.append(t)
+    for root, kind in roots.items():
+        logger.info('[FOLDER-WATCH] Watching ' + root + ' (' + kind + ')')
+
+def stop():
+
+    stopping.set()
+    for t in threads:
+        t.join(5)
+    del threads[:]
+
+def dispatch():
+    #hand off the folders that have been quiet for long enough - one at a time, oldest first.
+    while not stopping.isSet():
+        stopping.wait(1)
+        now = time.time()
+        with pending_lock:
+            ready = [(stamp, folder, kind) for folder, (kind, stamp) in pending.items() if now - stamp >= int(mylar.FOLDER_WATCH_DELAY)]
+            for stamp, folder, kind in ready:
+                del pending[folder]
+        for stamp, folder, kind in sorted(ready):
+            if stopping.isSet():
+                break
+            try:
+                process(folder, kind)
+            except Exception, e:
+                logger.error('[FOLDER-WATCH] Unable to process ' + folder + ' : ' + str(e))
+
+def process(folder, kind):
+
+    from mylar import PostProcessor, librarysync, updater
+
+    if kind == 'download':
+        if not os.path.isdir(folder):
+            #already dealt with (ie. by the SAB / NZBGet callback)
+            return
+        logger.info('[FOLDER-WATCH] New comics in ' + folder + ' - post-processing.')
+        PostProcessor.PostProcessor('Manual Run', folder).Process()
+    else:
+        #if the folder's gone, scan what's left of its parent so its files come out of the manifest.
+        root = rootOf(folder)
+        while not os.path.isdir(folder) and folder != root:
+            folder = os.path.dirname(folder)
+        logger.info('[FOLDER-WATCH] Comics changed in ' + folder + ' - updating the library.')
+        result = librarysync.libraryScan(folder, append=True)
+        if result is None or result[0] == "Completed":
+            return
+        #files of a watched series just need that series rescanned (ie. what post-processing moved in),
+        #anything else is up for import.
+        imports = []
+        rescans = []
+        for comic in result[0]['comic_info']:
+            if comic['watchmatch'] is None:
+                imports.append(comic)
+            elif comic['watchmatch'] not in rescans:
+                rescans.append(comic['watchmatch'])
+        for comicid in rescans:
+            updater.forceRescan(comicid)
+        if imports:
+            librarysync.storeImports({'comic_info': imports})
+
+def poll():
+    #no inotify - compare what's in the folders to what was there last time around.
+    snapshots = {}
+    for root in roots:
+        snapshots[root] = snapshot(root)
+    while not stopping.isSet():
+        stopping.wait(max(1, int(mylar.DOWNLOAD_SCAN_INTERVAL)) * 60)
+        if stopping.isSet():
+            break
+        for root in roots:
+            current = snapshot(root)
+            previous = snapshots[root]
+            for path in set(current) ^ set(previous):
+                changed(os.path.dirname(path))
+            for path in set(current) & set(previous):
+                if current[path] != previous[path]:
+                    changed(os.path.dirname(path))
+            snapshots[root] = current
+
+def snapshot(root):
+
+    from mylar import librarysync
+
+    return dict((path, (size, mtime)) for path, name, size, mtime in librarysync.walkLibrary(root))
+
+
+class Inotify:
+
+    def __init__(self):
+
+        self.fd = None
+        self.libc = None
+        # watch descriptor -> folder
+        self.wds = {}
+
+    def available(self):
+
+        if not hasattr(select, 'poll'):
+            return False
+        try:
+            self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            self.fd = self.libc.inotify_init()
+        except (OSError, AttributeError):
+            return False
+        if self.fd < 0:
+            logger.fdebug('[FOLDER-WATCH] inotify_init failed : ' + os.strerror(ctypes.get_errno()))
+            return False
+        for root in roots:
+            self.addTree(root)
+        return True
+
+    def addWatch(self, folder):
+
+        wd = self.libc.inotify_add_watch(self.fd, folder, WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                logger.warn('[FOLDER-WATCH] Out of inotify watches (fs.inotify.max_user_watches) - ' + folder + ' will not be watched.')
+            elif err != errno.ENOENT:
+                logger.fdebug('[FOLDER-WATCH] Unable to watch ' + folder + ' : ' + os.strerror(err))
+            return
+        self.wds[wd] = folder
+
+    def addTree(self, folder):
+
+        for r, d, f in os.walk(folder):
+            self.addWatch(r)
+
+    def run(self):
+
+        poller = select.poll()
+        poller.register(self.fd, select.POLLIN)
+        try:
+            while not stopping.isSet():
+                if not poller.poll(1000):
+                    continue
+                try:
+                    data = os.read(self.fd, 65536)
+                except OSError, e:
+                    if e.errno == errno.EINTR:
+                        continue
+                    raise
+                self.events(data)
+        finally:
+            os.close(self.fd)
+
+    def events(self, data):
+
+        pos = 0
+        while pos + EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, pos)
+            name = data[pos + EVENT_HEADER.size:pos + EVENT_HEADER.size + length].rstrip('\0')
+            pos += EVENT_HEADER.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                #events were dropped - go over everything.
+                logger.fdebug('[FOLDER-WATCH] inotify queue overflowed - rechecking all watched folders.')
+                for folder in self.wds.values():
+                    changed(folder)
+                continue
+            folder = self.wds.get(wd)
+            if folder is None:
+                continue
+            if mask & IN_IGNORED:
+                del self.wds[wd]
+                continue
+            if mask & IN_DELETE_SELF:
+                changed(folder)
+                continue
+
+            path = os.path.join(folder, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    #a new folder (ie. a finished download moved in) - watch it, and whatever's already in it.
+                    self.addTree(path)
+                    for r, d, f in os.walk(path):
+                        if any(isComic(x) for x in f):
+                            changed(r)
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    #moved out from under the watch - stop watching it (and what's under it) by the old name.
+                    for subwd, subfolder in self.wds.items():
+                        if subfolder == path or subfolder.startswith(path + os.sep):
+                            self.libc.inotify_rm_watch(self.fd, subwd)
+                            del self.wds[subwd]
+                    changed(path)
+            elif isComic(name) and mask & (IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE):
+                changed(folder)
@@ -19,6 +19,7 @@ import datetime
 import re
 import platform
 import itertools
+import threading
 import os
 import mylar
 
@@ -444,6 +445,9 @@ def apiremove(apistring, type):
 
     return apiremoved
 
+# ComicSort swaps mylar.COMICSORT's entries over under this, so they're always from the same sort.
+comicsort_lock = threading.Lock()
+
 def ComicSort(comicorder=None,sequence=None,imported=None):
     if sequence:
         # if it's on startup, load the sql into a tuple for use to avoid record-locking
@@ -454,10 +458,6 @@ def ComicSort(comicorder=None,sequence=None,imported=None):
         comicorderlist = []
         comicorder = {}
         comicidlist = []
-        if sequence == 'update':
-            mylar.COMICSORT['SortOrder'] = None
-            mylar.COMICSORT['LastOrderNo'] = None
-            mylar.COMICSORT['LastOrderID'] = None
         for csort in comicsort:
             if csort['ComicID'] is None: pass
             if not csort['ComicID'] in comicidlist:
@@ -487,14 +487,17 @@ def ComicSort(comicorder=None,sequence=None,imported=None):
             logger.info('Sucessfully ordered ' + str(i-1) + ' series in your watchlist.')
             return comicorder
         elif sequence == 'update':
-            mylar.COMICSORT['SortOrder'] = comicorderlist
-            print ("i:" + str(i))
             if i == 0:
                 placemnt = 1
+                lastorderid = None
             else:
                 placemnt = int(i-1)
-            mylar.COMICSORT['LastOrderNo'] = placemnt
-            mylar.COMICSORT['LastOrderID'] = mylar.COMICSORT['SortOrder'][placemnt]['ComicID']
+                lastorderid = comicorderlist[placemnt]['ComicID']
+            #the new order is swapped in all at once - the ui (or another refresh) never sees it half built.
+            with comicsort_lock:
+                mylar.COMICSORT['SortOrder'] = comicorderlist
+                mylar.COMICSORT['LastOrderNo'] = placemnt
+                mylar.COMICSORT['LastOrderID'] = lastorderid
             return            
     else:
         # for new series adds, we already know the comicid, so we set the sortorder to an abnormally high #
@@ -509,9 +512,10 @@ def ComicSort(comicorder=None,sequence=None,imported=None):
              'ComicID':             imported,
              'ComicOrder':           lastorderval
              })
-        mylar.COMICSORT['SortOrder'] = sortedapp
-        mylar.COMICSORT['LastOrderNo'] = lastorderval
-        mylar.COMICSORT['LastOrderID'] = imported
+        with comicsort_lock:
+            mylar.COMICSORT['SortOrder'] = sortedapp
+            mylar.COMICSORT['LastOrderNo'] = lastorderval
+            mylar.COMICSORT['LastOrderID'] = imported
         return
         
 def fullmonth(monthno):
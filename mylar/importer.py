@@ -25,7 +25,7 @@ import sqlite3
 import cherrypy
 
 import mylar
-from mylar import logger, helpers, db, mb, albumart, cv, parseit, filechecker, search, updater, moveit, comicbookdb
+from mylar import logger, helpers, db, mb, albumart, cv, parseit, filechecker, search, updater, moveit, comicbookdb, nameindex
 
        
 def is_exists(comicid):
@@ -42,7 +42,7 @@ def is_exists(comicid):
         return False
 
 
-def addComictoDB(comicid,mismatch=None,pullupd=None,imported=None,ogcname=None):
+def addComictoDB(comicid,mismatch=None,pullupd=None,imported=None,ogcname=None,incremental=False,fresh=False,resort=True):
     # Putting this here to get around the circular import. Will try to use this to update images at later date.
 #    from mylar import cache
     
@@ -68,11 +68,12 @@ def addComictoDB(comicid,mismatch=None,pullupd=None,imported=None,ogcname=None):
     myDB.upsert("comics", newValueDict, controlValueDict)
 
     #run the re-sortorder here in order to properly display the page
-    if pullupd is None:
+    #(not resort - a refresh of a batch of series re-sorts once they're all done)
+    if pullupd is None and resort:
         helpers.ComicSort(comicorder=mylar.COMICSORT, imported=comicid)
 
     # we need to lookup the info for the requested ComicID in full now        
-    comic = cv.getComic(comicid,'comic')
+    comic = cv.getComic(comicid,'comic',fresh=fresh)
     #comic = myDB.action('SELECT * FROM comics WHERE ComicID=?', [comicid]).fetchone()
     if not comic:
         logger.warn('Error fetching comic. ID for : ' + comicid)
@@ -83,6 +84,21 @@ def addComictoDB(comicid,mismatch=None,pullupd=None,imported=None,ogcname=None):
             newValueDict = {"Status":   "Active"}
         myDB.upsert("comics", newValueDict, controlValueDict)
         return
+
+    #incremental refresh (CV_ONLY) - if the volume hasn't changed on CV since the last refresh there's nothing
+    #to do, otherwise only the issues CV has changed since then get pulled down and written.
+    since = None
+    if incremental and mylar.CV_ONLY and dbcomic is not None and dbcomic['CV_LastUpdated'] and comic['LastUpdated']:
+        if comic['LastUpdated'] <= dbcomic['CV_LastUpdated']:
+            logger.info(comic['ComicName'] + ' has not changed on ComicVine since ' + dbcomic['CV_LastUpdated'] + ' - skipping the issue refresh.')
+            myDB.upsert("comics", {"Status":       "Active",
+                                   "LastUpdated":  helpers.now()}, controlValueDict)
+            #the issues are as they were, but the files on disk and this week's pull-list may not be.
+            updater.forceRescan(comicid)
+            if pullupd is None:
+                pullcheck(comicid, comic['ComicName'], dbcomic['LatestIssue'], str(dbcomic['ComicPublished']).endswith('Present'))
+            return
+        since = dbcomic['CV_LastUpdated']
     
     if comic['ComicName'].startswith('The '):
         sortname = comic['ComicName'][4:]
@@ -129,11 +145,11 @@ def addComictoDB(comicid,mismatch=None,pullupd=None,imported=None,ogcname=None):
         if mylar.CV_ONLY:
             #we'll defer this until later when we grab all the issues and then figure it out
             logger.info('Uh-oh. I cannot find a Series Year for this series. I am going to try analyzing deeper.')
-            SeriesYear = cv.getComic(comicid,'firstissue',comic['FirstIssueID'])
+            SeriesYear = cv.getComic(comicid,'firstissue',comic['FirstIssueID'],fresh=fresh)
             if SeriesYear == '0000':
                 logger.info('Ok - I could not find a Series Year at all. Loading in the issue data now and will figure out the Series Year.')
                 CV_NoYearGiven = "yes"
-                issued = cv.getComic(comicid,'issue')
+                issued = cv.getComic(comicid,'issue',fresh=fresh)
                 SeriesYear = issued['firstdate'][:4]
         else:
             SeriesYear = gcdinfo['SeriesYear']
@@ -201,6 +217,7 @@ def addComictoDB(comicid,mismatch=None,pullupd=None,imported=None,ogcname=None):
                             pass
                         else:
                             n = 0
+                            annualdata = []
                             logger.fdebug('there are ' + str(sr['issues']) + ' annuals in this series.')
                             while (n < int(sr['issues'])):
                                 try:
@@ -212,16 +229,16 @@ def addComictoDB(comicid,mismatch=None,pullupd=None,imported=None,ogcname=None):
                                 issnum = str(firstval['Issue_Number'])
                                 issname = cleanname
                                 issdate = str(firstval['Issue_Date'])
-                                newCtrl = {"IssueID": issid}
-                                newVals = {"Issue_Number":    issnum,
-                                           "Int_IssueNumber": helpers.issuedigits(issnum),
-                                           "IssueDate":       issdate,
-                                           "IssueName":       issname,
-                                           "ComicID":         comicid,
-                                           "ComicName":       comic['ComicName'],
-                                           "Status":         "Skipped"}
-                                myDB.upsert("annuals", newVals, newCtrl)
+                                annualdata.append({"IssueID":         issid,
+                                                   "Issue_Number":    issnum,
+                                                   "Int_IssueNumber": helpers.issuedigits(issnum),
+                                                   "IssueDate":       issdate,
+                                                   "IssueName":       issname,
+                                                   "ComicID":         comicid,
+                                                   "ComicName":       comic['ComicName'],
+                                                   "Status":         "Skipped"})
                                 n+=1
+                            myDB.bulk_upsert("annuals", annualdata, ["IssueID"])
                 num_res+=1
 
         elif len(sresults) == 0 or len(sresults) is None:
@@ -406,12 +423,20 @@ def addComictoDB(comicid,mismatch=None,pullupd=None,imported=None,ogcname=None):
 
     #comicsort here...
     #run the re-sortorder here in order to properly display the page
-    if pullupd is None:
+    if pullupd is None and resort:
         helpers.ComicSort(sequence='update')
 
     if CV_NoYearGiven == 'no':
         #if set to 'no' then we haven't pulled down the issues, otherwise we did it already
-        issued = cv.getComic(comicid,'issue')
+        if since is not None:
+            logger.fdebug('Retrieving only the issues updated on ComicVine since ' + since)
+            issued = cv.getComic(comicid,'issue',since=since,fresh=fresh)
+            if not issued:
+                since = None
+        if since is None:
+            issued = cv.getComic(comicid,'issue',fresh=fresh)
+    else:
+        since = None
     logger.info('Sucessfully retrieved issue details for ' + comic['ComicName'] )
     n = 0
     iscnt = int(comicIssues)
@@ -429,6 +454,13 @@ def addComictoDB(comicid,mismatch=None,pullupd=None,imported=None,ogcname=None):
     #---removed NEW code here---
     logger.info('Now adding/updating issues for ' + comic['ComicName'])
 
+    #grab the existing statuses in one hit and write all the issues in a single transaction
+    #at the end, rather than a lookup + commit for every issue in the series.
+    existing = {}
+    for ex in myDB.select('SELECT IssueID, Status, Issue_Number, IssueDate FROM issues WHERE ComicID=?', [comicid]):
+        existing[ex['IssueID']] = ex
+    issuedata = []
+
     if not mylar.CV_ONLY:
         #fccnt = int(fc['comiccount'])
         #logger.info(u"Found " + str(fccnt) + "/" + str(iscnt) + " issues of " + comic['ComicName'] + "...verifying")
@@ -535,14 +567,10 @@ def addComictoDB(comicid,mismatch=None,pullupd=None,imported=None,ogcname=None):
                 #---END.NEW.
 
                 # check if the issue already exists
-                iss_exists = myDB.action('SELECT * from issues WHERE IssueID=?', [issid]).fetchone()
+                iss_exists = existing.get(issid)
 
-                # Only change the status & add DateAdded if the issue is already in the database
-                if iss_exists is None:
-                    newValueDict['DateAdded'] = helpers.today()
-
-                controlValueDict = {"IssueID":  issid}
-                newValueDict = {"ComicID":            comicid,
+                newValueDict = {"IssueID":            issid,
+                                "ComicID":            comicid,
                                 "ComicName":          comic['ComicName'],
                                 "IssueName":          issname,
                                 "Issue_Number":       issnum,
@@ -560,15 +588,18 @@ def addComictoDB(comicid,mismatch=None,pullupd=None,imported=None,ogcname=None):
                     #print ("Existing status : " + str(iss_exists['Status']))
                     newValueDict['Status'] = iss_exists['Status']     
             
-                try:     
-                    myDB.upsert("issues", newValueDict, controlValueDict)
-                except sqlite3.InterfaceError, e:
-                    #raise sqlite3.InterfaceError(e)
-                    logger.error('MAJOR error trying to get issue data, this is most likey a MULTI-VOLUME series and you need to use the custom_exceptions.csv file.')
-                    myDB.action("DELETE FROM comics WHERE ComicID=?", [comicid])
-                    return
+                issuedata.append(newValueDict)
                 n+=1
 
+            try:     
+                myDB.bulk_upsert("issues", issuedata, ["IssueID"])
+            except sqlite3.InterfaceError, e:
+                #raise sqlite3.InterfaceError(e)
+                logger.error('MAJOR error trying to get issue data, this is most likey a MULTI-VOLUME series and you need to use the custom_exceptions.csv file.')
+                myDB.action("DELETE FROM comics WHERE ComicID=?", [comicid])
+                nameindex.remove(comicid)
+                return
+
 #        logger.debug(u"Updating comic cache for " + comic['ComicName'])
 #        cache.getThumb(ComicID=issue['issueid'])
             
@@ -682,14 +713,10 @@ def addComictoDB(comicid,mismatch=None,pullupd=None,imported=None,ogcname=None):
                     firstiss = issnum
                     firstdate = str(firstval['Issue_Date'])
                 # check if the issue already exists
-                iss_exists = myDB.action('SELECT * from issues WHERE IssueID=?', [issid]).fetchone()
-
-                # Only change the status & add DateAdded if the issue is already in the database
-                if iss_exists is None:
-                    newValueDict['DateAdded'] = helpers.today()
+                iss_exists = existing.get(issid)
 
-                controlValueDict = {"IssueID":  issid}
-                newValueDict = {"ComicID":            comicid,
+                newValueDict = {"IssueID":            issid,
+                                "ComicID":            comicid,
                                 "ComicName":          comic['ComicName'],
                                 "IssueName":          issname,
                                 "Issue_Number":       issnum,
@@ -709,15 +736,32 @@ def addComictoDB(comicid,mismatch=None,pullupd=None,imported=None,ogcname=None):
                     else:
                         newValueDict['Status'] = "Skipped"
 
-                try:
-                    myDB.upsert("issues", newValueDict, controlValueDict)
-                except sqlite3.InterfaceError, e:
-                    #raise sqlite3.InterfaceError(e)
-                    logger.error('Something went wrong - I cannot add the issue information into my DB.')
-                    myDB.action("DELETE FROM comics WHERE ComicID=?", [comicid])
-                    return
+                issuedata.append(newValueDict)
                 n+=1
 
+            try:
+                myDB.bulk_upsert("issues", issuedata, ["IssueID"])
+            except sqlite3.InterfaceError, e:
+                #raise sqlite3.InterfaceError(e)
+                logger.error('Something went wrong - I cannot add the issue information into my DB.')
+                myDB.action("DELETE FROM comics WHERE ComicID=?", [comicid])
+                nameindex.remove(comicid)
+                return
+
+            if since is not None:
+                #the issues that didn't change still count towards the first / latest issue of the series.
+                logger.info('Updated ' + str(len(issuedata)) + ' changed issues for ' + comic['ComicName'])
+                changed = set([iss['IssueID'] for iss in issuedata])
+                for issid, ex in existing.items():
+                    if issid in changed or ex['IssueDate'] is None:
+                        continue
+                    if ex['IssueDate'] > latestdate:
+                        latestiss = ex['Issue_Number']
+                        latestdate = str(ex['IssueDate'])
+                    if ex['IssueDate'] < firstdate:
+                        firstiss = ex['Issue_Number']
+                        firstdate = str(ex['IssueDate'])
+
     #figure publish dates here...
     styear = str(SeriesYear)
     #if SeriesYear == '0000':
@@ -751,10 +795,12 @@ def addComictoDB(comicid,mismatch=None,pullupd=None,imported=None,ogcname=None):
                     "LatestIssue":     latestiss,
                     "LatestDate":      latestdate,
                     "ComicPublished":  publishfigure,
-                    "LastUpdated":     helpers.now()
+                    "LastUpdated":     helpers.now(),
+                    "CV_LastUpdated":  comic['LastUpdated']
                    }
 
     myDB.upsert("comics", newValueStat, controlValueStat)
+    nameindex.update(comicid)
 
     if mylar.CVINFO or (mylar.CV_ONLY and mylar.CVINFO):
         if not os.path.exists(os.path.join(comlocation,"cvinfo")) or mylar.CV_ONETIMER:
@@ -778,34 +824,40 @@ def addComictoDB(comicid,mismatch=None,pullupd=None,imported=None,ogcname=None):
     updater.forceRescan(comicid)
 
     if pullupd is None:
+        pullcheck(comicid, comic['ComicName'], latestiss, lastpubdate == 'Present')
+
+
+def pullcheck(comicid, ComicName, latestiss, present):
     # lets' check the pullist for anything at this time as well since we're here.
     # do this for only Present comics....
-        if mylar.AUTOWANT_UPCOMING and lastpubdate == 'Present': #and 'Present' in gcdinfo['resultPublished']:
-            logger.fdebug('latestissue: #' + str(latestiss))
-            chkstats = myDB.action("SELECT * FROM issues WHERE ComicID=? AND Issue_Number=?", [comicid,str(latestiss)]).fetchone()
-            logger.fdebug(chkstats['Status'])
-            if chkstats['Status'] == 'Skipped' or chkstats['Status'] == 'Wanted' or chkstats['Status'] == 'Snatched':
-                logger.info('Checking this week pullist for new issues of ' + comic['ComicName'])
-                updater.newpullcheck(comic['ComicName'], comicid)
+    myDB = db.DBConnection()
 
-        #here we grab issues that have been marked as wanted above...
+    if mylar.AUTOWANT_UPCOMING and present: #and 'Present' in gcdinfo['resultPublished']:
+        logger.fdebug('latestissue: #' + str(latestiss))
+        chkstats = myDB.action("SELECT * FROM issues WHERE ComicID=? AND Issue_Number=?", [comicid,str(latestiss)]).fetchone()
+        logger.fdebug(chkstats['Status'])
+        if chkstats['Status'] == 'Skipped' or chkstats['Status'] == 'Wanted' or chkstats['Status'] == 'Snatched':
+            logger.info('Checking this week pullist for new issues of ' + ComicName)
+            updater.newpullcheck(ComicName, comicid)
+
+            #here we grab issues that have been marked as wanted above...
   
-                results = myDB.select("SELECT * FROM issues where ComicID=? AND Status='Wanted'", [comicid])
-                if results:
-                    logger.info('Attempting to grab wanted issues for : '  + comic['ComicName'])
-    
-                    for result in results:
-                        logger.fdebug('Searching for : ' + str(result['Issue_Number']))
-                        logger.fdebug('Status of : ' + str(result['Status']))
-                        search.searchforissue(result['IssueID'])
-                else: logger.info('No issues marked as wanted for ' + comic['ComicName'])
+            results = myDB.select("SELECT * FROM issues where ComicID=? AND Status='Wanted'", [comicid])
+            if results:
+                logger.info('Attempting to grab wanted issues for : '  + ComicName)
 
-                logger.info('Finished grabbing what I could.')
-            else:
-                logger.info('Already have the latest issue : #' + str(latestiss))
+                for result in results:
+                    logger.fdebug('Searching for : ' + str(result['Issue_Number']))
+                    logger.fdebug('Status of : ' + str(result['Status']))
+                    search.searchforissue(result['IssueID'])
+            else: logger.info('No issues marked as wanted for ' + ComicName)
+
+            logger.info('Finished grabbing what I could.')
+        else:
+            logger.info('Already have the latest issue : #' + str(latestiss))
 
 
-def GCDimport(gcomicid, pullupd=None,imported=None,ogcname=None):
+def GCDimport(gcomicid, pullupd=None,imported=None,ogcname=None,resort=True):
     # this is for importing via GCD only and not using CV.
     # used when volume spanning is discovered for a Comic (and can't be added using CV).
     # Issue Counts are wrong (and can't be added).
@@ -848,7 +900,7 @@ def GCDimport(gcomicid, pullupd=None,imported=None,ogcname=None):
         return
 
     #run the re-sortorder here in order to properly display the page
-    if pullupd is None:
+    if pullupd is None and resort:
         helpers.ComicSort(comicorder=mylar.COMICSORT, imported=gcomicid)
 
     if ComicName.startswith('The '):
@@ -985,7 +1037,7 @@ def GCDimport(gcomicid, pullupd=None,imported=None,ogcname=None):
 
     #comicsort here...
     #run the re-sortorder here in order to properly display the page
-    if pullupd is None:
+    if pullupd is None and resort:
         helpers.ComicSort(sequence='update')
 
     logger.info(u"Sucessfully retrieved issue details for " + ComicName )
@@ -1099,6 +1151,7 @@ def GCDimport(gcomicid, pullupd=None,imported=None,ogcname=None):
                    }
 
     myDB.upsert("comics", newValueStat, controlValueStat)
+    nameindex.update(gcomicid)
 
     if mylar.CVINFO:
         if not os.path.exists(comlocation + "/cvinfo"):
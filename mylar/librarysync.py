@@ -19,12 +19,73 @@ import os
 import glob
 import re 
 import shutil
+import stat
+import threading
+import Queue
 
 import mylar
-from mylar import db, logger, helpers, importer, updater
+from mylar import db, logger, helpers, importer, updater, fileparser, nameindex
+
+def walkLibrary(dir):
+    #every comic under dir as (path, filename, size, mtime). Folders get listed LIBRARYSCAN_THREADS at a
+    #time - on a network share the listing / stat round-trips are what a scan spends its time on.
+    folders = Queue.Queue()
+    found = []
+    found_lock = threading.Lock()
+
+    def walker():
+        while True:
+            folder = folders.get()
+            if folder is None:
+                folders.task_done()
+                break
+            comics = []
+            try:
+                try:
+                    names = os.listdir(folder)
+                except OSError, e:
+                    logger.warn('Unable to read directory ' + folder.decode(mylar.SYS_ENCODING, 'replace') + ' : ' + str(e))
+                    continue
+                for name in names:
+                    path = os.path.join(folder, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    if stat.S_ISDIR(st.st_mode):
+                        #same as os.walk - symlinked folders aren't followed.
+                        if not os.path.islink(path):
+                            folders.put(path)
+                    elif name.lower().endswith(fileparser.EXTENSIONS):
+                        comics.append((path, name, st.st_size, st.st_mtime))
+            except Exception, e:
+                #a dead walker would leave folders.join() waiting forever - skip the folder instead.
+                logger.warn('Error scanning directory ' + folder.decode(mylar.SYS_ENCODING, 'replace') + ' : ' + str(e))
+            finally:
+                if comics:
+                    with found_lock:
+                        found.extend(comics)
+                folders.task_done()
+
+    threads = max(1, int(mylar.LIBRARYSCAN_THREADS))
+    folders.put(dir)
+    walkers = []
+    for x in range(threads):
+        t = threading.Thread(target=walker, name='LIBRARYSCAN-' + str(x))
+        t.setDaemon(True)
+        t.start()
+        walkers.append(t)
+    folders.join()
+    for t in walkers:
+        folders.put(None)
+    for t in walkers:
+        t.join()
+    found.sort()
+    return found
 
 # You can scan a single directory and append it to the current library by specifying append=True
-def libraryScan(dir=None, append=False, ComicID=None, ComicName=None, cron=None):
+# full=True re-reads every file, not just what's changed since the last scan.
+def libraryScan(dir=None, append=False, ComicID=None, ComicName=None, cron=None, full=False):
 
     if cron and not mylar.LIBRARYSCAN:
         return
@@ -46,82 +107,58 @@ def libraryScan(dir=None, append=False, ComicID=None, ComicName=None, cron=None)
 
     basedir = dir
 
+    #only what's new or changed since the last scan (going by the manifest) gets parsed & queued for import.
+    myDB = db.DBConnection()
     comic_list = []
     comiccnt = 0
-    extensions = ('cbr','cbz')
-    for r,d,f in os.walk(dir):
-        #for directory in d[:]:
-        #    if directory.startswith("."):
-        #        d.remove(directory)
-        for files in f:
-            if any(files.lower().endswith('.' + x.lower()) for x in extensions):
-                comic = files
-                comicpath = os.path.join(r, files)
-                comicsize = os.path.getsize(comicpath)
-                print "Comic: " + comic
-                print "Comic Path: " + comicpath
-                print "Comic Size: " + str(comicsize)
-
-                # We need the unicode path to use for logging, inserting into database
-                unicode_comic_path = comicpath.decode(mylar.SYS_ENCODING, 'replace')
-
-                comiccnt+=1
-                comic_dict = { 'ComicFilename':           comic,
-                               'ComicLocation':           comicpath,
-                               'ComicSize':               comicsize,
-                               'Unicode_ComicLocation':   unicode_comic_path }
-                comic_list.append(comic_dict)
-
-        logger.info("I've found a total of " + str(comiccnt) + " comics....analyzing now")
-        logger.info("comiclist: " + str(comic_list))
-    myDB = db.DBConnection()
-
-    #let's load in the watchlist to see if we have any matches.
-    logger.info("loading in the watchlist to see if a series is being watched already...")
-    watchlist = myDB.action("SELECT * from comics")
-    ComicName = []
-    ComicYear = []
-    ComicPublisher = []
-    ComicTotal = []
-    ComicID = []
-    ComicLocation = []
-
-    AltName = []
-    watchcnt = 0
+    unchanged = 0
+    manifest = {}
+    if not full:
+        scanprefix = dir.decode(mylar.SYS_ENCODING, 'replace').rstrip(os.sep) + os.sep
+        for entry in myDB.select("SELECT * FROM librarymanifest WHERE substr(ComicLocation, 1, ?) = ?", [len(scanprefix), scanprefix]):
+            manifest[entry['ComicLocation'].encode(mylar.SYS_ENCODING)] = (entry['ComicSize'], entry['ModTime'])
+
+    manifestupd = []
+    for comicpath, comic, comicsize, comicmtime in walkLibrary(dir):
+        comiccnt+=1
+        if manifest.pop(comicpath, None) == (comicsize, comicmtime):
+            unchanged+=1
+            continue
+
+        # We need the unicode path to use for logging, inserting into database
+        unicode_comic_path = comicpath.decode(mylar.SYS_ENCODING, 'replace')
+
+        comic_dict = { 'ComicFilename':           comic,
+                       'ComicLocation':           comicpath,
+                       'ComicSize':               comicsize,
+                       'Unicode_ComicLocation':   unicode_comic_path }
+        comic_list.append(comic_dict)
+        manifestupd.append({'ComicLocation': unicode_comic_path,
+                            'ComicSize':     comicsize,
+                            'ModTime':       comicmtime})
+
+    logger.info("I've found a total of " + str(comiccnt) + " comics - " + str(len(comic_list)) + " new or changed since the last scan, " + str(unchanged) + " unchanged....analyzing now")
+
+    #anything left in the manifest isn't there anymore.
+    if manifest:
+        removed = [comicpath.decode(mylar.SYS_ENCODING, 'replace') for comicpath in manifest]
+        logger.fdebug(str(len(removed)) + " comics have been removed since the last scan.")
+        with myDB.transaction():
+            for x in range(0, len(removed), 500):
+                chunk = removed[x:x+500]
+                marks = ", ".join(["?"] * len(chunk))
+                myDB.action("DELETE FROM librarymanifest WHERE ComicLocation IN (" + marks + ")", chunk)
+                myDB.action("DELETE FROM importresults WHERE Status='Not Imported' AND ComicLocation IN (" + marks + ")", chunk)
+
+    #the watchlist gets matched off the series name index (see nameindex) - names & alternates.
+    nameindex.ensure()
+    logger.info("Matching against the " + str(len(nameindex.series)) + " series on your watchlist.")
 
     watch_kchoice = []
     watchchoice = {}
     import_by_comicids = []
     import_comicids = {}
 
-    for watch in watchlist:
-        # let's clean up the name, just in case for comparison purposes...
-        watchcomic = re.sub('[\_\#\,\/\:\;\.\-\!\$\%\&\+\'\?\@]', ' ', watch['ComicName']).encode('utf-8').strip()
-        #watchcomic = re.sub('\s+', ' ', str(watchcomic)).strip()
-
-        if ' the ' in watchcomic.lower():
-            #drop the 'the' from the watchcomic title for proper comparisons.
-            watchcomic = watchcomic[-4:]
-
-        alt_chk = "no" # alt-checker flag (default to no)
-         
-        # account for alternate names as well
-        if watch['AlternateSearch'] is not None and watch['AlternateSearch'] is not 'None':
-            altcomic = re.sub('[\_\#\,\/\:\;\.\-\!\$\%\&\+\'\?\@]', ' ', watch['AlternateSearch']).encode('utf-8').strip()
-            #altcomic = re.sub('\s+', ' ', str(altcomic)).strip()
-            AltName.append(altcomic)
-            alt_chk = "yes"  # alt-checker flag
-
-        ComicName.append(watchcomic)
-        ComicYear.append(watch['ComicYear'])
-        ComicPublisher.append(watch['ComicPublisher'])
-        ComicTotal.append(watch['Total'])
-        ComicID.append(watch['ComicID'])
-        ComicLocation.append(watch['ComicLocation'])
-        watchcnt+=1
-
-    logger.info("Successfully loaded " + str(watchcnt) + " series from your watchlist.")
-
     ripperlist=['digital-',
                 'empire',
                 'dcp']
@@ -129,276 +166,41 @@ def libraryScan(dir=None, append=False, ComicID=None, ComicName=None, cron=None)
     watchfound = 0
 
     for i in comic_list:
-        print i['ComicFilename']
-
         comfilename = i['ComicFilename']
         comlocation = i['ComicLocation']
-        #let's clean up the filename for matching purposes
-
-        cfilename = re.sub('[\_\#\,\/\:\;\-\!\$\%\&\+\'\?\@]', ' ', comfilename)
-        #cfilename = re.sub('\s', '_', str(cfilename))
+        #series / issue / year out of the filename (parsed once per name - see fileparser).
+        parsed = fileparser.parseFilename(comfilename)
 
-        cm_cn = 0
+        com_NAME = parsed.series
+        comiss = parsed.issue
+        if comiss is None:
+            logger.error("Invalid Issue number (none present) for " + comfilename)
+            continue
+        result_comyear = parsed.year
+        cfilename = com_NAME + ' ' + comiss
 
-        #we need to track the counter to make sure we are comparing the right array parts  
-        #this takes care of the brackets :)
-        m = re.findall('[^()]+', cfilename)
-        lenm = len(m)
-        print ("there are " + str(lenm) + " words.")
-        cnt = 0
-        yearmatch = "false"
-        foundonwatch = "False"
-        issue = 999999
-
-        while (cnt < lenm):
-            if m[cnt] is None: break
-            if m[cnt] == ' ':
-                pass
-            else:
-                logger.fdebug(str(cnt) + ". Bracket Word: " + m[cnt])
-                if cnt == 0:
-                    comic_andiss = m[cnt]
-                    logger.fdebug("Comic: " + comic_andiss)
-                    # if it's not in the standard format this will bork.
-                    # let's try to accomodate (somehow).
-                    # first remove the extension (if any)
-                    extensions = ('cbr', 'cbz')
-                    if comic_andiss.lower().endswith(extensions):
-                        comic_andiss = comic_andiss[:-4]
-                        print ("removed extension from filename.")
-                    #now we have to break up the string regardless of formatting.
-                    #let's force the spaces.
-                    comic_andiss = re.sub('_', ' ', comic_andiss)
-                    cs = comic_andiss.split()
-                    cs_len = len(cs)
-                    cn = ''
-                    ydetected = 'no'
-                    idetected = 'no'
-                    decimaldetect = 'no'
-                    for i in reversed(xrange(len(cs))):
-                        #start at the end.
-                        print ("word: " + str(cs[i]))
-                        #assume once we find issue - everything prior is the actual title
-                        #idetected = no will ignore everything so it will assume all title                            
-                        if cs[i][:-2] == '19' or cs[i][:-2] == '20' and idetected == 'no':
-                            print ("year detected: " + str(cs[i]))
-                            ydetected = 'yes'
-                            result_comyear = cs[i]
-                        elif cs[i].isdigit() and idetected == 'no' or '.' in cs[i]:
-                            issue = cs[i]
-                            print ("issue detected : " + str(issue))
-                            idetected = 'yes'
-                            if '.' in cs[i]:
-                                #make sure it's a number on either side of decimal and assume decimal issue.
-                                decst = cs[i].find('.')
-                                dec_st = cs[i][:decst]
-                                dec_en = cs[i][decst+1:]
-                                print ("st: " + str(dec_st))
-                                print ("en: " + str(dec_en))
-                                if dec_st.isdigit() and dec_en.isdigit():
-                                    print ("decimal issue detected...adjusting.")
-                                    issue = dec_st + "." + dec_en
-                                    print ("issue detected: " + str(issue))
-                                    idetected = 'yes'
-                                else:
-                                    print ("false decimal represent. Chunking to extra word.")
-                                    cn = cn + cs[i] + " "
-                                    break
-                        elif '\#' in cs[i] or decimaldetect == 'yes':
-                            print ("issue detected: " + str(cs[i]))
-                            idetected = 'yes'
-
-                        else: cn = cn + cs[i] + " "
-                    if ydetected == 'no':
-                        #assume no year given in filename...
-                        result_comyear = "0000"
-                    print ("cm?: " + str(cn))
-                    if issue is not '999999':
-                        comiss = issue
-                    else:
-                        logger.ERROR("Invalid Issue number (none present) for " + comfilename)
-                        break
-                    cnsplit = cn.split()
-                    cname = ''
-                    findcn = 0
-                    while (findcn < len(cnsplit)):
-                        cname = cname + cs[findcn] + " "
-                        findcn+=1
-                    cname = cname[:len(cname)-1] # drop the end space...
-                    print ("assuming name is : " + cname)
-                    com_NAME = cname
-                    print ("com_NAME : " + com_NAME)
-                    yearmatch = "True"
-                else:
-                    # we're assuming that the year is in brackets (and it should be damnit)
-                    if m[cnt][:-2] == '19' or m[cnt][:-2] == '20':
-                        print ("year detected: " + str(m[cnt]))
-                        ydetected = 'yes'
-                        result_comyear = m[cnt]
-            cnt+=1
-
-        splitit = []
-        watchcomic_split = []
         logger.fdebug("filename comic and issue: " + cfilename)
-        #changed this from '' to ' '
-        comic_iss_b4 = re.sub('[\-\:\,]', ' ', com_NAME)
-        comic_iss = comic_iss_b4.replace('.',' ')
-        logger.fdebug("adjusted  comic and issue: " + str(comic_iss))
-        #remove 'the' from here for proper comparisons.
-        if ' the ' in comic_iss.lower():
-            comic_iss = comic_iss[-4:]
-        splitit = comic_iss.split(None)
-        logger.fdebug("adjusting from: " + str(comic_iss_b4) + " to: " + str(comic_iss))
-        #bmm = re.findall('v\d', comic_iss)
-        #if len(bmm) > 0: splitst = len(splitit) - 2
-        #else: splitst = len(splitit) - 1
-      #-----
-        #here we cycle through the Watchlist looking for a match.
-        while (cm_cn < watchcnt):
-            #setup the watchlist
-            comname = ComicName[cm_cn]
-            print ("watch_comic:" + comname)
-            comyear = ComicYear[cm_cn]
-            compub = ComicPublisher[cm_cn]
-            comtotal = ComicTotal[cm_cn]
-            comicid = ComicID[cm_cn]
-            watch_location = ComicLocation[cm_cn]
-
-#            if splitit[(len(splitit)-1)].isdigit():
-#                #compares - if the last digit and second last digit are #'s seperated by spaces assume decimal
-#                comic_iss = splitit[(len(splitit)-1)]
-#                splitst = len(splitit) - 1
-#                if splitit[(len(splitit)-2)].isdigit():
-#                    # for series that have a digit at the end, it screws up the logistics.
-#                    i = 1
-#                    chg_comic = splitit[0]
-#                    while (i < (len(splitit)-1)):
-#                        chg_comic = chg_comic + " " + splitit[i]
-#                        i+=1
-#                    logger.fdebug("chg_comic:" + str(chg_comic))
-#                    if chg_comic.upper() == comname.upper():
-#                        logger.fdebug("series contains numerics...adjusting..")
-#                    else:
-#                        changeup = "." + splitit[(len(splitit)-1)]
-#                        logger.fdebug("changeup to decimal: " + str(changeup))
-#                        comic_iss = splitit[(len(splitit)-2)] + "." + comic_iss
-#                        splitst = len(splitit) - 2
-#            else:
-              # if the nzb name doesn't follow the series-issue-year format even closely..ignore nzb
-#               logger.fdebug("invalid naming format of filename detected - cannot properly determine issue")
-#               continue
-
-            # make sure that things like - in watchcomic are accounted for when comparing to nzb.
-
-   # there shouldn't be an issue in the comic now, so let's just assume it's all gravy.
-            splitst = len(splitit)
-            watchcomic_split = helpers.cleanName(comname)
-            watchcomic_split = re.sub('[\-\:\,\.]', ' ', watchcomic_split).split(None)
-
-            logger.fdebug(str(splitit) + " file series word count: " + str(splitst))
-            logger.fdebug(str(watchcomic_split) + " watchlist word count: " + str(len(watchcomic_split)))
-            if (splitst) != len(watchcomic_split):
-                logger.fdebug("incorrect comic lengths...not a match")
-#                if str(splitit[0]).lower() == "the":
-#                    logger.fdebug("THE word detected...attempting to adjust pattern matching")
-#                    splitit[0] = splitit[4:]
-            else:
-                logger.fdebug("length match..proceeding")
-                n = 0
-                scount = 0
-                logger.fdebug("search-length: " + str(splitst))
-                logger.fdebug("Watchlist-length: " + str(len(watchcomic_split)))
-                while ( n <= (splitst)-1 ):
-                    logger.fdebug("splitit: " + str(splitit[n]))
-                    if n < (splitst) and n < len(watchcomic_split):
-                        logger.fdebug(str(n) + " Comparing: " + str(watchcomic_split[n]) + " .to. " + str(splitit[n]))
-                        if '+' in watchcomic_split[n]:
-                            watchcomic_split[n] = re.sub('+', '', str(watchcomic_split[n]))
-                        if str(watchcomic_split[n].lower()) in str(splitit[n].lower()) and len(watchcomic_split[n]) >= len(splitit[n]):
-                            logger.fdebug("word matched on : " + str(splitit[n]))
-                            scount+=1
-                        #elif ':' in splitit[n] or '-' in splitit[n]:
-                        #    splitrep = splitit[n].replace('-', '')
-                        #    print ("non-character keyword...skipped on " + splitit[n])
-                    elif str(splitit[n]).lower().startswith('v'):
-                        logger.fdebug("possible versioning..checking")
-                        #we hit a versioning # - account for it
-                        if splitit[n][1:].isdigit():
-                            comicversion = str(splitit[n])
-                            logger.fdebug("version found: " + str(comicversion))
-                    else:
-                        logger.fdebug("Comic / Issue section")
-                        if splitit[n].isdigit():
-                            logger.fdebug("issue detected")
-                            #comiss = splitit[n]
-#                            comicNAMER = n - 1
-#                            com_NAME = splitit[0]
-#                           cmnam = 1
-#                            while (cmnam <= comicNAMER):
-#                                com_NAME = str(com_NAME) + " " + str(splitit[cmnam])
-#                                cmnam+=1
-#                            logger.fdebug("comic: " + str(com_NAME))
-                        else:
-                            logger.fdebug("non-match for: "+ str(splitit[n]))
-                            pass
-                    n+=1
-                #set the match threshold to 80% (for now)
-                # if it's less than 80% consider it a non-match and discard.
-                #splitit has to splitit-1 because last position is issue.
-                wordcnt = int(scount)
-                logger.fdebug("scount:" + str(wordcnt))
-                totalcnt = int(splitst)
-                logger.fdebug("splitit-len:" + str(totalcnt))
-                spercent = (wordcnt/totalcnt) * 100
-                logger.fdebug("we got " + str(spercent) + " percent.")
-                if int(spercent) >= 80:
-                    logger.fdebug("it's a go captain... - we matched " + str(spercent) + "%!")
-                    logger.fdebug("this should be a match!")
-#                    if '.' in comic_iss:
-#                        comisschk_find = comic_iss.find('.')
-#                        comisschk_b4dec = comic_iss[:comisschk_find]
-#                        comisschk_decval = comic_iss[comisschk_find+1:]
-#                        logger.fdebug("Found IssueNumber: " + str(comic_iss))
-#                        logger.fdebug("..before decimal: " + str(comisschk_b4dec))
-#                        logger.fdebug("...after decimal: " + str(comisschk_decval))
-#                        #--let's make sure we don't wipe out decimal issues ;)
-#                        if int(comisschk_decval) == 0:
-#                            ciss = comisschk_b4dec
-#                            cintdec = int(comisschk_decval)
-#                        else:
-#                            if len(comisschk_decval) == 1:
-#                                ciss = comisschk_b4dec + "." + comisschk_decval
-#                                cintdec = int(comisschk_decval) * 10
-#                            else:
-#                                ciss = comisschk_b4dec + "." + comisschk_decval.rstrip('0')
-#                                cintdec = int(comisschk_decval.rstrip('0')) * 10
-#                        comintIss = (int(comisschk_b4dec) * 1000) + cintdec
-#                    else:
-#                        comintIss = int(comic_iss) * 1000
-                    logger.fdebug("issue we found for is : " + str(comiss))
-                    #set the year to the series we just found ;)
-                    result_comyear = comyear
-                    #issue comparison now as well
-                    logger.info(u"Found " + comname + " (" + str(comyear) + ") issue: " + str(comiss))
-#                    watchfound+=1
-                    watchmatch = str(comicid)
-#                    watch_kchoice.append({
-#                       "ComicID":         str(comicid),
-#                       "ComicName":       str(comname),
-#                       "ComicYear":       str(comyear),
-#                       "ComicIssue":      str(int(comic_iss)),
-#                       "ComicLocation":   str(watch_location),
-#                       "OriginalLocation" : str(comlocation),
-#                       "OriginalFilename" : str(comfilename)
-#                                        })
-                    foundonwatch = "True"
-                    break
-                elif int(spercent) < 80:
-                    logger.fdebug("failure - we only got " + str(spercent) + "% right!")
-            cm_cn+=1
-
-        if foundonwatch == "False":
-            watchmatch = None
+        #a straight lookup of the series name against the names (and alternate names) being watched.
+        watchmatch = None
+        watchids = nameindex.lookup(com_NAME)
+        if len(watchids) > 1 and result_comyear is not None:
+            #same name, different volumes - the one that started the year the file's from is the best guess.
+            yearids = [cid for cid in watchids if str((nameindex.info(cid) or {}).get('ComicYear')) == str(result_comyear)]
+            if yearids:
+                watchids = yearids
+        if watchids:
+            comicid = watchids[0]
+            watch = nameindex.info(comicid)
+            if watch is not None:
+                comname = watch['ComicName']
+                comyear = watch['ComicYear']
+                logger.fdebug("issue we found for is : " + str(comiss))
+                #set the year to the series we just found ;)
+                result_comyear = comyear
+                logger.info(u"Found " + comname + " (" + str(comyear) + ") issue: " + str(comiss))
+                watchmatch = str(comicid)
+        else:
+            logger.fdebug("no series on the watchlist by the name of " + com_NAME)
         #---if it's not a match - send it to the importer.
         n = 0
 #        print ("comic_andiss : " + str(comic_andiss))
@@ -418,9 +220,8 @@ def libraryScan(dir=None, append=False, ComicID=None, ComicName=None, cron=None)
 #                logger.fdebug("comic: " + str(com_NAME))
 #            n+=1
         if result_comyear is None: result_comyear = '0000' #no year in filename basically.
-        print ("adding " + com_NAME + " to the import-queue!")
         impid = com_NAME + "-" + str(result_comyear) + "-" + str(comiss)
-        print ("impid: " + str(impid))
+        logger.fdebug("adding " + com_NAME + " to the import-queue as " + impid)
         import_by_comicids.append({ 
             "impid": impid,
             "watchmatch": watchmatch,
@@ -506,7 +307,27 @@ def libraryScan(dir=None, append=False, ComicID=None, ComicName=None, cron=None)
                     updater.forceRescan(c) 
         if not len(import_by_comicids):
             return "Completed"
+    #the manifest only gets updated once the new / changed files have made it this far.
+    myDB.bulk_upsert("librarymanifest", manifestupd, ["ComicLocation"])
+
     if len(import_by_comicids) > 0:
         import_comicids['comic_info'] = import_by_comicids
-        print ("import comicids: " + str(import_by_comicids))
+        logger.fdebug(str(len(import_by_comicids)) + " comics queued for import.")
         return import_comicids, len(import_by_comicids)
+    return "Completed", 0
+
+def storeImports(import_comicids):
+    #the results of a libraryScan go into importresults, for the Import Results page.
+    myDB = db.DBConnection()
+    importrows = []
+    for soma_sl in import_comicids['comic_info']:
+        importrows.append({"impID":            soma_sl['impid'],
+                           "ComicYear":        soma_sl['comicyear'],
+                           "Status":           "Not Imported",
+                           "ComicName":        soma_sl['comicname'].encode('utf-8'),
+                           "ComicFilename":    soma_sl['comfilename'].encode('utf-8'),
+                           "ComicLocation":    soma_sl['comlocation'].encode('utf-8'),
+                           "ImportDate":       helpers.today(),
+                           "WatchMatch":       soma_sl['watchmatch']})
+    #one transaction for the lot, rather than a commit per file.
+    myDB.bulk_upsert("importresults", importrows, ["impID"])
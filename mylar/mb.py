@@ -18,10 +18,9 @@ from __future__ import with_statement
 import time
 import threading
 import urllib2
-from xml.dom.minidom import parseString, Element
 
 import mylar
-from mylar import logger, db, cv
+from mylar import logger, db, cv, cvcache
 from mylar.helpers import multikeysort, replace_all, cleanName
 
 mb_lock = threading.Lock()
@@ -32,19 +31,20 @@ def pullsearch(comicapi,comicquery,offset):
     PULLURL = mylar.CVURL + 'search?api_key=' + str(comicapi) + '&resources=volume&query=' + u_comicquery + '&field_list=id,name,start_year,site_detail_url,count_of_issues,image,publisher,description&format=xml&page=' + str(offset)
 
     #all these imports are standard on most modern python implementations
-    #download the file:
+    #download the file (or pick it up from the cache):
     try:
-        file = urllib2.urlopen(PULLURL)
+        file = cvcache.urlopen(PULLURL)
     except urllib2.HTTPError, err:
         logger.error("There was a major problem retrieving data from ComicVine - on their end. You'll have to try again later most likely.")
         return        
-    #convert to string:
-    data = file.read()
-    #close file because we dont need it anymore:
-    file.close()
-    #parse the xml you downloaded
-    dom = parseString(data)
-    return dom
+    if file is None:
+        logger.error('ComicVine request limit reached - unable to search for ' + comicquery)
+        return
+    #parse the volumes as they're read in.
+    try:
+        return cv.GetRecords(file,'volume')
+    finally:
+        file.close()
 
 def findComic(name, mode, issue, limityear=None):
 
@@ -66,26 +66,28 @@ def findComic(name, mode, issue, limityear=None):
     #let's find out how many results we get from the query...    
     searched = pullsearch(comicapi,comicquery,1)
     if searched is None: return False
-    totalResults = searched.getElementsByTagName('number_of_total_results')[0].firstChild.wholeText
+    totalResults, comicResults = searched
     #print ("there are " + str(totalResults) + " search results...")
     if not totalResults:
         return False
+    #pull the remaining pages at the same time, then work through them in order.
+    pages = cv.pullpages(lambda offsetcount: pullsearch(comicapi,comicquery,offsetcount), range(2, ((int(totalResults)-1)/100) + 2))
     countResults = 0
     while (countResults < int(totalResults)):
         #print ("querying " + str(countResults))
         if countResults > 0:
             #new api - have to change to page # instead of offset count
             offsetcount = (countResults/100) + 1
-            searched = pullsearch(comicapi,comicquery,offsetcount)
-        comicResults = searched.getElementsByTagName('volume')
+            searched = pages.get(offsetcount)
+            if searched is None: break
+            comicResults = searched[1]
         body = ''
         n = 0        
         if not comicResults:
            break        
         for result in comicResults:
-                #retrieve the first xml tag (<tag>data</tag>)
-                #that the parser finds with name tagName:
-                xmlcnt = result.getElementsByTagName('count_of_issues')[0].firstChild.wholeText
+                #each result is a flat record of the volume's fields (see cv.GetRecords)
+                xmlcnt = result.get('count_of_issues')
                 #here we can determine what called us, and either start gathering all issues or just limited ones.
                 #print ("n: " + str(n) + "--xmcnt" + str(xmlcnt))
                 if issue is not None and str(issue).isdigit():
@@ -95,30 +97,25 @@ def findComic(name, mode, issue, limityear=None):
                 else: limiter = 0
                 if int(xmlcnt) >= limiter:
                     
-                    xmlTag = result.getElementsByTagName('name')[0].firstChild.wholeText
-                    if (result.getElementsByTagName('start_year')[0].firstChild) is not None:
-                        xmlYr = result.getElementsByTagName('start_year')[0].firstChild.wholeText
+                    xmlTag = result.get('name')
+                    if result.get('start_year') is not None:
+                        xmlYr = result['start_year']
                     else: xmlYr = "0000"
                     if xmlYr in limityear or limityear == 'None':
-                        xmlurl = result.getElementsByTagName('site_detail_url')[0].firstChild.wholeText
-                        xmlid = result.getElementsByTagName('id')[0].firstChild.wholeText
-                        publishers = result.getElementsByTagName('publisher')
-                        if len(publishers) > 0:
-                            pubnames = publishers[0].getElementsByTagName('name')
-                            if len(pubnames) >0:
-                                xmlpub = pubnames[0].firstChild.wholeText
-                            else:
-                                xmlpub = "Unknown"
+                        xmlurl = result.get('site_detail_url')
+                        xmlid = result.get('id')
+                        if result.get('publisher.name'):
+                            xmlpub = result['publisher.name']
                         else:
                             xmlpub = "Unknown"
-                        if (result.getElementsByTagName('name')[0].childNodes[0].nodeValue) is None:
-                            xmlimage = result.getElementsByTagName('super_url')[0].firstChild.wholeText
+                        if xmlTag is None:
+                            xmlimage = result.get('image.super_url')
                         else:
                             xmlimage = "cache/blankcover.jpg"            
 
-                        try:
-                            xmldesc = result.getElementsByTagName('description')[0].firstChild.wholeText
-                        except:
+                        if result.get('description'):
+                            xmldesc = result['description']
+                        else:
                             xmldesc = "None"
                         comiclist.append({
                                 'name':             xmlTag,
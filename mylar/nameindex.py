@@ -0,0 +1,161 @@
+#  This file is part of Mylar.
+#
+#  Mylar is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Mylar is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Mylar.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import with_statement
+
+import re
+import threading
+
+from mylar import db, logger
+
+# In-memory index of the watchlist's series names, shared by the things that have to find which
+# series a name belongs to (rss, library import, the pull-list..). Every series name and alternate
+# name is normalized once - lowercased, 'and'/'the' dropped, punctuation folded to spaces - and
+# mapped to the ComicIDs that carry it, so a match is a dict lookup instead of re-cleaning the
+# whole watchlist for every title.
+#
+# Built on startup (build), kept current as series get added / refreshed / edited (update) and
+# deleted (remove).
+
+ANDTHE = re.compile("\\b(and|the)\\b")
+NONWORD = re.compile("[\\W_]+", re.UNICODE)
+
+index_lock = threading.Lock()
+# normalized name -> set of ComicIDs
+names = {}
+# ComicID -> {'ComicName', 'ComicYear', 'AlternateSearch', 'Alternates', 'Names'}
+series = {}
+built = False
+
+
+def normalize(name):
+
+    if name is None:
+        return ''
+    if isinstance(name, str):
+        name = name.decode('utf-8', 'replace')
+    normalized = ANDTHE.sub(" ", name.lower())
+    normalized = NONWORD.sub(" ", normalized)
+    return normalized.strip()
+
+def alternates(AlternateSearch):
+
+    if AlternateSearch is None or AlternateSearch == 'None':
+        return []
+    return [alt for alt in AlternateSearch.split('##') if alt.strip()]
+
+def seriesNames(ComicName, AlternateSearch=None):
+    #the normalized names a series goes by - its own name first, then the alternates.
+    seriesnames = []
+    for name in [ComicName] + alternates(AlternateSearch):
+        normalized = normalize(name)
+        if normalized and normalized not in seriesnames:
+            seriesnames.append(normalized)
+    return seriesnames
+
+def _add(comic):
+
+    comicid = comic['ComicID']
+    entry = {'ComicName':       comic['ComicName'],
+             'ComicYear':       comic['ComicYear'],
+             'AlternateSearch': comic['AlternateSearch'],
+             'Alternates':      alternates(comic['AlternateSearch']),
+             'Names':           seriesNames(comic['ComicName'], comic['AlternateSearch'])}
+    series[comicid] = entry
+    for name in entry['Names']:
+        names.setdefault(name, set()).add(comicid)
+
+def _remove(comicid):
+
+    entry = series.pop(comicid, None)
+    if entry is None:
+        return
+    for name in entry['Names']:
+        ids = names.get(name)
+        if ids is not None:
+            ids.discard(comicid)
+            if not ids:
+                del names[name]
+
+def build():
+
+    global built
+    myDB = db.DBConnection()
+    watchlist = myDB.select("SELECT ComicID, ComicName, ComicYear, AlternateSearch FROM comics WHERE ComicName IS NOT NULL AND ComicName != 'None'")
+    with index_lock:
+        names.clear()
+        series.clear()
+        for comic in watchlist:
+            _add(comic)
+        built = True
+    logger.fdebug('Indexed ' + str(len(names)) + ' names for ' + str(len(series)) + ' series.')
+
+def update(comicid):
+    #(re)load a series after it's been added, refreshed or had its alternate names changed.
+    if not built:
+        return
+    myDB = db.DBConnection()
+    comic = myDB.action("SELECT ComicID, ComicName, ComicYear, AlternateSearch FROM comics WHERE ComicID=?", [comicid]).fetchone()
+    with index_lock:
+        _remove(comicid)
+        if comic is not None and comic['ComicName'] is not None and comic['ComicName'] != 'None':
+            _add(comic)
+
+def remove(comicid):
+
+    with index_lock:
+        _remove(comicid)
+
+def ensure():
+    #anything that runs before start() (ie. a manual post-process from the api) gets the index built on first use.
+    if not built:
+        build()
+
+def info(comicid):
+    #the index entry for a series, or None if it's not on the watchlist.
+    ensure()
+    with index_lock:
+        return series.get(comicid)
+
+def lookup(name):
+    #the ComicIDs of the series (or alternate names) that normalize to exactly name.
+    ensure()
+    with index_lock:
+        return sorted(names.get(normalize(name), ()))
+
+def match(title):
+    #the series whose name the title starts with - the longest name wins, so 'batman and robin 5'
+    #comes back as batman and robin, not batman. Returns (ComicIDs, the normalized name matched).
+    ensure()
+    words = normalize(title).split()
+    with index_lock:
+        for x in range(len(words), 0, -1):
+            ids = names.get(' '.join(words[:x]))
+            if ids:
+                return sorted(ids), ' '.join(words[:x])
+    return [], None
+
+def matchAll(title):
+    #every series whose name (or alternate name) the title starts with, longest name first - for when
+    #the shorter names still need a look (ie. a file that could be batman and robin 5 or batman 5).
+    ensure()
+    words = normalize(title).split()
+    found = []
+    with index_lock:
+        for x in range(len(words), 0, -1):
+            for comicid in sorted(names.get(' '.join(words[:x]), ())):
+                if comicid not in found:
+                    found.append(comicid)
+    return found
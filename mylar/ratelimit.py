@@ -0,0 +1,161 @@
+#  This file is part of Mylar.
+#
+#  Mylar is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  Mylar is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with Mylar.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import with_statement
+
+import datetime
+import threading
+import time
+
+import mylar
+from mylar import logger
+
+# Request budgets for the remote sites we talk to (indexers, torrent/rss sites, ComicVine).
+# Each provider gets a token bucket - requests/minute, a burst size and an optional daily cap -
+# shared by everything that hits that provider (api searches, rss feeds, series lookups).
+#
+# RATE_LIMITS in the config overrides the defaults, ie.
+#   rate_limits = nzb.su:2/5/100;dognzb:1/3/0;comicvine:20/5/0
+# as provider:requests per minute/burst/daily cap (0 = no cap).
+
+# ComicVine: 20 requests/minute (one every 3 seconds) with a burst of 5. Its hard limit is about 1/sec,
+# but it also throttles anything that keeps close to that, so a full watchlist refresh runs at a third of it.
+DEFAULT_LIMITS = {'comicvine':    (20, 5, 0),
+                  'KAT':          (6, 2, 0),
+                  'CBT':          (6, 2, 0),
+                  'experimental': (6, 2, 0)}
+
+# zero-padding variants of a search go out back to back, so let those through before limiting.
+DEFAULT_BURST = 3
+
+buckets_lock = threading.Lock()
+buckets = {}
+configured = None
+
+
+class TokenBucket:
+
+    def __init__(self, name, rate, burst, daily):
+
+        self.name = name
+        self.lock = threading.Lock()
+        self.day = datetime.date.today()
+        self.used = 0
+        self.configure(rate, burst, daily)
+        self.tokens = float(self.burst)
+        self.stamp = time.time()
+
+    def configure(self, rate, burst, daily):
+
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self.daily = int(daily)
+
+    def reserve(self):
+        #take a token - returns how long to wait before using it, or None if the daily cap is spent.
+        with self.lock:
+            today = datetime.date.today()
+            if today != self.day:
+                self.day = today
+                self.used = 0
+            if self.daily > 0 and self.used >= self.daily:
+                return None
+
+            now = time.time()
+            if self.rate <= 0:
+                self.tokens = float(self.burst)
+            else:
+                self.tokens = min(float(self.burst), self.tokens + ((now - self.stamp) * self.rate / 60))
+            self.stamp = now
+            self.tokens -= 1
+            self.used += 1
+
+            if self.tokens >= 0 or self.rate <= 0:
+                return 0
+            #tokens can go negative - each waiter queues up behind the ones before it.
+            return -self.tokens * 60 / self.rate
+
+    def refund(self):
+        #hand back a token that was reserved but never used (ie. the search got cancelled).
+        with self.lock:
+            self.tokens = min(float(self.burst), self.tokens + 1)
+            self.used = max(0, self.used - 1)
+
+
+def parseLimits(limits):
+
+    parsed = {}
+    if limits is None:
+        return parsed
+    for limit in str(limits).split(';'):
+        if ':' not in limit:
+            continue
+        name, budget = limit.rsplit(':', 1)
+        try:
+            values = [int(x) for x in budget.split('/')]
+        except ValueError:
+            logger.warn('Invalid rate limit given for ' + name.strip() + ' : ' + budget + ' - ignoring.')
+            continue
+        values += [DEFAULT_BURST, 0][len(values) - 1:]
+        parsed[name.strip().lower()] = tuple(values[:3])
+    return parsed
+
+def budget(provider, overrides):
+
+    if provider.lower() in overrides:
+        return overrides[provider.lower()]
+    if provider in DEFAULT_LIMITS:
+        return DEFAULT_LIMITS[provider]
+    #indexers default to the old search delay - one request every SEARCH_DELAY minutes, after the burst.
+    try:
+        delay = int(mylar.SEARCH_DELAY)
+    except (TypeError, ValueError):
+        delay = 1
+    return (1.0 / max(1, delay), DEFAULT_BURST, 0)
+
+def getBucket(provider):
+
+    global configured
+    with buckets_lock:
+        overrides = parseLimits(mylar.RATE_LIMITS)
+        #settings changed - reconfigure the existing buckets without losing what's been used.
+        current = (mylar.RATE_LIMITS, mylar.SEARCH_DELAY)
+        if current != configured:
+            configured = current
+            for name, bucket in buckets.items():
+                bucket.configure(*budget(name, overrides))
+        bucket = buckets.get(provider)
+        if bucket is None:
+            bucket = buckets[provider] = TokenBucket(provider, *budget(provider, overrides))
+        return bucket
+
+def wait(provider, cancel=None):
+    #block until the provider has budget for another request. Returns False if the daily cap
+    #has been reached, or if cancel (a threading.Event) got set while waiting.
+    bucket = getBucket(provider)
+    delay = bucket.reserve()
+    if delay is None:
+        logger.warn('Daily request limit of ' + str(bucket.daily) + ' reached for ' + str(provider) + ' - not sending any more requests until tomorrow.')
+        return False
+    if delay > 0:
+        logger.info('pausing for ' + str(int(delay)) + ' seconds before querying ' + str(provider) + ' to stay within its request limit.')
+        if cancel is not None:
+            cancel.wait(delay)
+            if cancel.isSet():
+                bucket.refund()
+                return False
+        else:
+            time.sleep(delay)
+    return True
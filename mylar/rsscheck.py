@@ -6,11 +6,24 @@ import lib.feedparser as feedparser
 import urllib2
 import ftpsshup
 import datetime
+import calendar
+import time
 import gzip
+import hashlib
+import threading
 from StringIO import StringIO
 
 import mylar
-from mylar import db, logger, ftpsshup, helpers
+from mylar import db, logger, ftpsshup, helpers, ratelimit, nameindex, fileparser
+
+# set once the whole Wanted list has been checked against the rss cache since startup.
+rss_swept = False
+
+# seconds an rss check waits on the feeds - anything slower gets left for the next check.
+FEED_TIMEOUT = 60
+# feeds still being pulled (so a hung one doesn't get asked for again every check).
+feeds_lock = threading.Lock()
+feeds_inflight = set()
 
 def tehMain():
     logger.info('RSS Feed Check was last run at : ' + str(mylar.RSS_LASTRUN))
@@ -35,281 +48,375 @@ def tehMain():
     mylar.config_write()
 
     #function for looping through nzbs/torrent feeds
-    if mylar.ENABLE_TORRENTS:
-        logger.fdebug("[RSS] Initiating Torrent RSS Check.")
-        if mylar.ENABLE_KAT:
-            logger.fdebug('[RSS] Initiating Torrent RSS Feed Check on KAT.')
-            torrents(pickfeed='3')
-        if mylar.ENABLE_CBT:
-            logger.fdebug('[RSS] Initiating Torrent RSS Feed Check on CBT.')
-            torrents(pickfeed='1')
-            torrents(pickfeed='4')
-    logger.fdebug('RSS] Initiating RSS Feed Check for NZB Providers.')
-    nzbs()    
+    #the torrent & nzb feeds all get pulled at the same time.
+    logger.fdebug('[RSS] Initiating RSS Feed Check for Torrent & NZB Providers.')
+    newentries = pullFeeds(torrentFeeds() + nzbFeeds())
     logger.fdebug('[RSS] RSS Feed Check/Update Complete')
     logger.fdebug('[RSS] Watchlist Check for new Releases')
-    #if mylar.ENABLE_TORRENTS:
-    #    if mylar.ENABLE_KAT:
-    #        search.searchforissue(rsscheck='yes')
-    #    if mylar.ENABLE_CBT:    
-    mylar.search.searchforissue(rsscheck='yes')
-    #nzbcheck here
-    #nzbs(rsscheck='yes')
+    global rss_swept
+    if not rss_swept:
+        #first check since startup - anything marked Wanted while we were down could already be sitting
+        #in the rss cache, so go over the whole wanted list once.
+        mylar.search.searchforissue(rsscheck='yes')
+        rss_swept = True
+    else:
+        #after that only the entries that just came in can turn up something new.
+        rssmatch(newentries)
     logger.fdebug('[RSS] Watchlist Check complete.')
     return
 
-def torrents(pickfeed=None,seriesname=None,issue=None):
-    if pickfeed is None:
-        pickfeed = 1
-    #else:
-    #    print "pickfeed is " + str(pickfeed)
-    passkey = mylar.CBT_PASSKEY 
-    srchterm = None
-
-    if seriesname:
-        srchterm = re.sub(' ', '%20', seriesname)
-    if issue:
-        srchterm += ' ' + str(issue)
+def wantedIndex(myDB):
+    #normalized series name (and alternate names) -> issue # (as issuedigits) -> wanted IssueIDs.
+    #annuals go in under '<series> annual'.
+    wanted = {}
+    for record in mylar.search.issue_records(myDB, annuals=mylar.ANNUALS_ON):
+        try:
+            issdigits = helpers.issuedigits(str(record['Issue_Number']))
+        except Exception:
+            continue
+        for name in nameindex.seriesNames(record['ComicName'], record['AlternateSearch']):
+            if record['mode'] == 'want_ann':
+                name += ' annual'
+            wanted.setdefault(name, {}).setdefault(issdigits, []).append(record['IssueID'])
+    return wanted
+
+def rssmatch(entries):
+    #match the new rss entries against what's Wanted (rather than every Wanted issue against the rss cache) -
+    #anything that looks like a wanted issue gets the regular rss search, for just that issue.
+    if not entries:
+        logger.fdebug('[RSS] No new entries to check against the Wanted list.')
+        return
+    myDB = db.DBConnection()
+    wanted = wantedIndex(myDB)
+    if not wanted:
+        return
 
+    hits = []
+    for entry in entries:
+        #CBT titles carry the format after a '/', nzb titles tend to use . for spaces (but not in 1.5)
+        title = entry['Title'].split('/')[0]
+        title = re.sub('(?<!\d)\.|\.(?!\d)', ' ', title.replace('_', ' '))
+        if isinstance(title, unicode):
+            title = title.encode('utf-8', 'replace')
+        parsed = fileparser.parseFilename(title)
+        if parsed.issue is None:
+            continue
+        issues = wanted.get(nameindex.normalize(parsed.series))
+        if not issues:
+            continue
+        try:
+            issdigits = helpers.issuedigits(parsed.issue)
+        except Exception:
+            continue
+        for issueid in issues.get(issdigits, []):
+            if issueid not in hits:
+                logger.fdebug('[RSS] ' + entry['Title'] + ' looks to be a Wanted issue (IssueID: ' + str(issueid) + ')')
+                hits.append(issueid)
+
+    logger.info('[RSS] ' + str(len(entries)) + ' new entries checked - ' + str(len(hits)) + ' possible Wanted issues.')
+    if hits:
+        mylar.search.searchIssueIDList(hits, rsscheck='yes')
+
+def torrentFeed(pickfeed):
+    #the KAT / CBT rss feeds that get cached in rssdb.
+    passkey = mylar.CBT_PASSKEY
     if pickfeed == "1":      # cbt rss feed based on followlist
-        feed = "http://comicbt.com/rss.php?action=browse&passkey=" + str(passkey) + "&type=dl"
-    elif pickfeed == "2" and srchterm is not None:    # kat.ph search
-        feed = "http://kat.ph/usearch/" + str(srchterm) + "%20category%3Acomics%20seeds%3A1/?rss=1"
+        return {'name': 'CBT-browse',
+                'url':  "http://comicbt.com/rss.php?action=browse&passkey=" + str(passkey) + "&type=dl",
+                'site': 'CBT',
+                'type': 'torrent'}
     elif pickfeed == "3":    # kat.ph rss feed
-        feed = "http://kat.ph/usearch/category%3Acomics%20seeds%3A1/?rss=1"
+        return {'name': 'KAT',
+                'url':  "http://kat.ph/usearch/category%3Acomics%20seeds%3A1/?rss=1",
+                'site': 'KAT',
+                'type': 'torrent'}
     elif pickfeed == "4":    #cbt follow link
-        feed = "http://comicbt.com/rss.php?action=follow&passkey=" + str(passkey) + "&type=dl"
-    elif pickfeed == "5":    # cbt series link
-#       seriespage = "http://comicbt.com/series.php?passkey=" + str(passkey)
-        feed = "http://comicbt.com/rss.php?action=series&series=" + str(seriesno) + "&passkey=" + str(passkey)
-    else:
-        logger.error('invalid pickfeed denoted...')
-        return
+        return {'name': 'CBT-follow',
+                'url':  "http://comicbt.com/rss.php?action=follow&passkey=" + str(passkey) + "&type=dl",
+                'site': 'CBT',
+                'type': 'torrent'}
+    return None
 
-    title = []
-    link = []
-    description = []
-    seriestitle = []
+def torrentFeeds():
 
-    if pickfeed == "5": # we need to get the series # first
-        seriesSearch(seriespage, seriesname)
-    feedme = feedparser.parse(feed)
-    i = 0
-
-    feeddata = []
-
-    myDB = db.DBConnection()
-    torthekat = []
-    katinfo = {}
-
-    for entry in feedme['entries']:
-        if pickfeed == "3":
-            tmpsz = feedme.entries[i].enclosures[0]
-            feeddata.append({
-                           'Site':     'KAT',
-                           'Title':    feedme.entries[i].title,
-                           'Link':     tmpsz['url'],
-                           'Pubdate':  feedme.entries[i].updated,
-                           'Size':     tmpsz['length']
-                           })
+    feeds = []
+    if mylar.ENABLE_TORRENTS:
+        if mylar.ENABLE_KAT:
+            feeds.append(torrentFeed('3'))
+        if mylar.ENABLE_CBT:
+            feeds.append(torrentFeed('1'))
+            feeds.append(torrentFeed('4'))
+    return feeds
 
-        elif pickfeed == "2":
-            tmpsz = feedme.entries[i].enclosures[0]
-            torthekat.append({
-                          'title':   feedme.entries[i].title,
-                          'link':    tmpsz['url'],
-                          'pubdate': feedme.entries[i].updated,
-                          'site':    'KAT',
-                          'length':  tmpsz['length']
-                          })
-            #print ("Site: KAT")
-            #print ("Title: " + str(feedme.entries[i].title))
-            #print ("Link: " + str(tmpsz['url']))
-            #print ("pubdate: " + str(feedme.entries[i].updated))
-            #print ("size: " + str(tmpsz['length']))
-
-        elif pickfeed == "1" or pickfeed == "4":
-#            tmpsz = feedme.entries[i].enclosures[0]
-            feeddata.append({
-                           'Site':     'CBT',
-                           'Title':    feedme.entries[i].title, 
-                           'Link':     feedme.entries[i].link,
-                           'Pubdate':  feedme.entries[i].updated
-#                          'Size':     tmpsz['length']
-                           })
-            #print ("Site: CBT")
-            #print ("Title: " + str(feeddata[i]['Title']))
-            #print ("Link: " + str(feeddata[i]['Link']))
-            #print ("pubdate: " + str(feeddata[i]['Pubdate']))
-        i+=1
-    logger.fdebug('there were ' + str(i) + ' results..')
-    if not seriesname:
-        rssdbupdate(feeddata,i,'torrent')
-    else:
-        katinfo['entries'] = torthekat
-        return katinfo
-    return
+def nzbFeeds():
 
-def nzbs(provider=None):
-    nzbprovider = []
-    nzbp = 0
+    feeds = []
     if mylar.NZBSU == 1:
-        nzbprovider.append('nzb.su')
-        nzbp+=1
+        if mylar.NZBSU_UID is None:
+            mylar.NZBSU_UID = '1'
+        feeds.append({'name': 'nzb.su',
+                      'url':  'http://nzb.su/rss?t=7030&dl=1&i=' + mylar.NZBSU_UID + '&r=' + mylar.NZBSU_APIKEY,
+                      'site': 'nzb.su',
+                      'type': 'usenet'})
     if mylar.DOGNZB == 1:
-        nzbprovider.append('dognzb')
-        nzbp+=1
+        if mylar.DOGNZB_UID is None:
+            mylar.DOGNZB_UID = '1'
+        feeds.append({'name': 'dognzb',
+                      'url':  'http://dognzb.cr/rss?t=7030&dl=1&i=' + mylar.DOGNZB_UID + '&r=' + mylar.DOGNZB_APIKEY,
+                      'site': 'dognzb',
+                      'type': 'usenet'})
     # --------
     #  Xperimental
     if mylar.EXPERIMENTAL == 1:
-        nzbprovider.append('experimental')
-        nzbp+=1
-
-    newznabs = 0
-
-    newznab_hosts = []
+        feeds.append({'name': 'experimental',
+                      'url':  "http://nzbindex.nl/rss/alt.binaries.comics.dcp/?sort=agedesc&max=50&more=1",
+                      'site': 'experimental',
+                      'type': 'usenet'})
 
     if mylar.NEWZNAB == 1:
-
         for newznab_host in mylar.EXTRA_NEWZNABS:
             if newznab_host[4] == '1' or newznab_host[4] == 1:
-                newznab_hosts.append(newznab_host)
-                nzbprovider.append('newznab')
-                newznabs+=1
                 logger.fdebug('newznab name:' + str(newznab_host[0]) + ' - enabled: ' + str(newznab_host[4]))
+                if newznab_host[3] is None:
+                    newznabuid = '1'
+                else:
+                    newznabuid = newznab_host[3]
+                site = newznab_host[0].rstrip()
+                feeds.append({'name': site,
+                              'url':  newznab_host[1].rstrip() + '/rss?t=7030&dl=1&i=' + str(newznabuid) + '&r=' + newznab_host[2].rstrip(),
+                              'site': site,
+                              'type': 'usenet'})
+    logger.fdebug('there are : ' + str(len(feeds)) + ' RSS search providers you have enabled.')
+    return feeds
+
+def feedHash(url):
+    #validators only get reused for the same url (ie. not after an apikey change).
+    return hashlib.sha1(url).hexdigest()
+
+def fetchFeeds(feeds):
+    #pull every feed at once, each with the ETag / Last-Modified it last came back with. Returns
+    #(feed, parsed feed) for the feeds that changed - unchanged (304) ones are skipped, as is any feed
+    #that hasn't answered within FEED_TIMEOUT seconds (it's picked up again next time around).
+    validators = feedState()
+
+    results = {}
+    results_lock = threading.Lock()
+
+    def fetch(feed):
+        try:
+            etag = None
+            modified = None
+            known = validators.get(feed['name'])
+            if known is not None and known['URLHash'] == feedHash(feed['url']):
+                if known['ETag']:
+                    etag = str(known['ETag'])
+                if known['LastModified']:
+                    #comes back from the db as unicode, which feedparser won't take - hand it the parsed date.
+                    modified = feedparser._parse_date(str(known['LastModified']))
+            if not ratelimit.wait(feed['site']):
+                return
+            parsed = feedparser.parse(feed['url'], etag=etag, modified=modified)
+            if parsed.get('status') == 304:
+                logger.fdebug('[RSS] ' + feed['name'] + ' feed has not changed since it was last checked.')
+                return
+            if parsed.get('bozo') and not parsed.entries:
+                logger.warn('[RSS] Unable to retrieve the ' + feed['name'] + ' feed : ' + str(parsed.get('bozo_exception')))
+                if etag or modified:
+                    #don't let a bad validator keep the feed from ever being pulled - next time it's a plain GET.
+                    clearValidators(feed)
+                return
+            with results_lock:
+                results[feed['name']] = parsed
+        finally:
+            with feeds_lock:
+                feeds_inflight.discard(feed['name'])
+
+    threads = []
+    for feed in feeds:
+        with feeds_lock:
+            if feed['name'] in feeds_inflight:
+                logger.fdebug('[RSS] Still waiting on the last pull of the ' + feed['name'] + ' feed - skipping it this time.')
+                continue
+            feeds_inflight.add(feed['name'])
+        t = threading.Thread(target=fetch, args=[feed], name='RSS-' + feed['name'])
+        t.setDaemon(True)
+        t.start()
+        threads.append((feed, t))
 
-    # --------
-    providercount = int(nzbp + newznabs)
-    logger.fdebug('there are : ' + str(providercount) + ' RSS search providers you have enabled.')
-    nzbpr = providercount - 1
-    if nzbpr < 0:
-        nzbpr == 0
+    deadline = time.time() + FEED_TIMEOUT
+    for feed, t in threads:
+        t.join(max(0, deadline - time.time()))
+        if t.isAlive():
+            logger.warn('[RSS] The ' + feed['name'] + ' feed did not respond within ' + str(FEED_TIMEOUT) + ' seconds - not waiting on it.')
+
+    with results_lock:
+        return [(feed, results[feed['name']]) for feed, t in threads if feed['name'] in results]
+
+def clearValidators(feed):
+
+    myDB = db.DBConnection()
+    myDB.action("UPDATE rssfeeds SET ETag=NULL, LastModified=NULL WHERE Feed=?", [feed['name']])
 
+def feedState():
+    #what's known about each feed - validators, high-water mark, and the counts from its last pull.
+    myDB = db.DBConnection()
+    state = {}
+    for row in myDB.select("SELECT * FROM rssfeeds"):
+        state[row['Feed']] = row
+    return state
+
+def pubdate(entry):
+    #an entry's Pubdate as seconds since the epoch (None when it can't be read).
+    if not entry or not entry['Pubdate']:
+        return None
+    parsed = feedparser._parse_date(entry['Pubdate'])
+    if parsed is None:
+        return None
+    return calendar.timegm(parsed)
+
+def unseenEntries(feed, feeddata, known):
+    #the entries ahead of the feed's high-water mark. Feeds list the newest first, so everything from
+    #the last entry seen (or anything older than it) on has already been through here.
+    if known is None or not known['LastGUID'] or known['URLHash'] != feedHash(feed['url']):
+        return feeddata
+    markdate = None
+    if known['LastPubdate']:
+        markdate = pubdate({'Pubdate': known['LastPubdate']})
+    unseen = []
+    for entry in feeddata:
+        if entry['GUID'] == known['LastGUID']:
+            break
+        entrydate = pubdate(entry)
+        if markdate is not None and entrydate is not None and entrydate < markdate:
+            break
+        unseen.append(entry)
+    return unseen
+
+def saveFeed(feed, parsed, feeddata, ingested, skipped):
+    #validators, the new high-water mark (the newest entry in the feed) and the ingested / skipped counts.
+    headers = parsed.get('headers', {})
+    newValues = {"URLHash":      feedHash(feed['url']),
+                 "ETag":         parsed.get('etag'),
+                 "LastModified": headers.get('last-modified', headers.get('Last-Modified')),
+                 "LastChecked":  helpers.now(),
+                 "Ingested":     ingested,
+                 "Skipped":      skipped}
+    if feeddata:
+        newest = feeddata[0]
+        for entry in feeddata[1:]:
+            if pubdate(entry) > pubdate(newest):
+                newest = entry
+        newValues['LastGUID'] = newest['GUID']
+        newValues['LastPubdate'] = newest['Pubdate']
+    myDB = db.DBConnection()
+    myDB.upsert("rssfeeds", newValues, {"Feed": feed['name']})
+
+def feedData(feed, parsed):
+    #the feed's entries as rssdb rows (plus the GUID the high-water mark goes by).
     feeddata = []
-    feedthis = []
-    ft = 0
-    totNum = 0
-    nonexp = "no"
-   
-    while (nzbpr >= 0 ):
-        if nzbprovider[nzbpr] == 'experimental':
-            feed = feedparser.parse("http://nzbindex.nl/rss/alt.binaries.comics.dcp/?sort=agedesc&max=50&more=1")
-
-            totNum = len(feed.entries)
-            site = 'experimental'
-            keyPair = {}
-            regList = []
-            entries = []
-            mres = {}
-            countUp = 0
-
-            i = 0
-            for entry in feed['entries']:
-                tmpsz = feed.entries[i].enclosures[0]
-                feeddata.append({
-                               'Site':     site,
-                               'Title':    feed.entries[i].title,
-                               'Link':     feed.entries[i].link,
-                               'Pubdate':  feed.entries[i].updated,
-                               'Size':     tmpsz['length']
-                               })
-#                print ("Site:" + str(site))
-#                print ("Title:" + str(feed.entries[i].title))
-#                print ("Link:" + str(feed.entries[i].link))
-#                print ("Pubdate:" + str(feed.entries[i].updated))
-#                print ("Size:" + str(tmpsz['length']))
-                i+=1
-            logger.info(str(i) + ' results from Experimental feed indexed.')
-            nzbpr-=1
-        else:
-            if nzbprovider[nzbpr] == 'newznab':
-                for newznab_host in newznab_hosts:
-                    if newznab_host[3] is None:
-                        newznabuid = '1'
-                    else:
-                        newznabuid = newznab_host[3]
-                    feed = newznab_host[1].rstrip() + '/rss?t=7030&dl=1&i=' + str(newznabuid) + '&r=' + newznab_host[2].rstrip()
-                    feedme = feedparser.parse(feed)
-                    site = newznab_host[0].rstrip()
-                    feedthis.append({"feed":     feedme,
-                                     "site":     site})
-                    totNum+=len(feedme.entries)
-                    ft+=1
-                    nonexp = "yes"
-                    nzbpr-=1
-            elif nzbprovider[nzbpr] == 'nzb.su':
-                if mylar.NZBSU_UID is None:
-                    mylar.NZBSU_UID = '1'
-                feed = 'http://nzb.su/rss?t=7030&dl=1&i=' + mylar.NZBSU_UID + '&r=' + mylar.NZBSU_APIKEY
-                feedme = feedparser.parse(feed)
-                site = nzbprovider[nzbpr]
-                feedthis.append({"feed":   feedme,
-                                 "site":   site })
-                totNum+=len(feedme.entries)
-                ft+=1
-                nonexp = "yes"
-                nzbpr-=1
-            elif nzbprovider[nzbpr] == 'dognzb':
-                if mylar.DOGNZB_UID is None:
-                    mylar.DOGNZB_UID = '1'
-                feed = 'http://dognzb.cr/rss?t=7030&dl=1&i=' + mylar.DOGNZB_UID + '&r=' + mylar.DOGNZB_APIKEY
-                feedme = feedparser.parse(feed)
-                site = nzbprovider[nzbpr]
-                ft+=1
-                nonexp = "yes"
-                feedthis.append({"feed":   feedme,
-                                 "site":   site })
-                totNum+=len(feedme.entries)
-                nzbpr-=1
-
-    i = 0
-    if nonexp == "yes":
-        #print str(ft) + " sites checked. There are " + str(totNum) + " entries to be updated."
-        #print feedme
-        #i = 0
-
-        for ft in feedthis:
-            site = ft['site']
-            #print str(site) + " now being updated..."
-            for entry in ft['feed'].entries:
-                #print "entry: " + str(entry)
-                tmpsz = entry.enclosures[0]
-                feeddata.append({
-                           'Site':     site,
+    for entry in parsed.entries:
+        if feed['site'] == 'CBT':
+            #CBT rss doesn't have sizes
+            feeddata.append({
+                           'Site':     'CBT',
                            'Title':    entry.title,
                            'Link':     entry.link,
                            'Pubdate':  entry.updated,
-                           'Size':     tmpsz['length']
+                           'GUID':     entry.get('id', entry.link)
                            })
+        else:
+            tmpsz = entry.enclosures[0]
+            feeddata.append({
+                           'Site':     feed['site'],
+                           'Title':    entry.title,
+                           'Link':     tmpsz['url'] if feed['site'] == 'KAT' else entry.link,
+                           'Pubdate':  entry.updated,
+                           'Size':     tmpsz['length'],
+                           'GUID':     entry.get('id', entry.link)
+                           })
+    return feeddata
+
+def pullFeeds(feeds):
+    #fetch the feeds and store what's new in them - returns the entries that were new to rssdb.
+    state = feedState()
+    newentries = []
+    for feed, parsed in fetchFeeds(feeds):
+        try:
+            feeddata = feedData(feed, parsed)
+        except (AttributeError, IndexError, KeyError), e:
+            logger.warn('[RSS] Unable to read the ' + feed['name'] + ' feed : ' + str(e))
+            continue
+        unseen = unseenEntries(feed, feeddata, state.get(feed['name']))
+        ingested = rssdbupdate(unseen, len(unseen), feed['type'])
+        skipped = len(feeddata) - len(ingested)
+        logger.info('[RSS] ' + feed['name'] + ' : ingested ' + str(len(ingested)) + ' new / ' + str(skipped) + ' skipped.')
+        newentries += ingested
+        #only once what it held is stored - otherwise a 304 next time would lose those entries.
+        saveFeed(feed, parsed, feeddata, len(ingested), skipped)
+    return newentries
+
+def torrents(pickfeed=None,seriesname=None,issue=None):
+    if pickfeed is None:
+        pickfeed = 1
+    #else:
+    #    print "pickfeed is " + str(pickfeed)
+    srchterm = None
 
-#               print ("Site: " + str(feeddata[i]['Site']))
-#               print ("Title: " + str(feeddata[i]['Title']))
-#               print ("Link: " + str(feeddata[i]['Link']))
-#               print ("pubdate: " + str(feeddata[i]['Pubdate']))
-#               print ("size: " + str(feeddata[i]['Size']))
-                i+=1
-            logger.info(str(site) + ' : ' + str(i) + ' entries indexed.')
+    if pickfeed != "2":
+        #the cached feeds
+        feed = torrentFeed(pickfeed)
+        if feed is None:
+            logger.error('invalid pickfeed denoted...')
+            return
+        return pullFeeds([feed])
 
-    rssdbupdate(feeddata,i,'usenet')
-    return
+    if seriesname:
+        srchterm = re.sub(' ', '%20', seriesname)
+    if issue:
+        srchterm += ' ' + str(issue)
+
+    if srchterm is not None:    # kat.ph search
+        feed = "http://kat.ph/usearch/" + str(srchterm) + "%20category%3Acomics%20seeds%3A1/?rss=1"
+    else:
+        logger.error('invalid pickfeed denoted...')
+        return
+
+    if not ratelimit.wait('KAT'):
+        return
+    feedme = feedparser.parse(feed)
+
+    torthekat = []
+    katinfo = {}
+
+    for entry in feedme['entries']:
+        tmpsz = entry.enclosures[0]
+        torthekat.append({
+                      'title':   entry.title,
+                      'link':    tmpsz['url'],
+                      'pubdate': entry.updated,
+                      'site':    'KAT',
+                      'length':  tmpsz['length']
+                      })
+    logger.fdebug('there were ' + str(len(torthekat)) + ' results..')
+    katinfo['entries'] = torthekat
+    return katinfo
+
+def nzbs(provider=None):
+
+    return pullFeeds(nzbFeeds())
 
 def rssdbupdate(feeddata,i,type):
-    rsschktime = 15
     myDB = db.DBConnection()
 
     #let's add the entries into the db so as to save on searches
     #also to build up the ID's ;)
-    x = 1
-    while x <= i:
-        try:
-            dataval = feeddata[x]
-        except IndexError:
-            logger.fdebug('reached the end of populating. Exiting the process.')
-            break
-        #print "populating : " + str(dataval)
+    rssdata = []
+    for dataval in feeddata[:i]:
         #remove passkey so it doesn't end up in db
         if type == 'torrent':
-            newlink = dataval['Link'][:(dataval['Link'].find('&passkey'))]
+            newlink = dataval['Link']
+            if '&passkey' in newlink:
+                newlink = newlink[:newlink.find('&passkey')]
             newVal = {"Link":      newlink,
                       "Pubdate":   dataval['Pubdate'],
                       "Site":      dataval['Site']}
@@ -320,14 +427,100 @@ def rssdbupdate(feeddata,i,type):
                       "Site":      dataval['Site'],
                       "Size":      dataval['Size']}
 
-        ctrlVal = {"Title":    dataval['Title']}
-
-        myDB.upsert("rssdb", newVal,ctrlVal)
+        newVal['Title'] = dataval['Title']
+        rssdata.append(newVal)
+
+    #only what isn't in the rss cache already gets written - in one go, in one transaction.
+    newdata = []
+    with myDB.transaction():
+        known = set()
+        titles = [newVal['Title'] for newVal in rssdata]
+        for y in range(0, len(titles), 500):
+            chunk = titles[y:y+500]
+            known.update([row['Title'] for row in myDB.select("SELECT Title FROM rssdb WHERE Title IN (" + ", ".join(["?"] * len(chunk)) + ")", chunk)])
+        for newVal in rssdata:
+            if newVal['Title'] not in known:
+                known.add(newVal['Title'])
+                newdata.append(newVal)
+        myDB.bulk_upsert("rssdb", newdata, ["Title"])
+        if mylar.RSSDB_FTS:
+            #the title never changes on an upsert, so only the new entries need their tokens indexed.
+            for newVal in newdata:
+                myDB.action("INSERT INTO rssdb_fts (rowid, Tokens) SELECT RSSID, ? FROM rssdb WHERE Title=? AND NOT EXISTS (SELECT 1 FROM rssdb_fts WHERE rowid = rssdb.RSSID)", [rsstokens(newVal['Title']), newVal['Title']])
+
+    logger.fdebug('Completed adding new data to RSS DB (' + str(len(newdata)) + ' new entries). Next add in ' + str(mylar.RSS_CHECKINTERVAL) + ' minutes')
+    #the entries that weren't in the rss cache before.
+    return newdata
+
+def rssdbprune():
+    #apply the retention policy to rssdb - drop entries whose Pubdate is older than RSS_MAXAGE days,
+    #then trim each Site down to its newest RSS_MAXROWS entries.
+    myDB = db.DBConnection()
+    maxage = int(mylar.RSS_MAXAGE)
+    maxrows = int(mylar.RSS_MAXROWS)
+
+    expired = []
+    if maxage > 0:
+        cutoff = time.time() - (maxage * 86400)
+        for entry in myDB.select("SELECT RSSID, Pubdate FROM rssdb"):
+            pubdate = entry['Pubdate']
+            if pubdate is None:
+                continue
+            parsed = feedparser._parse_date(pubdate)
+            if parsed is None:
+                #can't tell how old it is - leave it for the per-site limit.
+                continue
+            if calendar.timegm(parsed) < cutoff:
+                expired.append(entry['RSSID'])
+
+    overlimit = 0
+    with myDB.transaction():
+        for i in range(0, len(expired), 500):
+            chunk = expired[i:i+500]
+            myDB.action("DELETE FROM rssdb WHERE RSSID IN (" + ", ".join(["?"] * len(chunk)) + ")", chunk)
+
+        if maxrows > 0:
+            for site in myDB.select("SELECT Site, COUNT(*) AS Entries FROM rssdb GROUP BY Site"):
+                if site['Entries'] <= maxrows:
+                    continue
+                #Pubdate isn't sortable as text, RSSID goes up as entries get added.
+                overlimit += myDB.action("DELETE FROM rssdb WHERE Site=? AND RSSID NOT IN (SELECT RSSID FROM rssdb WHERE Site=? ORDER BY RSSID DESC LIMIT ?)", [site['Site'], site['Site'], maxrows]).rowcount
+
+        if mylar.RSSDB_FTS and (expired or overlimit):
+            myDB.action("DELETE FROM rssdb_fts WHERE rowid NOT IN (SELECT RSSID FROM rssdb)")
+
+    reclaimed = len(expired) + overlimit
+    if reclaimed > 0:
+        myDB.action("VACUUM")
+    myDB.action("ANALYZE rssdb")
+
+    logger.info('RSS retention: removed ' + str(reclaimed) + ' entries from the RSS cache (' + str(len(expired)) + ' older than ' + str(maxage) + ' days, ' + str(overlimit) + ' over the ' + str(maxrows) + ' per site limit).')
+    return reclaimed
+
+def rsstokens(title):
+    #normalized title that gets stored in rssdb_fts - 'and'/'the' removed, punctuation folded to spaces.
+    #same normalization the series name index uses, so a title and a series name compare as-is.
+    return nameindex.normalize(title)
+
+def rssdbsearch(myDB, seriesname, likesearch, sites=None):
+    #rssdb entries whose title starts with the seriesname. sites limits it to those sites, otherwise
+    #it's the usenet entries (anything not CBT/KAT). likesearch is used when there's no full-text index.
+    if sites is None:
+        siteclause = "Site != 'CBT' AND Site != 'KAT'"
+        siteargs = []
+    else:
+        if len(sites) == 0:
+            return []
+        siteclause = "Site IN (" + ", ".join(["?"] * len(sites)) + ")"
+        siteargs = list(sites)
 
-        x+=1
+    if mylar.RSSDB_FTS:
+        tokens = rsstokens(seriesname)
+        if tokens:
+            #initial phrase query - same as the anchored LIKE, but off the index.
+            return myDB.select("SELECT rssdb.* FROM rssdb_fts JOIN rssdb ON rssdb.RSSID = rssdb_fts.rowid WHERE rssdb_fts MATCH ? AND " + siteclause, ['^"' + tokens + '"'] + siteargs)
 
-    logger.fdebug('Completed adding new data to RSS DB. Next add in ' + str(mylar.RSS_CHECKINTERVAL) + ' minutes')
-    return
+    return myDB.select("SELECT * FROM rssdb WHERE Title like ? AND " + siteclause, [likesearch] + siteargs)
 
 def torrentdbsearch(seriesname,issue,comicid=None,nzbprov=None):
     myDB = db.DBConnection()
@@ -336,7 +529,7 @@ def torrentdbsearch(seriesname,issue,comicid=None,nzbprov=None):
         pass
     else:
         logger.fdebug('ComicID: ' + str(comicid))
-        snm = myDB.action("SELECT * FROM comics WHERE comicid=?", [comicid]).fetchone()
+        snm = nameindex.info(comicid)
         if snm is None:
             logger.fdebug('Invalid ComicID of ' + str(comicid) + '. Aborting search.')
             return
@@ -353,12 +546,13 @@ def torrentdbsearch(seriesname,issue,comicid=None,nzbprov=None):
     tsearch = tsearch_seriesname + "%"
     logger.fdebug('tsearch : ' + str(tsearch))
     AS_Alt = []
-    tresults = []
-
+    torsites = []
     if mylar.ENABLE_CBT:
-        tresults = myDB.action("SELECT * FROM rssdb WHERE Title like ? AND Site='CBT'", [tsearch]).fetchall()
+        torsites.append('CBT')
     if mylar.ENABLE_KAT:
-        tresults += myDB.action("SELECT * FROM rssdb WHERE Title like ? AND Site='KAT'", [tsearch]).fetchall()
+        torsites.append('KAT')
+
+    tresults = rssdbsearch(myDB, seriesname, tsearch, torsites)
 
     logger.fdebug('seriesname_alt:' + str(seriesname_alt))
     if seriesname_alt is None or seriesname_alt == 'None':
@@ -386,11 +580,8 @@ def torrentdbsearch(seriesname,issue,comicid=None,nzbprov=None):
 
             AS_Alternate += '%'
 
-            if mylar.ENABLE_CBT:
-                #print "AS_Alternate:" + str(AS_Alternate)
-                tresults += myDB.action("SELECT * FROM rssdb WHERE Title like ? AND Site='CBT'", [AS_Alternate]).fetchall()
-            if mylar.ENABLE_KAT:
-                tresults += myDB.action("SELECT * FROM rssdb WHERE Title like ? AND Site='KAT'", [AS_Alternate]).fetchall()
+            #print "AS_Alternate:" + str(AS_Alternate)
+            tresults += rssdbsearch(myDB, AS_Altrem, AS_Alternate, torsites)
 
     if tresults is None:
         logger.fdebug('torrent search returned no results for ' + seriesname)
@@ -400,6 +591,15 @@ def torrentdbsearch(seriesname,issue,comicid=None,nzbprov=None):
     tortheinfo = []
     torinfo = {}
 
+    #the series side of the comparison is the same for every result - only clean it up the once.
+    seriesname_mod = re.sub("\\band\\b", " ", seriesname.lower())
+    seriesname_mod = re.sub("\\bthe\\b", " ", seriesname_mod)
+    seriesname_mod = re.sub('[\&]', ' ', seriesname_mod)
+    formatrem_seriesname = re.sub('[\'\!\@\#\$\%\:\;\/\\=\?\.]', '',seriesname_mod)
+    formatrem_seriesname = re.sub('\s+', ' ', formatrem_seriesname)
+    if formatrem_seriesname[:1] == ' ': formatrem_seriesname = formatrem_seriesname[1:]
+    AS_Alt = [x.lower() for x in AS_Alt]
+
     for tor in tresults:
         torsplit = tor['Title'].split('/')
         logger.fdebug('tor-Title: ' + tor['Title'])
@@ -410,25 +610,18 @@ def torrentdbsearch(seriesname,issue,comicid=None,nzbprov=None):
             logger.fdebug('section(' + str(i) + '): ' + str(torsplit[i]))
             i+=1
 
-        seriesname_mod = seriesname
         foundname_mod = torsplit[0]
-        seriesname_mod = re.sub("\\band\\b", " ", seriesname_mod.lower())
         foundname_mod = re.sub("\\band\\b", " ", foundname_mod.lower())
-        seriesname_mod = re.sub("\\bthe\\b", " ", seriesname_mod.lower())
         foundname_mod = re.sub("\\bthe\\b", " ", foundname_mod.lower())
 
-        seriesname_mod = re.sub('[\&]', ' ', seriesname_mod)
         foundname_mod = re.sub('[\&]', ' ', foundname_mod)
 
-        formatrem_seriesname = re.sub('[\'\!\@\#\$\%\:\;\/\\=\?\.]', '',seriesname_mod)
-        formatrem_seriesname = re.sub('\s+', ' ', formatrem_seriesname)
-        if formatrem_seriesname[:1] == ' ': formatrem_seriesname = formatrem_seriesname[1:]
         formatrem_torsplit = re.sub('[\'\!\@\#\$\%\:\;\/\\=\?\.]', '',foundname_mod)
         formatrem_torsplit = re.sub('\s+', ' ', formatrem_torsplit)
         logger.fdebug(str(len(formatrem_torsplit)) + ' - formatrem_torsplit : ' + formatrem_torsplit.lower())
         logger.fdebug(str(len(formatrem_seriesname)) + ' - formatrem_seriesname :' + formatrem_seriesname.lower())
 
-        if formatrem_seriesname.lower() in formatrem_torsplit.lower() or any(x.lower() in formatrem_torsplit.lower() for x in AS_Alt):
+        if formatrem_seriesname.lower() in formatrem_torsplit.lower() or any(x in formatrem_torsplit.lower() for x in AS_Alt):
             logger.fdebug('matched to : ' + tor['Title'])
             logger.fdebug('matched on series title: ' + seriesname)
             titleend = formatrem_torsplit[len(formatrem_seriesname):]
@@ -497,7 +690,7 @@ def nzbdbsearch(seriesname,issue,comicid=None,nzbprov=None):
     if comicid is None or comicid == 'None':
         pass
     else:
-        snm = myDB.action("SELECT * FROM comics WHERE comicid=?", [comicid]).fetchone()
+        snm = nameindex.info(comicid)
         if snm is None:
             logger.info('Invalid ComicID of ' + str(comicid) + '. Aborting search.')
             return
@@ -509,10 +702,10 @@ def nzbdbsearch(seriesname,issue,comicid=None,nzbprov=None):
     nsearch_seriesname = re.sub('[\'\!\@\#\$\%\:\;\/\\=\?\.\s]', '%',seriesname)
     formatrem_seriesname = re.sub('[\'\!\@\#\$\%\:\;\/\\=\?\.]', '',seriesname)
     nsearch = nsearch_seriesname + "%"
-    nresults = myDB.action("SELECT * FROM rssdb WHERE Title like ? AND Site != 'CBT' AND Site != 'KAT'", [nsearch])
-    if nresults is None:
+    nresults = rssdbsearch(myDB, seriesname, nsearch)
+    if not nresults:
         logger.fdebug('nzb search returned no results for ' + seriesname)
-        if seriesname_alt is None:
+        if seriesname_alt is None or seriesname_alt == 'None':
             logger.fdebug('no nzb Alternate name given. Aborting search.')
             return "no results"
         else:
@@ -521,8 +714,8 @@ def nzbdbsearch(seriesname,issue,comicid=None,nzbprov=None):
                 AS_Alternate = AlternateSearch
             for calt in chkthealt:
                 AS_Alternate = re.sub('##','',calt)
-                nresults += myDB.action("SELECT * FROM rssdb WHERE Title like ? AND Site != 'CBT' AND Site != 'KAT'", [AS_Alternate])
-            if nresults is None:
+                nresults += rssdbsearch(myDB, AS_Alternate, AS_Alternate)
+            if not nresults:
                 logger.fdebug('nzb alternate name search returned no results.')
                 return "no results"
 
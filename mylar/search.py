@@ -17,7 +17,7 @@
 from __future__ import division
 
 import mylar
-from mylar import logger, db, updater, helpers, parseit, findcomicfeed, prov_nzbx, notifiers, rsscheck
+from mylar import logger, db, updater, helpers, parseit, findcomicfeed, prov_nzbx, notifiers, rsscheck, ratelimit, nameindex
 
 nzbsu_APIkey = mylar.NZBSU_APIKEY
 dognzb_APIkey = mylar.DOGNZB_APIKEY
@@ -33,11 +33,13 @@ import sys
 import getopt
 import re
 import time
+import threading
+import Queue
 from xml.dom.minidom import parseString
 import urllib2
 from datetime import datetime
 
-def search_init(ComicName, IssueNumber, ComicYear, SeriesYear, IssueDate, IssueID, AlternateSearch=None, UseFuzzy=None, ComicVersion=None, SARC=None, IssueArcID=None, mode=None, rsscheck=None, ComicID=None):
+def search_init(ComicName, IssueNumber, ComicYear, SeriesYear, IssueDate, IssueID, AlternateSearch=None, UseFuzzy=None, ComicVersion=None, SARC=None, IssueArcID=None, mode=None, rsscheck=None, ComicID=None, batch=None):
     if ComicYear == None: ComicYear = '2013'
     else: ComicYear = str(ComicYear)[:4]
 
@@ -136,7 +138,7 @@ def search_init(ComicName, IssueNumber, ComicYear, SeriesYear, IssueDate, IssueI
         elif torprovider[torpr] == 'kat':
             torprov = 'KAT'
 
-        findit = NZB_SEARCH(ComicName, IssueNumber, ComicYear, SeriesYear, torprov, torpr, IssDateFix, IssueID, UseFuzzy, ComicVersion=ComicVersion, SARC=SARC, IssueArcID=IssueArcID, ComicID=ComicID)
+        findit = NZB_SEARCH(ComicName, IssueNumber, ComicYear, SeriesYear, torprov, torpr, IssDateFix, IssueID, UseFuzzy, ComicVersion=ComicVersion, SARC=SARC, IssueArcID=IssueArcID, ComicID=ComicID, batch=batch)
         if findit == 'yes':
             logger.fdebug("findit = found!")
             break
@@ -149,7 +151,7 @@ def search_init(ComicName, IssueNumber, ComicYear, SeriesYear, IssueDate, IssueI
                 for calt in chkthealt:
                     AS_Alternate = re.sub('##','',calt)
                     logger.info(u"Alternate Search pattern detected...re-adjusting to : " + str(AS_Alternate) + " " + str(ComicYear))
-                    findit = NZB_SEARCH(AS_Alternate, IssueNumber, ComicYear, SeriesYear, torprov, torp, IssDateFix, IssueID, UseFuzzy, ComicVersion=ComicVersion, SARC=SARC, IssueArcID=IssueArcID, ComicID=ComicID)
+                    findit = NZB_SEARCH(AS_Alternate, IssueNumber, ComicYear, SeriesYear, torprov, torp, IssDateFix, IssueID, UseFuzzy, ComicVersion=ComicVersion, SARC=SARC, IssueArcID=IssueArcID, ComicID=ComicID, batch=batch)
                     if findit == 'yes':
                         break
 
@@ -174,7 +176,16 @@ def search_init(ComicName, IssueNumber, ComicYear, SeriesYear, IssueDate, IssueI
             searchcnt = 2  #set the searchcnt to 2 (api)
             i = 2          #start the counter at api, so it will exit without running RSS
 
-    nzbsrchproviders = nzbpr
+    #one entry per provider (each newznab host is its own provider) - searched last-to-first as before.
+    providers = []
+    hostcount = 0
+    for nzbpr in range(len(nzbprovider)):
+        if 'newznab' in nzbprovider[nzbpr]:
+            providers.append((nzbpr, 'newznab', newznab_hosts[hostcount]))
+            hostcount+=1
+        else:
+            providers.append((nzbpr, nzbprovider[nzbpr], None))
+    providers.reverse()
 
     while ( i <= searchcnt ):
         #searchmodes:
@@ -186,112 +197,15 @@ def search_init(ComicName, IssueNumber, ComicYear, SeriesYear, IssueDate, IssueI
         if i == 1: searchmode = 'rss'  #order of ops - this will be used first.
         elif i == 2: searchmode = 'api'
 
-        nzbpr = nzbsrchproviders
         logger.fdebug("Initiating Search via : " + str(searchmode))
 
-        while (nzbpr >= 0 ):
-            if 'newznab' in nzbprovider[nzbpr]:
-            #this is for newznab
-                nzbprov = 'newznab'
-                for newznab_host in newznab_hosts:
-                    #if it's rss - search both seriesname/alternates via rss then return.
-                    if searchmode == 'rss':
-                        if mylar.ENABLE_RSS:
-                            findit = NZB_SEARCH(ComicName, IssueNumber, ComicYear, SeriesYear, nzbprov, nzbpr, IssDateFix, IssueID, UseFuzzy, newznab_host, ComicVersion, SARC=SARC, IssueArcID=IssueArcID, RSS="yes", ComicID=ComicID)
-                            if findit == 'yes': 
-                                logger.fdebug("Found via RSS.")
-                                break
-                            #findit = altdefine(AlternateSearch, searchmode='rss')
-                            if AlternateSearch is not None and AlternateSearch != "None":
-                                chkthealt = AlternateSearch.split('##')
-                                if chkthealt == 0:
-                                    AS_Alternate = AlternateSearch
-                                loopit = len(chkthealt)
-                                for calt in chkthealt:
-                                    AS_Alternate = re.sub('##','',calt)
-                                    logger.info(u"Alternate Search pattern detected...re-adjusting to : " + str(AS_Alternate) + " " + str(ComicYear))
-                                    findit = NZB_SEARCH(AS_Alternate, IssueNumber, ComicYear, SeriesYear, nzbprov, nzbpr, IssDateFix, IssueID, UseFuzzy, newznab_host, ComicVersion, SARC=SARC, IssueArcID=IssueArcID, RSS="yes", ComicID=ComicID)
-                                    if findit == 'yes':
-                                        break
-                                if findit == 'yes':
-                                    logger.fdebug("Found via RSS Alternate Naming.")
-                                    break
-                        else:
-                            logger.fdebug("RSS search not enabled - using API only (Enable in the Configuration)")
-                            break
-                    else:
-                        #normal api-search here.
-                        findit = NZB_SEARCH(ComicName, IssueNumber, ComicYear, SeriesYear, nzbprov, nzbpr, IssDateFix, IssueID, UseFuzzy, newznab_host, ComicVersion, SARC=SARC, IssueArcID=IssueArcID, ComicID=ComicID)
-                        if findit == 'yes':
-                            logger.fdebug("Found via API.")
-                            break
-                        if AlternateSearch is not None and AlternateSearch != "None":
-                            chkthealt = AlternateSearch.split('##')
-                            if chkthealt == 0:
-                                AS_Alternate = AlternateSearch
-                            loopit = len(chkthealt)
-                            for calt in chkthealt:
-                                AS_Alternate = re.sub('##','',calt)
-                                logger.info(u"Alternate Search pattern detected...re-adjusting to : " + str(AS_Alternate) + " " + str(ComicYear))
-                                findit = NZB_SEARCH(AS_Alternate, IssueNumber, ComicYear, SeriesYear, nzbprov, nzbpr, IssDateFix, IssueID, UseFuzzy, newznab_host, ComicVersion, SARC=SARC, IssueArcID=IssueArcID, ComicID=ComicID)
-                                if findit == 'yes':
-                                    break
-                            if findit == 'yes':
-                                logger.fdebug("Found via API Alternate Naming.")
-                                break
-                    nzbpr-=1
-                if nzbpr >= 0 and findit != 'yes':
-                    logger.info(u"More than one search provider given - trying next one.")
-                else:
-                    break
-            else:
-                newznab_host = None
-                nzbprov = nzbprovider[nzbpr]
-                if searchmode == 'rss':
-                    if mylar.ENABLE_RSS:
-                        findit = NZB_SEARCH(ComicName, IssueNumber, ComicYear, SeriesYear, nzbprov, nzbpr, IssDateFix, IssueID, UseFuzzy, newznab_host, ComicVersion, SARC=SARC, IssueArcID=IssueArcID, RSS='yes', ComicID=ComicID)
-                        if findit == 'yes':
-                            logger.fdebug("Found via RSS on " + nzbprov)
-                            break
-                        if AlternateSearch is not None and AlternateSearch != "None":
-                            chkthealt = AlternateSearch.split('##')
-                            if chkthealt == 0:
-                                AS_Alternate = AlternateSearch
-                            loopit = len(chkthealt)
-                            for calt in chkthealt:
-                                AS_Alternate = re.sub('##','',calt)
-                                logger.info(u"Alternate Search pattern detected...re-adjusting to : " + str(AS_Alternate) + " " + str(ComicYear))
-                                findit = NZB_SEARCH(AS_Alternate, IssueNumber, ComicYear, SeriesYear, nzbprov, nzbpr, IssDateFix, IssueID, UseFuzzy, newznab_host, ComicVersion, SARC=SARC, IssueArcID=IssueArcID, RSS="yes", ComicID=ComicID)
-                                if findit == 'yes':
-                                    logger.fdebug("Found via RSS Alternate Naming on " + nzbprov)
-                                    break
-                    else:
-                        logger.fdebug("RSS search not enabled - using API only (Enable in the Configuration)")
-                        break
-                else:
-                    #normal api-search here.
-                    findit = NZB_SEARCH(ComicName, IssueNumber, ComicYear, SeriesYear, nzbprov, nzbpr, IssDateFix, IssueID, UseFuzzy, newznab_host, ComicVersion, SARC=SARC, IssueArcID=IssueArcID, ComicID=ComicID)
-                    if findit == 'yes':
-                        logger.fdebug("Found via API on " + nzbprov)
-                        break
-                    if AlternateSearch is not None and AlternateSearch != "None":
-                        chkthealt = AlternateSearch.split('##')
-                        if chkthealt == 0:
-                            AS_Alternate = AlternateSearch
-                        for calt in chkthealt:
-                            AS_Alternate = re.sub('##','',calt)
-                            logger.info(u"Alternate Search pattern detected...re-adjusting to : " + str(AS_Alternate))
-                            findit = NZB_SEARCH(AS_Alternate, IssueNumber, ComicYear, SeriesYear, nzbprov, nzbpr, IssDateFix, IssueID, UseFuzzy, newznab_host, ComicVersion, SARC=SARC, IssueArcID=IssueArcID, ComicID=ComicID)
-                            if findit == 'yes':
-                                break
-                        if findit == 'yes':
-                            logger.fdebug("Found via API Alternate Naming on " + nzbprov)
-                            break
-                nzbpr-=1
-                if nzbpr >= 0 and findit != 'yes':
-                    logger.info(u"More than one search provider given - trying next one.")
-                else:
-                    break
+        if searchmode == 'rss':
+            RSS = "yes"
+        else:
+            RSS = None
+
+        findit, nzbprov = search_providers(providers, ComicName, AlternateSearch, IssueNumber, ComicYear, SeriesYear, IssDateFix, IssueID, UseFuzzy, ComicVersion, SARC, IssueArcID, RSS, ComicID, batch)
+
         if findit == 'yes': return findit, nzbprov
         else:
             logger.fdebug("Finished searching via : " + str(searchmode))
@@ -299,7 +213,167 @@ def search_init(ComicName, IssueNumber, ComicYear, SeriesYear, IssueDate, IssueI
 
     return findit, nzbprov
 
-def NZB_SEARCH(ComicName, IssueNumber, ComicYear, SeriesYear, nzbprov, nzbpr, IssDateFix, IssueID, UseFuzzy, newznab_host=None, ComicVersion=None, SARC=None, IssueArcID=None, RSS=None, ComicID=None):
+class SearchClaim:
+    # shared by the provider threads of a single search. Whichever provider matches first
+    # gets to send the download, the rest stop at their next check.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.found = threading.Event()
+        self.owner = None
+        self.provider = None
+
+    def take(self):
+        #called once a provider has a match, right before it is sent - waits if another provider is mid-send.
+        if self.owner is threading.currentThread():
+            return True
+        self.lock.acquire()
+        if self.found.isSet():
+            self.lock.release()
+            return False
+        self.owner = threading.currentThread()
+        return True
+
+    def finish(self, provider, found):
+        #called straight after the send - if it failed the other providers carry on.
+        if self.owner is not threading.currentThread():
+            return
+        if found:
+            self.provider = provider
+            self.found.set()
+        self.owner = None
+        self.lock.release()
+
+def search_providers(providers, ComicName, AlternateSearch, IssueNumber, ComicYear, SeriesYear, IssDateFix, IssueID, UseFuzzy, ComicVersion, SARC, IssueArcID, RSS, ComicID, batch=None):
+    #run the series name (and any alternates) against every provider at once, SEARCH_THREADS at a time.
+    if not providers:
+        return "no", None
+
+    searchnames = [ComicName]
+    if AlternateSearch is not None and AlternateSearch != "None":
+        for calt in AlternateSearch.split('##'):
+            searchnames.append(re.sub('##','',calt))
+
+    claim = SearchClaim()
+    pending = Queue.Queue()
+    for provider in providers:
+        pending.put(provider)
+
+    def searcher():
+        while not claim.found.isSet():
+            try:
+                nzbpr, nzbprov, newznab_host = pending.get_nowait()
+            except Queue.Empty:
+                return
+            for searchname in searchnames:
+                if claim.found.isSet():
+                    break
+                if searchname != ComicName:
+                    logger.info(u"Alternate Search pattern detected...re-adjusting to : " + str(searchname) + " " + str(ComicYear))
+                findit = "no"
+                try:
+                    findit = NZB_SEARCH(searchname, IssueNumber, ComicYear, SeriesYear, nzbprov, nzbpr, IssDateFix, IssueID, UseFuzzy, newznab_host, ComicVersion, SARC=SARC, IssueArcID=IssueArcID, RSS=RSS, ComicID=ComicID, claim=claim, batch=batch)
+                except Exception, e:
+                    logger.error('Error searching ' + str(nzbprov) + ' : ' + str(e))
+                finally:
+                    #only still held if NZB_SEARCH blew up mid-send.
+                    claim.finish(nzbprov, False)
+                if findit == 'yes':
+                    if RSS == "yes":
+                        logger.fdebug("Found via RSS on " + nzbprov)
+                    else:
+                        logger.fdebug("Found via API on " + nzbprov)
+                    return
+
+    threadcount = max(1, min(int(mylar.SEARCH_THREADS), len(providers)))
+    if threadcount == 1:
+        searcher()
+    else:
+        searchers = []
+        for x in range(threadcount):
+            t = threading.Thread(target=searcher, name='SEARCH-' + str(x))
+            t.start()
+            searchers.append(t)
+        for t in searchers:
+            t.join()
+
+    if claim.found.isSet():
+        return "yes", claim.provider
+    return "no", None
+
+class SearchBatch:
+    # provider responses for one series, shared by all of its wanted issues during a
+    # batched search - so the series gets queried once per provider instead of once per issue.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.results = {}
+
+    def get(self, key):
+        with self.lock:
+            return self.results.get(key)
+
+    def put(self, key, results):
+        with self.lock:
+            self.results[key] = results
+
+#newznab api pages are 100 results - a broad (series name + year) search will page out to BATCH_PAGES of them.
+BATCH_PAGESIZE = 100
+BATCH_PAGES = 3
+
+def fetch_results(findurl, nzbprov, limitprov=None, cancel=None, batch=None, pages=1):
+    #query a provider's api and return the parsed results ("no results" if the request failed), up to
+    #pages pages of them. limitprov is the ratelimit bucket to draw from (None for local hosts) - returns
+    #None if it couldn't be queried because the budget is spent or cancel got set while waiting.
+    if batch is not None:
+        bb = batch.get(findurl)
+        if bb is not None:
+            logger.fdebug("using the results already retrieved from " + str(nzbprov) + " for this series.")
+            return bb
+
+    bb = None
+    offset = 0
+    while pages > 0:
+        if limitprov is not None and not ratelimit.wait(limitprov, cancel):
+            if bb is None:
+                return None
+            break
+        if offset > 0:
+            pageurl = findurl + "&offset=" + str(offset)
+        else:
+            pageurl = findurl
+
+        # Add a user-agent
+        request = urllib2.Request(pageurl)
+        request.add_header('User-Agent', str(mylar.USER_AGENT))
+        opener = urllib2.build_opener()
+
+        try:
+            data = opener.open(request).read()
+        except Exception, e:
+            logger.warn('Error fetching data from %s: %s' % (nzbprov, e))
+            data = False
+
+        if not data:
+            break
+        page = feedparser.parse(data)
+        if bb is None:
+            bb = page
+        else:
+            bb['entries'].extend(page['entries'])
+        if len(page['entries']) < BATCH_PAGESIZE:
+            break
+        offset += len(page['entries'])
+        pages -= 1
+
+    if bb is None:
+        #not cached - the next issue of the series gets to try the provider again.
+        return "no results"
+    if batch is not None:
+        batch.put(findurl, bb)
+    return bb
+
+def NZB_SEARCH(ComicName, IssueNumber, ComicYear, SeriesYear, nzbprov, nzbpr, IssDateFix, IssueID, UseFuzzy, newznab_host=None, ComicVersion=None, SARC=None, IssueArcID=None, RSS=None, ComicID=None, claim=None, batch=None):
 
     if nzbprov == 'nzb.su':
         apikey = mylar.NZBSU_APIKEY
@@ -396,10 +470,9 @@ def NZB_SEARCH(ComicName, IssueNumber, ComicYear, SeriesYear, nzbprov, nzbpr, Is
     cm1 = re.sub("[\/]", " ", findcomic)
     # replace whitespace in comic name with %20 for api search
     #cm = re.sub("\&", "%26", str(cm1))
-    cm = re.sub("\\band\\b", "", cm1.lower()) # remove 'and' & '&' from the search pattern entirely (broader results, will filter out later)
-    cm = re.sub("\\bthe\\b", "", cm.lower()) # remove 'the' from the search pattern to accomodate naming differences
-    cm = re.sub(" ", "%20", str(cm))
-    cm = re.sub("[\&\:\?\,]", "", str(cm))
+    # the name normalized as the watchlist index has it (nameindex) - lowercased, with 'and' / '&' / 'the' and the
+    # punctuation taken out of the search pattern entirely (broader results, will filter out later)
+    cm = re.sub(" ", "%20", str(nameindex.normalize(cm1)))
 
     #determine the amount of loops here
     i = 0
@@ -429,6 +502,15 @@ def NZB_SEARCH(ComicName, IssueNumber, ComicYear, SeriesYear, nzbprov, nzbpr, Is
     else:
         cmloopit = 1
 
+    #api searches for an issue that has padding variants (001/01/1) go out once, on the series name
+    #and year - the results get matched against the issue with helpers.issuedigits, which catches every
+    #padding, decimal and alpha form. A 3+ digit issue is searched for by its number, as it only has the one form.
+    if RSS != "yes" and nzbprov in ('dognzb', 'nzb.su', 'newznab', 'nzbx', 'KAT') and len(c_number) < 3:
+        broadsearch = True
+        cmloopit = 1
+    else:
+        broadsearch = False
+
     isssearch = str(findcomiciss)
     comsearch = cm
     origcmloopit = cmloopit
@@ -448,6 +530,9 @@ def NZB_SEARCH(ComicName, IssueNumber, ComicYear, SeriesYear, nzbprov, nzbpr, Is
     while (findloop < findcount ):
         comsrc = comsearch
         while (cmloopit >= 1 ):
+            if claim is not None and claim.found.isSet():
+                logger.fdebug("Issue found on another provider - stopping the search on " + str(tmpprov))
+                return "no"
             #if issue_except is None: issue_exc = ''
             #else: issue_exc = issue_except
             if done is True and seperatealpha == "no":
@@ -458,7 +543,10 @@ def NZB_SEARCH(ComicName, IssueNumber, ComicYear, SeriesYear, nzbprov, nzbpr, Is
             if seperatealpha == "yes":
                 isssearch = str(c_number) + "%20" + str(c_alpha)
 
-            if cmloopit == 3:
+            if broadsearch:
+                comsearch = comsrc + "%20" + str(comyear) + "%20" + str(filetype)
+                issdig = ''
+            elif cmloopit == 3:
                 comsearch = comsrc + "%2000" + str(isssearch) + "%20" + str(filetype)
                 issdig = '00'
             elif cmloopit == 2:
@@ -501,8 +589,17 @@ def NZB_SEARCH(ComicName, IssueNumber, ComicYear, SeriesYear, nzbprov, nzbpr, Is
                     bb = "no results"
                 elif nzbprov == 'KAT':
                     cmname = re.sub("%20", " ", str(comsrc))
-                    logger.fdebug("Sending request to [KAT] for " + str(cmname) + " : " + str(mod_isssearch))
-                    bb = rsscheck.torrents(pickfeed='2',seriesname=cmname,issue=mod_isssearch)
+                    if not broadsearch:
+                        logger.fdebug("Sending request to [KAT] for " + str(cmname) + " : " + str(mod_isssearch))
+                        bb = rsscheck.torrents(pickfeed='2',seriesname=cmname,issue=mod_isssearch)
+                        if bb is None: bb = "no results"
+                    elif batch is not None and batch.get('KAT:' + cmname + ' ' + comyear) is not None:
+                        bb = batch.get('KAT:' + cmname + ' ' + comyear)
+                    else:
+                        logger.fdebug("Sending request to [KAT] for " + str(cmname) + " " + str(comyear) + " (matching issue " + str(mod_isssearch) + " locally)")
+                        bb = rsscheck.torrents(pickfeed='2',seriesname=cmname + ' ' + comyear)
+                        if bb is None: bb = "no results"
+                        if batch is not None: batch.put('KAT:' + cmname + ' ' + comyear, bb)
                     rss = "no"
                     #if bb is not None: logger.fdebug("results: " + str(bb))
                 elif nzbprov != 'experimental':
@@ -529,38 +626,28 @@ def NZB_SEARCH(ComicName, IssueNumber, ComicYear, SeriesYear, nzbprov, nzbpr, Is
                         if mylar.USENET_RETENTION != None:
                             findurl = findurl + "&maxage=" + str(mylar.USENET_RETENTION)
 
-                        # Add a user-agent
-                        #print ("user-agent:" + str(mylar.USER_AGENT))
-                        request = urllib2.Request(findurl)
-                        request.add_header('User-Agent', str(mylar.USER_AGENT))
-                        opener = urllib2.build_opener()
-
-                        #set a delay between searches here. Default is for 30 seconds...
-                        if mylar.SEARCH_DELAY == 'None' or mylar.SEARCH_DELAY is None:
-                            pause_the_search = 1 * 60   # (it's in seconds)
-                        elif str(mylar.SEARCH_DELAY).isdigit():
-                            pause_the_search = mylar.SEARCH_DELAY * 60
-                        else:
-                            logger.info("Check Search Delay - invalid numerical given. Force-setting to 1 minute.")
-                            pause_the_search = 1 * 60
-
+                        #only wait if the provider's request budget is used up (see ratelimit).
                         #bypass for local newznabs
                         if nzbprov == 'newznab' and (host_newznab_fix[:3] == '10.' or host_newznab_fix[:4] == '172.' or host_newznab_fix[:4] == '192.' or 'localhost' in str(host_newznab_fix)):
-                                pass
+                            limitprov = None
+                        elif nzbprov == 'newznab':
+                            limitprov = name_newznab
                         else:
-                            logger.info("pausing for " + str(pause_the_search) + " seconds before continuing to avoid hammering")
-                            time.sleep(pause_the_search)
-
-                        try:
-                            data = opener.open(request).read()
-                        except Exception, e:
-                            logger.warn('Error fetching data from %s: %s' % (nzbprov, e))
-                            data = False
+                            limitprov = nzbprov
+                        if claim is not None:
+                            cancel = claim.found
+                        else:
+                            cancel = None
 
-                        if data:
-                            bb = feedparser.parse(data)
+                        #a broad search pages out further - the issue wanted may not be in the newest 100.
+                        if broadsearch:
+                            pages = BATCH_PAGES
                         else:
-                            bb = "no results"
+                            pages = 1
+                        bb = fetch_results(findurl, nzbprov, limitprov, cancel, batch, pages)
+                        if bb is None:
+                            logger.fdebug("Not searching " + str(tmpprov) + " - issue found elsewhere or request limit reached.")
+                            return "no"
 
                 elif nzbprov == 'experimental':
                     #bb = parseit.MysterBinScrape(comsearch[findloop], comyear)
@@ -994,6 +1081,9 @@ def NZB_SEARCH(ComicName, IssueNumber, ComicYear, SeriesYear, nzbprov, nzbpr, Is
                         if int(intIss) == int(comintIss):
                             logger.fdebug('issues match!')
                             logger.info(u"Found " + ComicName + " (" + str(comyear) + ") issue: " + str(IssueNumber) + " using " + str(tmpprov) )
+                            if claim is not None and not claim.take():
+                                logger.fdebug("Issue already sent from another provider - ignoring the match on " + str(tmpprov))
+                                return "no"
                         ## -- inherit issue. Comic year is non-standard. nzb year is the year
                         ## -- comic was printed, not the start year of the comic series and
                         ## -- thus the deciding component if matches are correct or not
@@ -1028,6 +1118,7 @@ def NZB_SEARCH(ComicName, IssueNumber, ComicYear, SeriesYear, nzbprov, nzbpr, Is
                                         opener = helpers.urlretrieve(urllib2.urlopen(request), str(mylar.BLACKHOLE_DIR) + str(filenamenzb))
                                     except Exception, e:
                                          logger.warn('Error fetching data from %s: %s' % (nzbprov, e))
+                                         if claim is not None: claim.finish(nzbprov, False)
                                          return
                                     logger.fdebug("filename saved to your blackhole as : " + str(filenamenzb))
                                     logger.info(u"Successfully sent .nzb to your Blackhole directory : " + str(mylar.BLACKHOLE_DIR) + str(filenamenzb) )
@@ -1057,6 +1148,7 @@ def NZB_SEARCH(ComicName, IssueNumber, ComicYear, SeriesYear, nzbprov, nzbpr, Is
                                 rcheck = rsscheck.torsend2client(ComicName, entry['link'], nzbprov)
                                 if rcheck == "fail":
                                     logger.error("Unable to send torrent - check logs and settings.")
+                                    if claim is not None: claim.finish(nzbprov, False)
                                     return
                                 if mylar.TORRENT_LOCAL:
                                     sent_to = "your local Watch folder"
@@ -1110,6 +1202,7 @@ def NZB_SEARCH(ComicName, IssueNumber, ComicYear, SeriesYear, nzbprov, nzbpr, Is
                                         nzbget_host = mylar.NZBGET_HOST[8:]
                                     else:
                                         logger.error("You have an invalid nzbget hostname specified. Exiting")
+                                        if claim is not None: claim.finish(nzbprov, False)
                                         return
                                     tmpapi = str(tmpapi) + str(mylar.NZBGET_USERNAME) + ":" + str(mylar.NZBGET_PASSWORD)
                                     tmpapi = str(tmpapi) + "@" + str(nzbget_host) + ":" + str(mylar.NZBGET_PORT) + "/xmlrpc"
@@ -1154,11 +1247,14 @@ def NZB_SEARCH(ComicName, IssueNumber, ComicYear, SeriesYear, nzbprov, nzbpr, Is
                                         urllib2.urlopen(tmpapi)
                                     except urllib2.URLError:
                                         logger.error(u"Unable to send nzb file to SABnzbd")
+                                        if claim is not None: claim.finish(nzbprov, False)
                                         return
  
                                     sent_to = "SABnzbd+"
                                     logger.info(u"Successfully sent nzb file to SABnzbd")
 
+                            if claim is not None:
+                                claim.finish(nzbprov, True)
                             if mylar.PROWL_ENABLED and mylar.PROWL_ONSNATCH:
                                 logger.info(u"Sending Prowl notification")
                                 prowl = notifiers.PROWL()
@@ -1182,7 +1278,7 @@ def NZB_SEARCH(ComicName, IssueNumber, ComicYear, SeriesYear, nzbprov, nzbpr, Is
                         cmloopit == 1 #let's make sure it STOPS searching after a sucessful match. 
                         break
             cmloopit-=1
-            if cmloopit < 1 and c_alpha is not None and seperatealpha == "no" and foundc == "no":
+            if cmloopit < 1 and c_alpha is not None and seperatealpha == "no" and foundc == "no" and not broadsearch:
                 logger.info("Alphanumerics detected within IssueNumber. Seperating from Issue # and re-trying.")
                 cmloopit = origcmloopit                
                 seperatealpha = "yes"
@@ -1202,6 +1298,40 @@ def NZB_SEARCH(ComicName, IssueNumber, ComicYear, SeriesYear, nzbprov, nzbpr, Is
                 break
     return foundc
 
+#wanted issue/annual rows joined to their series, so the search loops don't go back for the comic each time.
+ISSUE_RECORDS = "SELECT i.ComicID, i.IssueID, i.Issue_Number, i.IssueDate, c.ComicName, c.ComicYear, c.AlternateSearch, c.UseFuzzy, c.ComicVersion FROM %s AS i INNER JOIN comics AS c ON c.ComicID = i.ComicID WHERE c.ComicName != 'None' AND "
+
+def issue_records(myDB, issueids=None, annuals=True):
+    #records for every Wanted issue (and annual), or for the given IssueIDs - one query per table
+    #(per 500 IssueIDs) rather than one per issue. Each record carries its mode (want / want_ann).
+    tables = [('issues', 'want')]
+    if annuals:
+        tables.append(('annuals', 'want_ann'))
+
+    records = []
+    if issueids is None:
+        for table, mode in tables:
+            for row in myDB.select(ISSUE_RECORDS % table + 'i.Status="Wanted"'):
+                record = dict(zip(row.keys(), row))
+                record['mode'] = mode
+                records.append(record)
+        return records
+
+    found = {}
+    remaining = list(issueids)
+    for table, mode in tables:
+        for x in range(0, len(remaining), 500):
+            chunk = remaining[x:x+500]
+            for row in myDB.select(ISSUE_RECORDS % table + 'i.IssueID IN (' + ', '.join(['?'] * len(chunk)) + ')', chunk):
+                record = dict(zip(row.keys(), row))
+                record['mode'] = mode
+                found[row['IssueID']] = record
+        remaining = [issueid for issueid in remaining if issueid not in found]
+
+    for issueid in remaining:
+        logger.info("unable to determine IssueID " + str(issueid) + " - perhaps you need to delete/refresh series?")
+    return [found[issueid] for issueid in issueids if issueid in found]
+
 def searchforissue(issueid=None, new=False, rsscheck=None):
     myDB = db.DBConnection()
 
@@ -1212,51 +1342,30 @@ def searchforissue(issueid=None, new=False, rsscheck=None):
         else:
             logger.info(u"Initiating NZB Search scan at requested interval of " + str(mylar.SEARCH_INTERVAL) + " minutes.")
 
-        myDB = db.DBConnection()
-
-        stloop = 1
-        results = []
-
-        if mylar.ANNUALS_ON:
-            stloop+=1
-        while (stloop > 0):
-            if stloop == 1:
-                issues_1 = myDB.select('SELECT * from issues WHERE Status="Wanted"')
-                for iss in issues_1:
-                    results.append({'ComicID':       iss['ComicID'],
-                                    'IssueID':       iss['IssueID'],
-                                    'Issue_Number':  iss['Issue_Number'],
-                                    'IssueDate':     iss['IssueDate'],
-                                    'mode':          'want'
-                                   })
-            elif stloop == 2:
-                issues_2 = myDB.select('SELECT * from annuals WHERE Status="Wanted"')
-                for iss in issues_2:
-                    results.append({'ComicID':       iss['ComicID'],
-                                    'IssueID':       iss['IssueID'],
-                                    'Issue_Number':  iss['Issue_Number'],
-                                    'IssueDate':     iss['IssueDate'],
-                                    'mode':          'want_ann'
-                                   })
-            stloop-=1
+        results = issue_records(myDB, annuals=mylar.ANNUALS_ON)
 
         new = True
 
+        if mylar.SEARCH_BATCH:
+            #group the wanted issues by series - each series gets a SearchBatch so the providers
+            #only get queried once for it, with every wanted issue matched against that response.
+            results.sort(key=lambda x: x['ComicID'])
+        batch = None
+        lastcomicid = None
+
         for result in results:
-            comic = myDB.action("SELECT * from comics WHERE ComicID=? AND ComicName != 'None'", [result['ComicID']]).fetchone()
+            if mylar.SEARCH_BATCH and result['ComicID'] != lastcomicid:
+                batch = SearchBatch()
+                lastcomicid = result['ComicID']
             foundNZB = "none"
-            SeriesYear = comic['ComicYear']
-            AlternateSearch = comic['AlternateSearch']
             IssueDate = result['IssueDate']
-            UseFuzzy = comic['UseFuzzy']
-            ComicVersion = comic['ComicVersion']
             if result['IssueDate'] == None: 
-                ComicYear = comic['ComicYear']
+                ComicYear = result['ComicYear']
             else: 
                 ComicYear = str(result['IssueDate'])[:4]
             mode = result['mode']
             if (mylar.NZBSU or mylar.DOGNZB or mylar.EXPERIMENTAL or mylar.NEWZNAB or mylar.NZBX or mylar.ENABLE_KAT or mylar.ENABLE_CBT) and (mylar.USE_SABNZBD or mylar.USE_NZBGET or mylar.ENABLE_TORRENTS):
-                    foundNZB, prov = search_init(comic['ComicName'], result['Issue_Number'], str(ComicYear), comic['ComicYear'], IssueDate, result['IssueID'], AlternateSearch, UseFuzzy, ComicVersion, SARC=None, IssueArcID=None, mode=mode, rsscheck=rsscheck, ComicID=result['ComicID'])
+                    foundNZB, prov = search_init(result['ComicName'], result['Issue_Number'], str(ComicYear), result['ComicYear'], IssueDate, result['IssueID'], result['AlternateSearch'], result['UseFuzzy'], result['ComicVersion'], SARC=None, IssueArcID=None, mode=mode, rsscheck=rsscheck, ComicID=result['ComicID'], batch=batch)
                     if foundNZB == "yes": 
                         #print ("found!")
                         updater.foundsearch(result['ComicID'], result['IssueID'], mode=mode, provider=prov)
@@ -1264,29 +1373,22 @@ def searchforissue(issueid=None, new=False, rsscheck=None):
                         pass 
                         #print ("not found!")
     else:
-        result = myDB.action('SELECT * FROM issues where IssueID=?', [issueid]).fetchone()
-        mode = 'want'
-        if result is None:
-            result = myDB.action('SELECT * FROM annuals where IssueID=?', [issueid]).fetchone()
-            mode = 'want_ann'
-            if result is None:
-                logger.info("Unable to locate IssueID - you probably should delete/refresh the series.")
-                return
+        results = issue_records(myDB, [issueid])
+        if not results:
+            logger.info("Unable to locate IssueID - you probably should delete/refresh the series.")
+            return
+        result = results[0]
+        mode = result['mode']
         ComicID = result['ComicID']
-        comic = myDB.action('SELECT * FROM comics where ComicID=?', [ComicID]).fetchone()
-        SeriesYear = comic['ComicYear']
-        AlternateSearch = comic['AlternateSearch']
         IssueDate = result['IssueDate']
-        UseFuzzy = comic['UseFuzzy']
-        ComicVersion = comic['ComicVersion']
         if result['IssueDate'] == None:
-            IssueYear = comic['ComicYear']
+            IssueYear = result['ComicYear']
         else:
             IssueYear = str(result['IssueDate'])[:4]
 
         foundNZB = "none"
         if (mylar.NZBSU or mylar.DOGNZB or mylar.EXPERIMENTAL or mylar.NEWZNAB or mylar.NZBX) and (mylar.USE_SABNZBD or mylar.USE_NZBGET):
-            foundNZB, prov = search_init(result['ComicName'], result['Issue_Number'], str(IssueYear), comic['ComicYear'], IssueDate, result['IssueID'], AlternateSearch, UseFuzzy, ComicVersion, mode=mode, ComicID=ComicID)
+            foundNZB, prov = search_init(result['ComicName'], result['Issue_Number'], str(IssueYear), result['ComicYear'], IssueDate, result['IssueID'], result['AlternateSearch'], result['UseFuzzy'], result['ComicVersion'], mode=mode, ComicID=ComicID)
             if foundNZB == "yes":
                 logger.fdebug("I found " + result['ComicName'] + ' #:' + str(result['Issue_Number']))
                 updater.foundsearch(ComicID=result['ComicID'], IssueID=result['IssueID'], mode=mode, provider=prov)
@@ -1295,34 +1397,21 @@ def searchforissue(issueid=None, new=False, rsscheck=None):
                 #print ("not found!")
     return
 
-def searchIssueIDList(issuelist):
+def searchIssueIDList(issuelist, rsscheck=None):
     myDB = db.DBConnection()
-    for issueid in issuelist:
-        issue = myDB.action('SELECT * from issues WHERE IssueID=?', [issueid]).fetchone()
-        mode = 'want'
-        if issue is None:
-            issue = myDB.action('SELECT * from annuals WHERE IssueID=?', [issueid]).fetchone()
-            mode = 'want_ann'
-            if issue is None:
-                logger.info("unable to determine IssueID - perhaps you need to delete/refresh series?")
-                break
-        comic = myDB.action('SELECT * from comics WHERE ComicID=?', [issue['ComicID']]).fetchone()
+    for issue in issue_records(myDB, issuelist):
+        mode = issue['mode']
         print ("Checking for issue: " + str(issue['Issue_Number']))
         foundNZB = "none"
-        SeriesYear = comic['ComicYear']
-        AlternateSearch = comic['AlternateSearch']
-        UseFuzzy = comic['UseFuzzy']
-        ComicVersion = comic['ComicVersion']
         if issue['IssueDate'] == None:
-            IssueYear = comic['ComicYear']
+            IssueYear = issue['ComicYear']
         else:
             IssueYear = str(issue['IssueDate'])[:4]
         if (mylar.NZBSU or mylar.DOGNZB or mylar.EXPERIMENTAL or mylar.NEWZNAB or mylar.NZBX or mylar.ENABLE_CBT or mylar.ENABLE_KAT) and (mylar.USE_SABNZBD or mylar.USE_NZBGET or mylar.ENABLE_TORRENTS):
-                foundNZB, prov = search_init(comic['ComicName'], issue['Issue_Number'], str(IssueYear), comic['ComicYear'], issue['IssueDate'], issue['IssueID'], AlternateSearch, UseFuzzy, ComicVersion, SARC=None, IssueArcID=None, mode=mode, ComicID=issue['ComicID'])
+                foundNZB, prov = search_init(issue['ComicName'], issue['Issue_Number'], str(IssueYear), issue['ComicYear'], issue['IssueDate'], issue['IssueID'], issue['AlternateSearch'], issue['UseFuzzy'], issue['ComicVersion'], SARC=None, IssueArcID=None, mode=mode, rsscheck=rsscheck, ComicID=issue['ComicID'])
                 if foundNZB == "yes":
                     #print ("found!")
                     updater.foundsearch(ComicID=issue['ComicID'], IssueID=issue['IssueID'], mode=mode, provider=prov)
                 else:
                     pass
                     #print ("not found!")
-
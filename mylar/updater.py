@@ -21,85 +21,220 @@ import shlex
 import re 
 import os
 import itertools
+import threading
+import Queue
 
 import mylar
 from mylar import db, logger, helpers, filechecker
 
-def dbUpdate(ComicIDList=None):
-
+# how often (in hours) a series gets refreshed, by how likely it is to have changed on CV -
+# REFRESH_INTERVALS in the config overrides, ie. ongoing:24;recent:168;ended:720
+DEFAULT_INTERVALS = {'ongoing': 24,
+                     'recent':  168,
+                     'ended':   720}
+
+# a series that's stopped but had an issue out within this many days is 'recent', not 'ended'.
+RECENT_DAYS = 365
+
+# only one full pass over the watchlist at a time (scheduled or forced from the ui).
+refresh_lock = threading.Lock()
+
+# series the pull-list wants refreshed (see upcoming_update) - queued so the pull-list check doesn't
+# wait on them, and only ever queued once at a time per ComicID.
+upcoming_queue = Queue.Queue()
+upcoming_lock = threading.Lock()
+upcoming_queued = set()
+upcoming_workers = []
+
+def refreshIntervals():
+
+    intervals = dict(DEFAULT_INTERVALS)
+    if mylar.REFRESH_INTERVALS:
+        for interval in str(mylar.REFRESH_INTERVALS).split(';'):
+            if ':' not in interval:
+                continue
+            name, hours = interval.split(':', 1)
+            try:
+                intervals[name.strip()] = int(hours)
+            except ValueError:
+                logger.warn('Invalid refresh interval given for ' + name.strip() + ' : ' + hours + ' - ignoring.')
+    return intervals
+
+def refreshClass(comic):
+    #ongoing series get new issues every month, ended ones hardly ever change.
+    if comic['ForceContinuing'] == 1 or 'Present' in str(comic['ComicPublished']):
+        return 'ongoing'
+    latestdate = str(comic['LatestDate'])
+    try:
+        latest = datetime.date(int(latestdate[:4]), max(1, int(latestdate[5:7])), 1)
+    except ValueError:
+        return 'ended'
+    if (datetime.date.today() - latest).days <= RECENT_DAYS:
+        return 'recent'
+    return 'ended'
+
+def refreshPriority(comic, intervals):
+    #how overdue the series is - 1.0 is when its refresh interval has just run out.
+    if comic['Status'] == 'Loading' or not comic['LastUpdated']:
+        #never finished loading - first in line.
+        return float('inf')
+    try:
+        lastupdated = datetime.datetime.strptime(str(comic['LastUpdated']), '%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        return float('inf')
+    age = datetime.datetime.now() - lastupdated
+    hours = (age.days * 24) + (age.seconds / 3600.0)
+    return hours / max(1, intervals.get(refreshClass(comic), DEFAULT_INTERVALS['ended']))
+
+def dbUpdate(ComicIDList=None, due=False):
+    #refresh the given series - or the whole watchlist, most overdue first. With due, only the series
+    #whose refresh interval has run out (the scheduled run, every hour). The given series are a refresh
+    #the user asked for, so they skip the ComicVine cache.
     myDB = db.DBConnection()
     #print "comicidlist:" + str(ComicIDList)
     if ComicIDList is None:
-        comiclist = myDB.select('SELECT ComicID, ComicName from comics WHERE Status="Active" or Status="Loading" order by LastUpdated ASC')
+        if not refresh_lock.acquire(False):
+            logger.info('A series refresh is already running - not starting another one.')
+            return
+        try:
+            intervals = refreshIntervals()
+            comiclist = []
+            for comic in myDB.select('SELECT ComicID, ComicName, Status, ComicPublished, LatestDate, ForceContinuing, LastUpdated from comics WHERE Status="Active" or Status="Loading"'):
+                priority = refreshPriority(comic, intervals)
+                if due and priority < 1:
+                    continue
+                comiclist.append((priority, comic['ComicID']))
+            comiclist.sort(reverse=True)
+            refreshPool([comicid for priority, comicid in comiclist])
+        finally:
+            refresh_lock.release()
     else:
-        comiclist = ComicIDList
+        refreshPool(ComicIDList, fresh=True)
 
+def refreshPool(comicids, fresh=False):
+    #spread the refreshes over CV_THREADS workers - the ComicVine requests they make are paced by
+    #ratelimit (and capped in flight by cv.cvslots), so there's no need to sleep between series.
+    logger.info('Starting update for %i active comics' % len(comicids))
+    if not comicids:
+        return
 
-    logger.info('Starting update for %i active comics' % len(comiclist))
-    
-    for comic in comiclist:
-        if ComicIDList is None:
-            comicid = comic[0]
+    pending = Queue.Queue()
+    for comicid in comicids:
+        pending.put(comicid)
+
+    def refresher():
+        while True:
+            try:
+                comicid = pending.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                refreshSeries(comicid, fresh)
+            except Exception, e:
+                logger.error('Unable to refresh ' + str(comicid) + ' : ' + str(e))
+
+    refreshers = []
+    for x in range(min(max(1, int(mylar.CV_THREADS)), len(comicids))):
+        t = threading.Thread(target=refresher, name='REFRESH-' + str(x))
+        t.start()
+        refreshers.append(t)
+    for t in refreshers:
+        t.join()
+    #the refreshes leave the sort order alone (it's a global - no good with them running side by side),
+    #so it's redone the once here.
+    helpers.ComicSort(sequence='update')
+    logger.info('Update complete')
+
+def queueRefresh(ComicID, mismatch="no"):
+    #refresh a series in the background - if it's already queued (or being refreshed), that one will do.
+    with upcoming_lock:
+        if ComicID in upcoming_queued:
+            logger.fdebug(str(ComicID) + ' is already queued for a refresh.')
+            return
+        upcoming_queued.add(ComicID)
+        upcoming_queue.put((ComicID, mismatch))
+        for x in range(len(upcoming_workers), max(1, int(mylar.CV_THREADS))):
+            t = threading.Thread(target=upcomingRefresher, name='UPCOMING-REFRESH-' + str(x))
+            t.setDaemon(True)
+            t.start()
+            upcoming_workers.append(t)
+
+def upcomingRefresher():
+
+    while True:
+        ComicID, mismatch = upcoming_queue.get()
+        try:
+            logger.fdebug('Now Refreshing comic ' + str(ComicID) + ' to make sure it is up-to-date')
+            #pullupd - no pull-list check / search afterwards, it's the pull-list check that asked for this.
+            #fresh - the pull-list has an issue the series doesn't, so a cached copy of the volume (which would
+            #say nothing's changed) is no good here - only the issues changed since the last refresh get pulled.
+            if ComicID[:1] == "G": mylar.importer.GCDimport(ComicID,pullupd="yes")
+            else: mylar.importer.addComictoDB(ComicID,mismatch,pullupd="yes",incremental=mylar.CV_INCREMENTAL,fresh=True)
+        except Exception, e:
+            logger.error('Unable to refresh ' + str(ComicID) + ' : ' + str(e))
+        #a refresh asked for while this one was running is covered by it.
+        with upcoming_lock:
+            upcoming_queued.discard(ComicID)
+
+def refreshSeries(comicid, fresh=False):
+
+    myDB = db.DBConnection()
+    logger.fdebug("Refreshing ComicID: " + str(comicid))
+    mismatch = "no"
+    if not mylar.CV_ONLY or comicid[:1] == "G":
+        CV_EXcomicid = myDB.action("SELECT * from exceptions WHERE ComicID=?", [comicid]).fetchone()
+        if CV_EXcomicid is None: pass
         else:
-            comicid = comic
-        print "comicid" + str(comicid)
-        mismatch = "no"
-        if not mylar.CV_ONLY or comicid[:1] == "G":
-            CV_EXcomicid = myDB.action("SELECT * from exceptions WHERE ComicID=?", [comicid]).fetchone()
-            if CV_EXcomicid is None: pass
-            else:
-                if CV_EXcomicid['variloop'] == '99':
-                    mismatch = "yes"
-            if comicid[:1] == "G":
-                mylar.importer.GCDimport(comicid)
-            else: 
-                mylar.importer.addComictoDB(comicid,mismatch)
+            if CV_EXcomicid['variloop'] == '99':
+                mismatch = "yes"
+        if comicid[:1] == "G":
+            mylar.importer.GCDimport(comicid,resort=False)
+        else: 
+            mylar.importer.addComictoDB(comicid,mismatch,fresh=fresh,resort=False)
+    else:
+        if mylar.CV_ONETIMER == 1:
+            logger.fdebug('CV_OneTimer option enabled...')
+
+            #in order to update to JUST CV_ONLY, we need to delete the issues for a given series so it's a clean refresh.
+            logger.fdebug('Gathering the status of all issues for the series.')
+            issues = myDB.select('SELECT * FROM issues WHERE ComicID=?', [comicid])
+            if mylar.ANNUALS_ON:
+                issues += myDB.select('SELECT * FROM annuals WHERE ComicID=?', [comicid])
+            #store the issues' status for a given comicid, after deleting and readding, flip the status back to what it is currently.                
+            logger.fdebug('Deleting all issue data.')
+            myDB.select('DELETE FROM issues WHERE ComicID=?', [comicid])            
+            myDB.select('DELETE FROM annuals WHERE ComicID=?', [comicid])
+            logger.fdebug('Refreshing the series and pulling in new data using only CV.')
+            mylar.importer.addComictoDB(comicid,mismatch,fresh=fresh,resort=False)
+            issues_new = myDB.select('SELECT * FROM issues WHERE ComicID=?', [comicid])
+            annuals = []
+            ann_list = []
+            if mylar.ANNUALS_ON:
+                annuals_list = myDB.select('SELECT * FROM annuals WHERE ComicID=?', [comicid])
+                ann_list += annuals_list
+                issues_new += annuals_list
+
+            icount = 0
+            logger.fdebug('Attempting to put the Statuses back how they were.')
+            for issue in issues:
+                for issuenew in issues_new:
+                   if issuenew['IssueID'] == issue['IssueID'] and issuenew['Status'] != issue['Status']:
+                        #if the status is now Downloaded, keep status.
+                        if issuenew['Status'] == 'Downloaded': break
+                        #change the status to the previous status
+                        ctrlVAL = {'IssueID':  issue['IssueID']}
+                        newVAL = {'Status':  issue['Status']}
+                        if any(d['IssueID'] == str(issue['IssueID']) for d in ann_list):
+                            logger.fdebug('annual detected for ' + str(issue['IssueID']) + ' #: ' + str(issue['Issue_Number']))
+                            myDB.upsert("Annuals", newVAL, ctrlVAL)
+                        else:
+                            myDB.upsert("Issues", newVAL, ctrlVAL)
+                        icount+=1
+                        break
+            logger.info('In converting data to CV only, I changed the status of ' + str(icount) + ' issues.')
+            mylar.CV_ONETIMER = 0   
         else:
-            if mylar.CV_ONETIMER == 1:
-                logger.fdebug('CV_OneTimer option enabled...')
-
-                #in order to update to JUST CV_ONLY, we need to delete the issues for a given series so it's a clean refresh.
-                logger.fdebug('Gathering the status of all issues for the series.')
-                issues = myDB.select('SELECT * FROM issues WHERE ComicID=?', [comicid])
-                if mylar.ANNUALS_ON:
-                    issues += myDB.select('SELECT * FROM annuals WHERE ComicID=?', [comicid])
-                #store the issues' status for a given comicid, after deleting and readding, flip the status back to what it is currently.                
-                logger.fdebug('Deleting all issue data.')
-                myDB.select('DELETE FROM issues WHERE ComicID=?', [comicid])            
-                myDB.select('DELETE FROM annuals WHERE ComicID=?', [comicid])
-                logger.fdebug('Refreshing the series and pulling in new data using only CV.')
-                mylar.importer.addComictoDB(comicid,mismatch)
-                issues_new = myDB.select('SELECT * FROM issues WHERE ComicID=?', [comicid])
-                annuals = []
-                ann_list = []
-                if mylar.ANNUALS_ON:
-                    annuals_list = myDB.select('SELECT * FROM annuals WHERE ComicID=?', [comicid])
-                    ann_list += annuals_list
-                    issues_new += annuals_list
-
-                icount = 0
-                logger.fdebug('Attempting to put the Statuses back how they were.')
-                for issue in issues:
-                    for issuenew in issues_new:
-                       if issuenew['IssueID'] == issue['IssueID'] and issuenew['Status'] != issue['Status']:
-                            #if the status is now Downloaded, keep status.
-                            if issuenew['Status'] == 'Downloaded': break
-                            #change the status to the previous status
-                            ctrlVAL = {'IssueID':  issue['IssueID']}
-                            newVAL = {'Status':  issue['Status']}
-                            if any(d['IssueID'] == str(issue['IssueID']) for d in ann_list):
-                                logger.fdebug('annual detected for ' + str(issue['IssueID']) + ' #: ' + str(issue['Issue_Number']))
-                                myDB.upsert("Annuals", newVAL, ctrlVAL)
-                            else:
-                                myDB.upsert("Issues", newVAL, ctrlVAL)
-                            icount+=1
-                            break
-                logger.info('In converting data to CV only, I changed the status of ' + str(icount) + ' issues.')
-                mylar.CV_ONETIMER = 0   
-            else:
-                mylar.importer.addComictoDB(comicid,mismatch)
-        time.sleep(5) #pause for 5 secs so dont hammer CV and get 500 error
-    logger.info('Update complete')
+            mylar.importer.addComictoDB(comicid,mismatch,incremental=mylar.CV_INCREMENTAL,fresh=fresh,resort=False)
 
 
 def latest_update(ComicID, LatestIssue, LatestDate):
@@ -174,10 +309,8 @@ def upcoming_update(ComicID, ComicName, IssueNumber, IssueDate, forcecheck=None)
             myDB.upsert("comics", newVal, newKey)
 
         if hours > 5 or forcecheck == 'yes':
-            pullupd = "yes"
-            logger.fdebug('Now Refreshing comic ' + ComicName + ' to make sure it is up-to-date')
-            if ComicID[:1] == "G": mylar.importer.GCDimport(ComicID,pullupd)
-            else: mylar.importer.addComictoDB(ComicID,mismatch,pullupd)
+            logger.fdebug('Queueing a refresh of ' + ComicName + ' to make sure it is up-to-date')
+            queueRefresh(ComicID, mismatch)
         else:
             logger.fdebug('It has not been longer than 5 hours since we last did this...we will wait so we do not hammer things.')
             return
@@ -406,6 +539,8 @@ def forceRescan(ComicID,archive=None):
     reissues = myDB.action('SELECT * FROM issues WHERE ComicID=?', [ComicID]).fetchall()
     issID_to_ignore = []
     issID_to_ignore.append(str(ComicID))
+    found_iss = []
+    found_ann = []
     while (fn < fccnt):  
         haveissue = "no"
         issuedupe = "no"
@@ -631,7 +766,6 @@ def forceRescan(ComicID,archive=None):
                 iss_id = reiss['IssueID']
 
             logger.fdebug('issueID to write to db:' + str(iss_id))
-            controlValueDict = {"IssueID": iss_id}
 
             #if Archived, increase the 'Have' count.
             #if archive:
@@ -639,7 +773,8 @@ def forceRescan(ComicID,archive=None):
 
             if haveissue == "yes":
                 issStatus = "Downloaded"
-                newValueDict = {"Location":           isslocation,
+                newValueDict = {"IssueID":            iss_id,
+                                "Location":           isslocation,
                                 "ComicSize":          issSize,
                                 "Status":             issStatus
                                 }
@@ -647,11 +782,15 @@ def forceRescan(ComicID,archive=None):
                 issID_to_ignore.append(str(iss_id))
 
                 if 'annual' in temploc.lower():
-                    myDB.upsert("annuals", newValueDict, controlValueDict)
+                    found_ann.append(newValueDict)
                 else:
-                    myDB.upsert("issues", newValueDict, controlValueDict)
+                    found_iss.append(newValueDict)
         fn+=1
 
+    #write all the located issues in one go.
+    myDB.bulk_upsert("issues", found_iss, ["IssueID"])
+    myDB.bulk_upsert("annuals", found_ann, ["IssueID"])
+
     logger.fdebug('IssueID to ignore: ' + str(issID_to_ignore))
 
     #here we need to change the status of the ones we DIDN'T FIND above since the loop only hits on FOUND issues.
@@ -689,13 +828,8 @@ def forceRescan(ComicID,archive=None):
                                "Status":  issStatus})
     
     if len(update_iss) > 0:
-        i = 0
         #do it like this to avoid DB locks...
-        for ui in update_iss:
-            controlValueDict = {"IssueID": ui['IssueID']}
-            newStatusValue = {"Status": ui['Status']}
-            myDB.upsert("issues", newStatusValue, controlValueDict)
-            i+=1
+        i = myDB.bulk_upsert("issues", update_iss, ["IssueID"])
         logger.info('Updated the status of ' + str(i) + ' issues for ' + rescan['ComicName'] + ' (' + str(rescan['ComicYear']) + ') that were not found.')
 
     logger.info('Total files located: ' + str(havefiles))
@@ -725,6 +859,7 @@ def forceRescan(ComicID,archive=None):
         pass
     else:
         archivedissues = 0 #set this to 0 so it tallies correctly.
+        archived = []
         for down in downissues:
             #print "downlocation:" + str(down['Location'])
             #remove special characters from 
@@ -734,9 +869,8 @@ def forceRescan(ComicID,archive=None):
             #print ("downlocation: " + str(down['Location']))
             if down['Location'] is None:
                 logger.fdebug('location does not exist which means file was not downloaded successfully, or was moved.')
-                controlValue = {"IssueID":  down['IssueID']}
-                newValue = {"Status":    "Archived"}
-                myDB.upsert("issues", newValue, controlValue)
+                archived.append({"IssueID":  down['IssueID'],
+                                 "Status":   "Archived"})
                 archivedissues+=1
                 pass
             else:
@@ -746,10 +880,10 @@ def forceRescan(ComicID,archive=None):
                     #print "Issue exists - no need to change status."
                 else:
                     #print "Changing status from Downloaded to Archived - cannot locate file"
-                    controlValue = {"IssueID":   down['IssueID']}
-                    newValue = {"Status":    "Archived"}
-                    myDB.upsert("issues", newValue, controlValue)
+                    archived.append({"IssueID":  down['IssueID'],
+                                     "Status":   "Archived"})
                     archivedissues+=1 
+        myDB.bulk_upsert("issues", archived, ["IssueID"])
         totalarc = arcfiles + archivedissues
         havefiles = havefiles + archivedissues  #arcfiles already tallied in havefiles in above segment
         logger.fdebug('I have changed the status of ' + str(archivedissues) + ' issues to a status of Archived, as I now cannot locate them in the series directory.')
@@ -33,7 +33,7 @@ import shutil
 
 import mylar
 
-from mylar import logger, db, importer, mb, search, filechecker, helpers, updater, parseit, weeklypull, PostProcessor, version, librarysync, moveit #,rsscheck
+from mylar import logger, db, importer, mb, search, filechecker, helpers, updater, parseit, weeklypull, PostProcessor, version, librarysync, moveit, nameindex #,rsscheck
 #from mylar.helpers import checked, radio, today
 
 import lib.simplejson as simplejson
@@ -408,6 +408,7 @@ class WebInterface(object):
         myDB.action('DELETE from comics WHERE ComicID=?', [ComicID])
         myDB.action('DELETE from issues WHERE ComicID=?', [ComicID])
         myDB.action('DELETE from upcoming WHERE ComicID=?', [ComicID])
+        nameindex.remove(ComicID)
         helpers.ComicSort(sequence='update')
         raise cherrypy.HTTPRedirect("home")
     deleteArtist.exposed = True
@@ -433,7 +434,7 @@ class WebInterface(object):
                 if CV_EXcomicid['variloop'] == '99':
                     mismatch = "yes"
             if ComicID[:1] == "G": threading.Thread(target=importer.GCDimport, args=[ComicID]).start()
-            else: threading.Thread(target=importer.addComictoDB, args=[ComicID,mismatch]).start()    
+            else: threading.Thread(target=importer.addComictoDB, args=[ComicID,mismatch], kwargs={'fresh': True}).start()
         else:
             if mylar.CV_ONETIMER == 1:
                 logger.fdebug("CV_OneTimer option enabled...")
@@ -447,7 +448,7 @@ class WebInterface(object):
                 myDB.select('DELETE FROM issues WHERE ComicID=?', [ComicID])
                 myDB.select('DELETE FROM annuals WHERE ComicID=?', [ComicID])
                 logger.fdebug("Refreshing the series and pulling in new data using only CV.")
-                mylar.importer.addComictoDB(ComicID,mismatch)
+                mylar.importer.addComictoDB(ComicID,mismatch,fresh=True)
                 issues_new = myDB.select('SELECT * FROM issues WHERE ComicID=?', [ComicID])            
                 annuals = []
                 ann_list = []
@@ -475,7 +476,7 @@ class WebInterface(object):
                             break
                 logger.info("In the process of converting the data to CV, I changed the status of " + str(icount) + " issues.")
             else:
-                mylar.importer.addComictoDB(ComicID,mismatch)
+                mylar.importer.addComictoDB(ComicID,mismatch,fresh=True)
 
         raise cherrypy.HTTPRedirect("comicDetails?ComicID=%s" % ComicID)
     refreshArtist.exposed=True  
@@ -903,6 +904,7 @@ class WebInterface(object):
             if action == 'delete':
                 myDB.action('DELETE from comics WHERE ComicID=?', [ComicID])
                 myDB.action('DELETE from issues WHERE ComicID=?', [ComicID])
+                nameindex.remove(ComicID)
             elif action == 'pause':
                 controlValueDict = {'ComicID': ComicID}
                 newValueDict = {'Status': 'Paused'}
@@ -1475,24 +1477,7 @@ class WebInterface(object):
                 #threading.Thread(target=self.searchit).start()
                 #threadthis = threadit.ThreadUrl()
                 #result = threadthis.main(soma)
-                myDB = db.DBConnection()
-                sl = 0
-                print ("number of records: " + str(noids))
-                while (sl < int(noids)):
-                    soma_sl = soma['comic_info'][sl]
-                    print ("soma_sl: " + str(soma_sl))
-                    print ("comicname: " + soma_sl['comicname'].encode('utf-8'))
-                    print ("filename: " + soma_sl['comfilename'].encode('utf-8'))
-                    controlValue = {"impID":    soma_sl['impid']}
-                    newValue = {"ComicYear":        soma_sl['comicyear'],
-                                "Status":           "Not Imported",
-                                "ComicName":        soma_sl['comicname'].encode('utf-8'),
-                                "ComicFilename":    soma_sl['comfilename'].encode('utf-8'),
-                                "ComicLocation":    soma_sl['comlocation'].encode('utf-8'),
-                                "ImportDate":       helpers.today(),
-                                "WatchMatch":       soma_sl['watchmatch']}      
-                    myDB.upsert("importresults", newValue, controlValue)
-                    sl+=1
+                librarysync.storeImports(soma)
                 # because we could be adding volumes/series that span years, we need to account for this
                 # add the year to the db under the term, valid-years
                 # add the issue to the db under the term, min-issue
@@ -1531,6 +1516,8 @@ class WebInterface(object):
     def deleteimport(self, ComicName):
         myDB = db.DBConnection()
         logger.info("Removing import data for Comic: " + ComicName)
+        #forget the files were scanned too, so the next library scan picks them back up.
+        myDB.action('DELETE from librarymanifest WHERE ComicLocation IN (SELECT ComicLocation FROM importresults WHERE ComicName=?)', [ComicName])
         myDB.action('DELETE from importresults WHERE ComicName=?', [ComicName])
         raise cherrypy.HTTPRedirect("importResults")
     deleteimport.exposed = True
@@ -1954,6 +1941,8 @@ class WebInterface(object):
             filechecker.validateAndCreateDirectory(com_location, True)
 
         myDB.upsert("comics", newValues, controlValueDict)
+        #the alternate names may have changed.
+        nameindex.update(ComicID)
         raise cherrypy.HTTPRedirect("comicDetails?ComicID=%s" % ComicID)
     comic_config.exposed = True
 
@@ -28,7 +28,7 @@ import re
 import datetime
 
 import mylar 
-from mylar import db, updater, helpers, logger
+from mylar import db, updater, helpers, logger, nameindex
 
 def pullit(forcecheck=None):
     myDB = db.DBConnection()
@@ -346,232 +346,136 @@ def pullit(forcecheck=None):
     os.remove( str(pullpath) + "newreleases.txt" )
     pullitcheck(forcecheck=forcecheck)
 
+ANNUAL = re.compile("\\bannual\\b")
+
+def pullkey(name):
+    #the pull-list key for a name - normalized the same as the watchlist index, then with the spaces
+    #taken out too so SPIDERMAN and SPIDER-MAN come out the same. A + is spelt out first (thnx to A+X
+    #for this...) - the pull-list has it as A PLUS X.
+    if name is None:
+        return ''
+    return nameindex.normalize(name.replace('+', ' plus ')).replace(' ', '')
+
+def pullkeys(ComicName, AlternateSearch=None):
+    #the pull-list keys a series goes by - its own name, then the alternates.
+    keys = []
+    for name in [ComicName] + nameindex.alternates(AlternateSearch):
+        key = pullkey(name)
+        if key and key not in keys:
+            keys.append(key)
+    return keys
+
+def pullskip(week):
+    #trades / hardcovers / reprints / combo packs aren't what's being watched for.
+    if 'TP' in week['PUBLISHER']:
+        return True
+    for nono in ('TP', 'NA', 'HC'):
+        if nono in week['ISSUE']:
+            return True
+    for nothere in ('PTG', 'COMBO PACK'):
+        if nothere in (week['EXTRA'] or ''):
+            return True
+    return False
+
+def pullindex(myDB):
+    #this week's pull-list as pull-list key -> [(weekly row, annual)] - an annual goes in under the
+    #series name with the word annual taken out.
+    pulllist = {}
+    for week in myDB.select('SELECT PUBLISHER, ISSUE, COMIC, EXTRA, SHIPDATE FROM weekly'):
+        if week['COMIC'] is None or pullskip(week):
+            continue
+        pulllist.setdefault(pullkey(week['COMIC']), []).append((week, False))
+        if ANNUAL.search(week['COMIC'].lower()):
+            pulllist.setdefault(pullkey(ANNUAL.sub('', week['COMIC'].lower())), []).append((week, True))
+    return pulllist
+
 def pullitcheck(comic1off_name=None,comic1off_id=None,forcecheck=None):
     logger.info(u"Checking the Weekly Releases list for comics I'm watching...")
     myDB = db.DBConnection()
 
-    not_t = ['TP',
-             'NA',
-             'HC',
-             'PI']
-
-    not_c = ['PTG',
-             'COMBO PACK',
-             '(PP #']
-
-    lines = []
-    unlines = []
-    llen = []
-    ccname = []
-    pubdate = []
-    w = 0
-    tot = 0
-    chkout = []
-    watchfnd = []
-    watchfndiss = []
-    watchfndextra = []
-
-    #print ("----------WATCHLIST--------")
-    a_list = []
-    b_list = []
-    comicid = []
-
-    mylardb = os.path.join(mylar.DATA_DIR, "mylar.db")
-
-    con = sqlite3.connect(str(mylardb))
-
-    with con:
-
-        cur = con.cursor()
-        # if it's a one-off check (during an add series), load the comicname here and ignore below.
-        if comic1off_name:
-            logger.fdebug("this is a one-off" + comic1off_name)
-            lines.append(comic1off_name.strip())
-            unlines.append(comic1off_name.strip())
-            comicid.append(comic1off_id)
-            w = 1            
-        else:
-            #let's read in the comic.watchlist from the db here
-            cur.execute("SELECT ComicID, ComicName, ComicYear, ComicPublisher, ComicPublished, LatestDate, ForceContinuing from comics")
-            while True:
-                watchd = cur.fetchone()
-                #print ("watchd: " + str(watchd))
-                if watchd is None:
-                    break
-                if 'Present' in watchd[4] or (helpers.now()[:4] in watchd[4]) or watchd[6] == 1:
-                 # this gets buggered up when series are named the same, and one ends in the current
-                 # year, and the new series starts in the same year - ie. Avengers
-                 # lets' grab the latest issue date and see how far it is from current
-                 # anything > 45 days we'll assume it's a false match ;)
-                    logger.fdebug("ComicName: " + watchd[1])
-                    latestdate = watchd[5]
-                    logger.fdebug("latestdate:  " + str(latestdate))
-                    if latestdate[8:] == '':
-                        logger.fdebug("invalid date " + str(latestdate) + " appending 01 for day for continuation.")
-                        latest_day = '01'
-                    else:
-                        latest_day = latestdate[8:]
-                    c_date = datetime.date(int(latestdate[:4]),int(latestdate[5:7]),int(latest_day))
-                    n_date = datetime.date.today()
-                    logger.fdebug("c_date : " + str(c_date) + " ... n_date : " + str(n_date))
-                    recentchk = (n_date - c_date).days
-                    logger.fdebug("recentchk: " + str(recentchk) + " days")
-                    chklimit = helpers.checkthepub(watchd[0])
-                    logger.fdebug("Check date limit set to : " + str(chklimit))
-                    logger.fdebug(" ----- ")
-                    if recentchk < int(chklimit) or watchd[6] == 1:
-                        if watchd[6] == 1:
-                            logger.fdebug('Forcing Continuing Series enabled for series...')
-                        # let's not even bother with comics that are in the Present.
-                        a_list.append(watchd[1])
-                        b_list.append(watchd[2])
-                        comicid.append(watchd[0])
-                        pubdate.append(watchd[4])
-                        #print ( "Comic:" + str(a_list[w]) + " Year: " + str(b_list[w]) )
-                        #if "WOLVERINE AND THE X-MEN" in str(a_list[w]): a_list[w] = "WOLVERINE AND X-MEN"
-                        lines.append(a_list[w].strip())
-                        unlines.append(a_list[w].strip())
-                        llen.append(a_list[w].splitlines())
-                        ccname.append(a_list[w].strip())
-                        tmpwords = a_list[w].split(None)
-                        ltmpwords = len(tmpwords)
-                        ltmp = 1
-                        w+=1
-                    else:
-                        logger.fdebug("Determined to not be a Continuing series at this time.")    
-        cnt = int(w-1)
-        cntback = int(w-1)
-        kp = []
-        ki = []
-        kc = []
-        otot = 0
-
-        logger.fdebug("You are watching for: " + str(w) + " comics")
-        #print ("----------THIS WEEK'S PUBLISHED COMICS------------")
-        if w > 0:
-            while (cnt > -1):
-                lines[cnt] = lines[cnt].upper()
-                #llen[cnt] = str(llen[cnt])
-                logger.fdebug("looking for : " + lines[cnt])
-                sqlsearch = re.sub('[\_\#\,\/\:\;\.\-\!\$\%\'\?\@]', ' ', lines[cnt])
-                sqlsearch = re.sub("\&", '%', sqlsearch)
-                sqlsearch = re.sub("\\bAND\\b", '%', sqlsearch)
-                sqlsearch = re.sub("\\bTHE\\b", '', sqlsearch)
-                if '+' in sqlsearch: sqlsearch = re.sub('\+', '%PLUS%', sqlsearch)
-                sqlsearch = re.sub(r'\s', '%', sqlsearch)
-                sqlsearch = sqlsearch + '%'
-                logger.fdebug("searchsql: " + sqlsearch)
-                weekly = myDB.select('SELECT PUBLISHER, ISSUE, COMIC, EXTRA, SHIPDATE FROM weekly WHERE COMIC LIKE (?)', [sqlsearch])
-                #cur.execute('SELECT PUBLISHER, ISSUE, COMIC, EXTRA, SHIPDATE FROM weekly WHERE COMIC LIKE (?)', [lines[cnt]])
-                for week in weekly:
-                    if week == None:
-                        break
-                    for nono in not_t:
-                        if nono in week['PUBLISHER']:
-                            #logger.fdebug("nono present")
-                            break
-                        if nono in week['ISSUE']:
-                            #logger.fdebug("graphic novel/tradeback detected..ignoring.")
-                            break
-                        for nothere in not_c:
-                            if nothere in week['EXTRA']:
-                                #logger.fdebug("nothere present")
-                                break
-                            else:
-                                comicnm = week['COMIC']
-                                #here's the tricky part, ie. BATMAN will match on
-                                #every batman comic, not exact
-                                logger.fdebug("comparing" + comicnm + "..to.." + unlines[cnt].upper())
-
-                                #-NEW-
-                                # strip out all special characters and compare
-                                watchcomic = re.sub('[\_\#\,\/\:\;\.\-\!\$\%\'\?\@]', '', unlines[cnt])
-                                comicnm = re.sub('[\_\#\,\/\:\;\.\-\!\$\%\'\?\@]', '', comicnm)
-                                if "THE" in watchcomic.upper() or "THE" in comicnm.upper():
-                                    modwatchcomic = re.sub("\\bTHE\\b", "", watchcomic.upper())
-                                    modcomicnm = re.sub("\\bTHE\\b", "", comicnm)
-                                else:
-                                    modwatchcomic = watchcomic
-                                    modcomicnm = comicnm
-                                if '&' in watchcomic.upper():
-                                    modwatchcomic = re.sub('\&', 'AND', modwatchcomic.upper())
-                                    modcomicnm = re.sub('\&', 'AND', modcomicnm)
-                                if '&' in comicnm:
-                                    modwatchcom = re.sub('\&', 'AND', modwatchcomic.upper())
-                                    modcomicnm = re.sub('\&', 'AND', modcomicnm)
-                                #thnx to A+X for this...
-                                if '+' in watchcomic:
-                                    logger.fdebug("+ detected...adjusting.")
-                                    #logger.fdebug("comicnm:" + comicnm)
-                                    #logger.fdebug("watchcomic:" + watchcomic)
-                                    modwatchcomic = re.sub('\+', 'PLUS', modwatchcomic)
-                                    #logger.fdebug("modcomicnm:" + modcomicnm)
-                                    #logger.fdebug("modwatchcomic:" + modwatchcomic)
-
-                                #annuals!
-                                if 'ANNUAL' in comicnm.upper(): 
-                                    modcomicnm = re.sub("\\bANNUAL\\b", "", modcomicnm.upper())
-
-                                watchcomic = re.sub(r'\s', '', watchcomic)
-                                comicnm = re.sub(r'\s', '', comicnm)
-                                modwatchcomic = re.sub(r'\s', '', modwatchcomic)
-                                modcomicnm = re.sub(r'\s', '', modcomicnm)
-                                logger.fdebug("watchcomic : " + str(watchcomic) + " / mod :" + str(modwatchcomic))
-                                logger.fdebug("comicnm : " + str(comicnm) + " / mod :" + str(modcomicnm))
-                                if comicnm == watchcomic.upper() or modcomicnm == modwatchcomic.upper():
-                                    logger.fdebug("matched on:" + comicnm + "..." + watchcomic.upper())
-                                    pass
-#                                elif ("ANNUAL" in week['EXTRA']):
-#                                    pass
-#                                    print ( row[3] + " matched on ANNUAL")
-                                else:
-                                    break
-                                if ("NA" not in week['ISSUE']) and ("HC" not in week['ISSUE']):
-                                    if ("COMBO PACK" not in week['EXTRA']) and ("2ND PTG" not in week['EXTRA']) and ("3RD PTG" not in week['EXTRA']):
-                                        otot+=1
-                                        dontadd = "no"
-                                        if dontadd == "no":
-                                            #print (row[0], row[1], row[2])
-                                            tot+=1
-                                            #kp.append(row[0])
-                                            #ki.append(row[1])
-                                            #kc.append(comicnm)
-                                            if "ANNUAL" in comicnm.upper():
-                                                watchfndextra.append("annual")
-                                                ComicName = str(unlines[cnt]) + " Annual"
-                                            else:
-                                                ComicName = str(unlines[cnt])
-                                                watchfndextra.append("none")
-                                            watchfnd.append(comicnm)
-                                            watchfndiss.append(week['ISSUE'])
-                                            ComicID = comicid[cnt]
-                                            if not mylar.CV_ONLY:
-                                                ComicIssue = str(watchfndiss[tot -1] + ".00")
-                                            else:
-                                                ComicIssue = str(watchfndiss[tot -1])
-                                            ComicDate = str(week['SHIPDATE'])
-                                            #ComicName = str(unlines[cnt])
-                                            logger.fdebug("Watchlist hit for : " + ComicName + " ISSUE: " + str(watchfndiss[tot -1]))
-                                            # here we add to comics.latest
-                                            updater.latest_update(ComicID=ComicID, LatestIssue=ComicIssue, LatestDate=ComicDate)
-                                            # here we add to upcoming table...
-                                            statusupdate = updater.upcoming_update(ComicID=ComicID, ComicName=ComicName, IssueNumber=ComicIssue, IssueDate=ComicDate, forcecheck=forcecheck)
-                                            # here we update status of weekly table...
-                                            if statusupdate is not None:
-                                                cstatus = statusupdate['Status']
-                                                cstatusid = statusupdate['ComicID']
-                                            else:
-                                                cstatus = None
-                                                cstatusid = None
-                                            updater.weekly_update(ComicName=week['COMIC'], IssueNumber=ComicIssue, CStatus=cstatus, CID=cstatusid)
-                                            break
-                                        break
-                        break
-                cnt-=1
-        #print ("-------------------------")
-        logger.fdebug("There are " + str(otot) + " comics this week to get!")
-        #print ("However I've already grabbed " + str(btotal) )
-        #print ("I need to get " + str(tot) + " comic(s)!" )
-        logger.info(u"Finished checking for comics on my watchlist.")
-    #con.close()
+    # (ComicID, ComicName, the pull-list keys it goes by)
+    watchlist = []
+
+    # if it's a one-off check (during an add series), load the comicname here and ignore below.
+    if comic1off_name:
+        logger.fdebug("this is a one-off" + comic1off_name)
+        comic = nameindex.info(comic1off_id)
+        AlternateSearch = None
+        if comic is not None:
+            AlternateSearch = comic['AlternateSearch']
+        watchlist.append((comic1off_id, comic1off_name.strip(), pullkeys(comic1off_name.strip(), AlternateSearch)))
+    else:
+        #let's read in the comic.watchlist from the db here
+        for watchd in myDB.select("SELECT ComicID, ComicName, ComicYear, ComicPublisher, ComicPublished, LatestDate, ForceContinuing, AlternateSearch from comics"):
+            if 'Present' in watchd['ComicPublished'] or (helpers.now()[:4] in watchd['ComicPublished']) or watchd['ForceContinuing'] == 1:
+             # this gets buggered up when series are named the same, and one ends in the current
+             # year, and the new series starts in the same year - ie. Avengers
+             # lets' grab the latest issue date and see how far it is from current
+             # anything > 45 days we'll assume it's a false match ;)
+                logger.fdebug("ComicName: " + watchd['ComicName'])
+                latestdate = watchd['LatestDate']
+                logger.fdebug("latestdate:  " + str(latestdate))
+                if latestdate[8:] == '':
+                    logger.fdebug("invalid date " + str(latestdate) + " appending 01 for day for continuation.")
+                    latest_day = '01'
+                else:
+                    latest_day = latestdate[8:]
+                c_date = datetime.date(int(latestdate[:4]),int(latestdate[5:7]),int(latest_day))
+                n_date = datetime.date.today()
+                recentchk = (n_date - c_date).days
+                chklimit = helpers.checkthepub(watchd['ComicID'])
+                logger.fdebug("recentchk: " + str(recentchk) + " days / Check date limit set to : " + str(chklimit))
+                if recentchk < int(chklimit) or watchd['ForceContinuing'] == 1:
+                    if watchd['ForceContinuing'] == 1:
+                        logger.fdebug('Forcing Continuing Series enabled for series...')
+                    # let's not even bother with comics that are in the Present.
+                    watchlist.append((watchd['ComicID'], watchd['ComicName'].strip(), pullkeys(watchd['ComicName'].strip(), watchd['AlternateSearch'])))
+                else:
+                    logger.fdebug("Determined to not be a Continuing series at this time.")
+
+    logger.fdebug("You are watching for: " + str(len(watchlist)) + " comics")
+
+    #the pull-list gets normalized the once, then each series (and its alternate names) is looked up in it.
+    pulllist = pullindex(myDB)
+    hits = []
+    for ComicID, watchcomic, keys in watchlist:
+        found = set()
+        for key in keys:
+            for week, annual in pulllist.get(key, []):
+                if (week['COMIC'], week['ISSUE'], annual) in found:
+                    continue
+                found.add((week['COMIC'], week['ISSUE'], annual))
+                logger.fdebug("matched on:" + week['COMIC'] + "..." + watchcomic.upper())
+                if annual:
+                    ComicName = str(watchcomic) + " Annual"
+                else:
+                    ComicName = str(watchcomic)
+                if not mylar.CV_ONLY:
+                    ComicIssue = str(week['ISSUE'] + ".00")
+                else:
+                    ComicIssue = str(week['ISSUE'])
+                logger.fdebug("Watchlist hit for : " + ComicName + " ISSUE: " + str(week['ISSUE']))
+                hits.append({"ComicID":     ComicID,
+                             "ComicName":   ComicName,
+                             "ComicIssue":  ComicIssue,
+                             "ComicDate":   str(week['SHIPDATE']),
+                             "COMIC":       week['COMIC']})
+
+    # here we add to comics.latest
+    with myDB.transaction():
+        for hit in hits:
+            updater.latest_update(ComicID=hit['ComicID'], LatestIssue=hit['ComicIssue'], LatestDate=hit['ComicDate'])
+    # here we add to upcoming table... (not in a transaction - it can refresh the series from CV)
+    for hit in hits:
+        statusupdate = updater.upcoming_update(ComicID=hit['ComicID'], ComicName=hit['ComicName'], IssueNumber=hit['ComicIssue'], IssueDate=hit['ComicDate'], forcecheck=forcecheck)
+        if statusupdate is not None:
+            hit['CStatus'] = statusupdate['Status']
+            hit['CID'] = statusupdate['ComicID']
+    # here we update status of weekly table...
+    with myDB.transaction():
+        for hit in hits:
+            updater.weekly_update(ComicName=hit['COMIC'], IssueNumber=hit['ComicIssue'], CStatus=hit.get('CStatus'), CID=hit.get('CID'))
+
+    logger.fdebug("There are " + str(len(hits)) + " comics this week to get!")
+    logger.info(u"Finished checking for comics on my watchlist.")
     return